@@ -1,5 +1,7 @@
-from django.contrib import admin
-from .models import Autor, Editorial, Cliente, Libro, Venta, DetalleVenta, Carrito, Evento, Blog
+from django.contrib import admin, messages
+from django.utils import timezone
+from . import resumenes, servicios
+from .models import Autor, Editorial, Cliente, Libro, Venta, DetalleVenta, Carrito, Reserva, Evento, Blog, Tarea
 
 @admin.register(Autor)
 class AutorAdmin(admin.ModelAdmin):
@@ -32,11 +34,33 @@ class LibroAdmin(admin.ModelAdmin):
 
 @admin.register(Venta)
 class VentaAdmin(admin.ModelAdmin):
-    list_display = ['ventaid', 'clienteid', 'fechaventa', 'montototal', 'metodopago', 'estadoventa']
+    list_display = ['ventaid', 'clienteid', 'fechaventa', 'num_items', 'montototal', 'metodopago', 'estadoventa']
     list_filter = ['estadoventa', 'metodopago', 'fechaventa']
     search_fields = ['clienteid__username', 'ventaid']
-    readonly_fields = ['fechaventa', 'montototal', 'cambio']
+    readonly_fields = ['fechaventa', 'num_lineas', 'num_items', 'subtotal_lineas', 'montototal', 'cambio']
     ordering = ['-fechaventa']
+    actions = ['cancelar_ventas']
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            super().save_model(request, obj, form, change)
+            resumenes.sumar([obj.ventaid])
+            return
+        with resumenes.actualizando([obj.ventaid]):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        resumenes.quitar([obj.ventaid])
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        resumenes.quitar(list(queryset.values_list('ventaid', flat=True)))
+        super().delete_queryset(request, queryset)
+
+    @admin.action(description='Cancelar ventas seleccionadas y restaurar stock')
+    def cancelar_ventas(self, request, queryset):
+        canceladas = servicios.cancelar_ventas(list(queryset.values_list('ventaid', flat=True)))
+        self.message_user(request, f'{len(canceladas)} venta(s) cancelada(s)', messages.SUCCESS)
 
 @admin.register(DetalleVenta)
 class DetalleVentaAdmin(admin.ModelAdmin):
@@ -45,6 +69,24 @@ class DetalleVentaAdmin(admin.ModelAdmin):
     search_fields = ['libroid__titulo', 'ventaid__ventaid']
     readonly_fields = ['subtotal']
 
+    # Las vistas del admin ya corren en una transacción
+    def save_model(self, request, obj, form, change):
+        venta_ids = {form.initial.get('ventaid'), obj.ventaid_id} - {None}
+        with resumenes.actualizando(venta_ids):
+            super().save_model(request, obj, form, change)
+            servicios.recalcular_totales(venta_ids)
+
+    def delete_model(self, request, obj):
+        with resumenes.actualizando([obj.ventaid_id]):
+            super().delete_model(request, obj)
+            servicios.recalcular_totales([obj.ventaid_id])
+
+    def delete_queryset(self, request, queryset):
+        venta_ids = set(queryset.values_list('ventaid', flat=True))
+        with resumenes.actualizando(venta_ids):
+            super().delete_queryset(request, queryset)
+            servicios.recalcular_totales(venta_ids)
+
 @admin.register(Carrito)
 class CarritoAdmin(admin.ModelAdmin):
     list_display = ['carritoid', 'usuario', 'libro', 'cantidad', 'fechaagregado']
@@ -52,6 +94,13 @@ class CarritoAdmin(admin.ModelAdmin):
     search_fields = ['usuario__username', 'libro__titulo']
     readonly_fields = ['fechaagregado']
 
+@admin.register(Reserva)
+class ReservaAdmin(admin.ModelAdmin):
+    list_display = ['reservaid', 'usuario', 'libro', 'cantidad', 'expira']
+    list_filter = ['expira']
+    search_fields = ['usuario__username', 'libro__titulo']
+    list_select_related = ['usuario', 'libro']
+
 @admin.register(Evento)
 class EventoAdmin(admin.ModelAdmin):
     list_display = ['eventoid', 'titulo', 'fecha', 'ubicacion', 'activo']
@@ -62,4 +111,17 @@ class EventoAdmin(admin.ModelAdmin):
 class BlogAdmin(admin.ModelAdmin):
     list_display = ['blogid', 'titulo', 'autor', 'fechapublicacion', 'activo']
     list_filter = ['fechapublicacion', 'activo']
-    search_fields = ['titulo', 'contenido']
\ No newline at end of file
+    search_fields = ['titulo', 'contenido']
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ['tareaid', 'nombre', 'estado', 'intentos', 'creada', 'ejecutar_despues', 'terminada']
+    list_filter = ['estado', 'nombre']
+    readonly_fields = ['creada', 'iniciada', 'terminada', 'resultado', 'error']
+    actions = ['reintentar']
+
+    @admin.action(description='Reintentar las tareas seleccionadas')
+    def reintentar(self, request, queryset):
+        total = queryset.exclude(estado='EN_CURSO').update(
+            estado='PENDIENTE', intentos=0, ejecutar_despues=timezone.now()
+        )
+        self.message_user(request, f'{total} tareas devueltas a la cola', messages.SUCCESS)
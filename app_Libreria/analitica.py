@@ -0,0 +1,226 @@
+# app_Libreria/analitica.py
+"""
+Analítica de ventas para la API del panel (ver views.analitica_ventas).
+
+Las columnas se leen con values_list().iterator() en bloques de
+TAMANIO_BLOQUE filas y se pasan a arreglos de NumPy, así que la memoria es
+la de los arreglos y no la de millones de objetos. Las métricas se calculan
+con operaciones sobre los arreglos (bincount, cumsum, argsort), sin ciclos
+por fila en Python:
+
+- mas_vendidos: títulos con más unidades del periodo.
+- ingresos_diarios: serie diaria con medias móviles de 7 y 28 días.
+- crecimiento_semanal: ingresos por semana (lunes a domingo) y su
+  variación contra la semana anterior.
+- canasta: distribución de unidades por venta y ticket promedio.
+- abc: clasificación ABC del catálogo por ingresos (A hasta el 80 %, B
+  hasta el 95 %, C el resto y los títulos sin ventas).
+
+Todo se lee de los resúmenes diarios (resumenes.py), salvo la canasta, que
+necesita cada venta y usa Venta.num_items. NumPy es una dependencia
+opcional: sin ella disponible() es False y la API responde 503.
+"""
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Libro, ResumenDiaLibro, ResumenDiaMetodo, Venta
+from .resumenes import inicio_del_dia
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depende del entorno
+    np = None
+
+TAMANIO_BLOQUE = 5000
+CLAVE_CACHE = 'libreria:analitica:{}:{}:{}:{}'
+LIMITE = 10
+MAX_LIMITE = 1000
+VENTANAS = (7, 28)
+TOPE_CANASTA = 10  # las ventas de 10 o más unidades van en la misma barra
+UMBRALES_ABC = (('A', 0.80), ('B', 0.95))
+
+
+def disponible():
+    return np is not None
+
+
+def ttl():
+    return getattr(settings, 'LIBRERIA_ANALITICA_TTL', 300)
+
+
+def _leer(consulta, campos, tipos):
+    """Un arreglo por campo de `consulta`, leída en bloques."""
+    filas = consulta.values_list(*campos).iterator(chunk_size=TAMANIO_BLOQUE)
+    bloques = []
+    while lote := list(islice(filas, TAMANIO_BLOQUE)):
+        bloques.append([np.array(columna, dtype=tipo) for columna, tipo in zip(zip(*lote), tipos)])
+    if not bloques:
+        return [np.empty(0, dtype=tipo) for tipo in tipos]
+    return [np.concatenate(columnas) for columnas in zip(*bloques)]
+
+
+def _dinero(valores):
+    return np.round(valores, 2).tolist()
+
+
+def _por_libro(desde, hasta):
+    """(libroid, unidades, ingresos) del periodo, un elemento por título vendido."""
+    libros, unidades, ingresos = _leer(
+        ResumenDiaLibro.objects.filter(fecha__gte=desde, fecha__lte=hasta),
+        ('libro_id', 'unidades', 'ingresos'), (np.int64, np.int64, np.float64),
+    )
+    ids, posicion = np.unique(libros, return_inverse=True)
+    return (
+        ids,
+        np.bincount(posicion, weights=unidades, minlength=len(ids)).astype(np.int64),
+        np.bincount(posicion, weights=ingresos, minlength=len(ids)),
+    )
+
+
+def _serie_diaria(desde, hasta):
+    """Ventas e ingresos de cada día de [desde, hasta], con ceros en los días sin ventas."""
+    fechas, ventas, ingresos = _leer(
+        ResumenDiaMetodo.objects.filter(fecha__gte=desde, fecha__lte=hasta),
+        ('fecha', 'ventas', 'ingresos'), ('datetime64[D]', np.int64, np.float64),
+    )
+    dias = (hasta - desde).days + 1
+    posicion = (fechas - np.datetime64(desde, 'D')).astype(np.int64)
+    return (
+        np.arange(np.datetime64(desde, 'D'), np.datetime64(hasta, 'D') + 1),
+        np.bincount(posicion, weights=ventas, minlength=dias).astype(np.int64),
+        np.bincount(posicion, weights=ingresos, minlength=dias),
+    )
+
+
+def _media_movil(valores, ventana):
+    """Media de los últimos `ventana` valores; None mientras la ventana no está completa."""
+    acumulado = np.concatenate(([0.0], np.cumsum(valores)))
+    medias = (acumulado[ventana:] - acumulado[:-ventana]) / ventana
+    return [None] * min(ventana - 1, len(valores)) + _dinero(medias)
+
+
+# =============================================
+# MÉTRICAS
+# =============================================
+
+def mas_vendidos(desde, hasta, limite=LIMITE):
+    ids, unidades, ingresos = _por_libro(desde, hasta)
+    # Más unidades primero; a igualdad, más ingresos
+    orden = np.lexsort((-ingresos, -unidades))[:limite]
+    titulos = Libro.objects.only('titulo').in_bulk(ids[orden].tolist())
+    return {'libros': [
+        {'libro_id': libro_id, 'titulo': titulos[libro_id].titulo if libro_id in titulos else None,
+         'unidades': cantidad, 'ingresos': monto}
+        for libro_id, cantidad, monto in zip(
+            ids[orden].tolist(), unidades[orden].tolist(), _dinero(ingresos[orden])
+        )
+    ]}
+
+
+def ingresos_diarios(desde, hasta, limite=None):
+    dias, ventas, ingresos = _serie_diaria(desde, hasta)
+    medias = {f'media_{ventana}': _media_movil(ingresos, ventana) for ventana in VENTANAS}
+    return {'dias': [
+        {'dia': dia, 'ventas': cantidad, 'ingresos': monto, **{clave: serie[i] for clave, serie in medias.items()}}
+        for i, (dia, cantidad, monto) in enumerate(zip(dias.tolist(), ventas.tolist(), _dinero(ingresos)))
+    ]}
+
+
+def crecimiento_semanal(desde, hasta, limite=None):
+    dias, ventas, ingresos = _serie_diaria(desde, hasta)
+    # El 1970-01-01 de NumPy fue jueves: +3 hace que las semanas empiecen en lunes
+    semana = (dias.astype(np.int64) + 3) // 7
+    semana -= semana[0]
+    por_semana = np.bincount(semana, weights=ingresos)
+    ventas_semana = np.bincount(semana, weights=ventas).astype(np.int64)
+    dias_semana = np.bincount(semana)
+    anterior = np.concatenate(([np.nan], por_semana[:-1]))
+    # Solo entre dos semanas completas: las de los extremos del periodo son parciales
+    comparables = (dias_semana == 7) & np.concatenate(([False], dias_semana[:-1] == 7)) & (anterior > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variacion = np.where(comparables, (por_semana - anterior) / anterior * 100, np.nan)
+    inicios = dias[np.concatenate(([0], np.cumsum(dias_semana)[:-1]))]
+    return {'semanas': [
+        {
+            'inicio': inicio, 'dias': n, 'completa': n == 7, 'ventas': cantidad, 'ingresos': monto,
+            # Sin semana anterior comparable o con ingresos en cero no hay porcentaje
+            'variacion': None if np.isnan(cambio) else round(float(cambio), 2),
+        }
+        for inicio, n, cantidad, monto, cambio in zip(
+            inicios.tolist(), dias_semana.tolist(), ventas_semana.tolist(), _dinero(por_semana), variacion,
+        )
+    ]}
+
+
+def canasta(desde, hasta, limite=None):
+    unidades, montos = _leer(
+        Venta.objects.filter(
+            estadoventa='COMPLETADA',
+            fechaventa__gte=inicio_del_dia(desde), fechaventa__lt=inicio_del_dia(hasta + timedelta(days=1)),
+        ),
+        ('num_items', 'montototal'), (np.int64, np.float64),
+    )
+    conteos = np.bincount(np.minimum(unidades, TOPE_CANASTA), minlength=TOPE_CANASTA + 1)[1:]
+    etiquetas = [str(n) for n in range(1, TOPE_CANASTA)] + [f'{TOPE_CANASTA}+']
+    datos = {
+        'ventas': int(len(unidades)),
+        'distribucion': [{'unidades': etiqueta, 'ventas': n} for etiqueta, n in zip(etiquetas, conteos.tolist())],
+    }
+    if len(unidades):
+        p50, p90 = np.percentile(unidades, (50, 90)).tolist()
+        datos.update({
+            'unidades_promedio': round(float(unidades.mean()), 2), 'unidades_p50': p50, 'unidades_p90': p90,
+            'ticket_promedio': round(float(montos.mean()), 2),
+        })
+    return datos
+
+
+def abc(desde, hasta, limite=LIMITE):
+    ids, _, ingresos = _por_libro(desde, hasta)
+    orden = np.argsort(-ingresos, kind='stable')
+    ids, ingresos = ids[orden], ingresos[orden]
+    total = ingresos.sum()
+    # La participación acumulada antes de cada título: el que cruza el 80 % es A
+    previa = (np.cumsum(ingresos) - ingresos) / total if total > 0 else np.ones(len(ingresos))
+    clases = np.full(len(ids), 'C')
+    for clase, umbral in reversed(UMBRALES_ABC):
+        clases[previa < umbral] = clase
+    clases[ingresos <= 0] = 'C'
+
+    sin_ventas = Libro.objects.count() - len(ids)
+    resumen = {}
+    for clase in ('A', 'B', 'C'):
+        elegidos = clases == clase
+        resumen[clase] = {
+            'libros': int(elegidos.sum()) + (sin_ventas if clase == 'C' else 0),
+            'ingresos': round(float(ingresos[elegidos].sum()), 2),
+            'participacion': round(float(ingresos[elegidos].sum() / total * 100), 2) if total > 0 else 0.0,
+        }
+    return {
+        'resumen': resumen,
+        'sin_ventas': sin_ventas,
+        'libros': [
+            {'libro_id': libro_id, 'clase': clase, 'ingresos': monto}
+            for libro_id, clase, monto in zip(ids[:limite].tolist(), clases[:limite].tolist(), _dinero(ingresos[:limite]))
+        ],
+    }
+
+
+METRICAS = {
+    'mas-vendidos': mas_vendidos,
+    'ingresos-diarios': ingresos_diarios,
+    'crecimiento-semanal': crecimiento_semanal,
+    'canasta': canasta,
+    'abc': abc,
+}
+
+
+def calcular(metrica, desde, hasta, limite=LIMITE):
+    """Resultado de `metrica` para [desde, hasta], desde la caché si está vigente."""
+    clave = CLAVE_CACHE.format(metrica, desde.isoformat(), hasta.isoformat(), limite)
+    return cache.get_or_set(
+        clave, lambda: {'desde': desde, 'hasta': hasta, **METRICAS[metrica](desde, hasta, limite=limite)}, ttl()
+    )
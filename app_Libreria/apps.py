@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AppLibreriaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_Libreria'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import basedatos, signals  # noqa: F401
+        connection_created.connect(basedatos.configurar, dispatch_uid='libreria_sqlite_pragmas')
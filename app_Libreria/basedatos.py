@@ -0,0 +1,88 @@
+# app_Libreria/basedatos.py
+"""
+Ajustes de SQLite para producción.
+
+Con la configuración por omisión, SQLite escribe con diario de reversión
+(rollback journal): mientras una escritura confirma, nadie puede leer, y dos
+transacciones que leen y luego escriben se bloquean entre sí ("database is
+locked"). configurar() se conecta a connection_created (ver apps.py) y en
+cada conexión nueva aplica los PRAGMA de LIBRERIA_SQLITE_PRAGMAS:
+
+- journal_mode=WAL: los lectores no esperan a los escritores ni al revés.
+- synchronous=NORMAL: con WAL no arriesga la integridad, solo las últimas
+  transacciones ante un corte de luz, y evita un fsync por commit.
+- busy_timeout: cuánto espera una escritura a que se libere la base antes
+  de fallar.
+- mmap_size y cache_size: lecturas desde memoria en lugar de read().
+
+Las conexiones se reutilizan entre peticiones (CONN_MAX_AGE, verificadas
+con CONN_HEALTH_CHECKS), así que los PRAGMA se pagan una vez por conexión.
+estado() es la comprobación que usa la vista de salud.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+logger = logging.getLogger(__name__)
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,           # ms
+    'mmap_size': 256 * 1024 * 1024,  # bytes
+    'cache_size': -64000,           # negativo: KiB (64 MB por conexión)
+    'temp_store': 'MEMORY',
+}
+# No aplican a una base en memoria (las pruebas)
+SOLO_EN_ARCHIVO = ('journal_mode', 'mmap_size')
+
+
+def pragmas():
+    """PRAGMA a aplicar: los de PRAGMAS con los cambios de LIBRERIA_SQLITE_PRAGMAS (None quita uno)."""
+    ajustes = {**PRAGMAS, **getattr(settings, 'LIBRERIA_SQLITE_PRAGMAS', {})}
+    return {nombre: valor for nombre, valor in ajustes.items() if valor is not None}
+
+
+def aplicar(cursor, ajustes):
+    for nombre, valor in ajustes.items():
+        cursor.execute(f'PRAGMA {nombre} = {valor}')
+
+
+def configurar(sender, connection, **kwargs):
+    """Receptor de connection_created."""
+    if connection.vendor != 'sqlite':
+        return
+    ajustes = pragmas()
+    if connection.is_in_memory_db():
+        ajustes = {nombre: valor for nombre, valor in ajustes.items() if nombre not in SOLO_EN_ARCHIVO}
+    with connection.cursor() as cursor:
+        aplicar(cursor, ajustes)
+        if 'journal_mode' in ajustes:
+            cursor.execute('PRAGMA journal_mode')
+            modo = cursor.fetchone()[0]
+            if modo.lower() != str(ajustes['journal_mode']).lower():
+                # P. ej. la base está en un sistema de archivos de red
+                logger.warning('SQLite no aceptó journal_mode=%s (sigue en %s)', ajustes['journal_mode'], modo)
+
+
+def estado():
+    """
+    Comprueba que la base responde. Devuelve {'ok', 'ms'} y, en SQLite, el
+    modo de diario en uso; nunca lanza excepciones.
+    """
+    inicio = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            datos = {'ok': True}
+            if connection.vendor == 'sqlite':
+                cursor.execute('PRAGMA journal_mode')
+                datos['journal_mode'] = cursor.fetchone()[0]
+    except DatabaseError as e:
+        logger.error('La base de datos no responde: %s', e)
+        datos = {'ok': False}
+    datos['ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+    return datos
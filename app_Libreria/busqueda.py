@@ -0,0 +1,189 @@
+# app_Libreria/busqueda.py
+"""
+Búsqueda de texto completo sobre libros con una tabla virtual FTS5 de SQLite.
+
+La tabla guarda una copia de título, autor, editorial, ISBN y descripción
+con rowid = libroid. Se mantiene sincronizada con las señales de Libro,
+Autor y Editorial; las escrituras masivas (bulk_create, update) deben
+llamar a indexar_libros o reconstruir_indice.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q, Value
+from django.db.models.functions import Concat
+
+from .models import Libro
+
+TABLA = 'app_Libreria_libro_fts'
+LIMITE = 100
+# Pesos de bm25 por columna: título, autor, editorial, isbn, descripción
+PESOS = (10.0, 5.0, 2.0, 1.0, 0.5)
+
+SQL_CREAR = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA} USING fts5("
+    "titulo, autor, editorial, isbn, descripcion, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+SQL_ELIMINAR = f'DROP TABLE IF EXISTS {TABLA}'
+
+_ISBN = re.compile(r'^(97[89])?[\d-]{9,14}[\dXx]$')
+_PALABRA = re.compile(r'\w+', re.UNICODE)
+
+
+def disponible():
+    return connection.vendor == 'sqlite'
+
+
+def _filas(libros):
+    return libros.values_list(
+        'libroid', 'titulo',
+        Concat('autorid__nombre', Value(' '), 'autorid__apellido'),
+        'editorialid__nombre', 'isbn', 'descripcion',
+    ).order_by()
+
+
+def _insertar(cursor, libros):
+    # INSERT ... SELECT: las filas se copian dentro de SQLite sin pasar por Python
+    sql, params = _filas(libros).query.sql_with_params()
+    cursor.execute(
+        f'INSERT INTO {TABLA} (rowid, titulo, autor, editorial, isbn, descripcion) {sql}',
+        params,
+    )
+
+
+def indexar_libros(libroids):
+    """Inserta o reemplaza en el índice los libros indicados."""
+    libroids = list(libroids)
+    if not disponible() or not libroids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLA} WHERE rowid = %s', [(i,) for i in libroids])
+        _insertar(cursor, Libro.objects.filter(libroid__in=libroids))
+
+
+def eliminar_libros(libroids):
+    if not disponible():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLA} WHERE rowid = %s', [(i,) for i in libroids])
+
+
+def reconstruir_indice():
+    """Vacía el índice y lo vuelve a llenar con todo el catálogo."""
+    if not disponible():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLA}')
+        _insertar(cursor, Libro.objects.all())
+
+
+def es_isbn(texto):
+    return bool(_ISBN.match(texto.replace(' ', '')))
+
+
+def consulta_fts(texto):
+    """Convierte el texto del usuario en una consulta FTS5 segura con prefijos."""
+    palabras = _PALABRA.findall(texto)
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+
+def _coincidencias(texto, libros):
+    """
+    Cómo resolver `texto` dentro de `libros`: ('orm', queryset) para un ISBN
+    exacto o una base sin FTS, ('fts', consulta) o None si no hay qué buscar.
+    """
+    texto = (texto or '').strip()
+    if not texto:
+        return None
+
+    # Un ISBN exacto se resuelve con el índice único de Libro sin pasar por FTS
+    if es_isbn(texto):
+        isbn = texto.replace(' ', '')
+        exactos = libros.filter(Q(isbn=isbn) | Q(isbn=isbn.replace('-', '')))
+        if exactos.exists():
+            return 'orm', exactos
+
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return None
+    if not disponible():
+        return 'orm', libros.filter(
+            Q(titulo__icontains=texto) | Q(autorid__nombre__icontains=texto)
+            | Q(autorid__apellido__icontains=texto) | Q(isbn__icontains=texto)
+        )
+    return 'fts', consulta
+
+
+def _desde_fts(libros, campos):
+    """
+    FROM y WHERE de una búsqueda FTS limitada a `libros`: el queryset (con
+    sus filtros) va como subconsulta unida por rowid = libroid, así que los
+    filtros se aplican antes de ordenar y paginar.
+    """
+    sql, params = libros.values_list(*campos).order_by().query.sql_with_params()
+    return (
+        f'FROM {TABLA} JOIN ({sql}) AS libros ON libros.libroid = {TABLA}.rowid WHERE {TABLA} MATCH %s',
+        list(params),
+    )
+
+
+def buscar_ids(texto, limite=LIMITE, queryset=None, inicio=0, orden=()):
+    """
+    Devuelve los libroid de `queryset` (todo el catálogo si se omite) que
+    coinciden con `texto`, a partir de la posición `inicio`.
+
+    Sin `orden` van del más al menos relevante; si no, `orden` son campos de
+    Libro como en order_by ('-precioventa', '-libroid').
+    """
+    libros = Libro.objects.all() if queryset is None else queryset
+    coincidencia = _coincidencias(texto, libros)
+    if coincidencia is None:
+        return []
+    tipo, valor = coincidencia
+    if tipo == 'orm':
+        return list(
+            valor.order_by(*(orden or ['libroid'])).values_list('libroid', flat=True)[inicio:inicio + limite]
+        )
+
+    nombre = connection.ops.quote_name
+    campos = list(dict.fromkeys(['libroid', *(campo.lstrip('-') for campo in orden)]))
+    desde, params = _desde_fts(libros, campos)
+    if orden:
+        criterio = ', '.join(
+            f"libros.{nombre(Libro._meta.get_field(campo.lstrip('-')).column)} "
+            f"{'DESC' if campo.startswith('-') else 'ASC'}"
+            for campo in orden
+        )
+    else:
+        pesos = ', '.join(str(peso) for peso in PESOS)
+        criterio = f'bm25({TABLA}, {pesos}), {TABLA}.rowid'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT {TABLA}.rowid {desde} ORDER BY {criterio} LIMIT %s OFFSET %s',
+            [*params, valor, limite, inicio],
+        )
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def contar(texto, queryset=None):
+    """Cuántos libros de `queryset` coinciden con `texto`."""
+    libros = Libro.objects.all() if queryset is None else queryset
+    coincidencia = _coincidencias(texto, libros)
+    if coincidencia is None:
+        return 0
+    tipo, valor = coincidencia
+    if tipo == 'orm':
+        return valor.count()
+    desde, params = _desde_fts(libros, ['libroid'])
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) {desde}', [*params, valor])
+        return cursor.fetchone()[0]
+
+
+def buscar(texto, queryset=None, limite=LIMITE, inicio=0, orden=()):
+    """Libros de `queryset` que coinciden con `texto`, en el orden de buscar_ids."""
+    libros = Libro.objects.all() if queryset is None else queryset
+    ids = buscar_ids(texto, limite, libros, inicio, orden)
+    encontrados = libros.in_bulk(ids)
+    return [encontrados[libroid] for libroid in ids if libroid in encontrados]
@@ -0,0 +1,316 @@
+# app_Libreria/carrito.py
+"""
+Carrito de compras con dos almacenes intercambiables:
+
+- CarritoBD: la tabla Carrito, para los clientes con sesión iniciada.
+- CarritoCookie: una cookie firmada {libroid: cantidad} para los visitantes
+  anónimos; agregar o quitar libros no escribe nada en la base.
+
+Ambos exponen la misma interfaz (cantidad, poner, quitar, renovar, resumen,
+items_y_resumen, guardar) y se obtienen con de_request(). Al iniciar
+sesión, fusionar() pasa el carrito de la cookie a la base en una sola
+operación masiva.
+
+Los renglones de CarritoBD apartan stock con una Reserva (ver reservas.py);
+los de la cookie solo se validan contra las unidades disponibles.
+
+El resumen (líneas, unidades, total y subtotal por libro) se calcula con
+una sola consulta y se guarda en caché; las escrituras que no pasan por
+estas clases (bulk_create, scripts) deben llamar a invalidar() o esperar a
+que expire LIBRERIA_CARRITO_TTL.
+"""
+import hashlib
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from . import reservas
+from .models import Carrito, Libro
+
+CLAVE_CACHE = 'libreria:carrito:{}'
+CLAVE_CACHE_ANONIMO = 'libreria:carrito:anonimo:{}'
+
+COOKIE = 'carrito'
+SAL_COOKIE = 'app_Libreria.carrito'
+DIAS_COOKIE = 30
+# Una cookie no debe pasar de ~4 KB
+MAX_LINEAS_ANONIMO = 50
+
+CENTAVO = Decimal('0.01')
+
+
+class CarritoLleno(Exception):
+    pass
+
+
+def _ttl():
+    return getattr(settings, 'LIBRERIA_CARRITO_TTL', 300)
+
+
+def _resumir(lineas):
+    """lineas: (libroid, cantidad, subtotal) de cada renglón del carrito."""
+    subtotales = {}
+    unidades = 0
+    for libro_id, cantidad, subtotal in lineas:
+        # SQLite devuelve el producto sin escala fija (500 en lugar de 500.00)
+        subtotales[libro_id] = Decimal(subtotal).quantize(CENTAVO)
+        unidades += cantidad
+    return {
+        'lineas': len(subtotales),
+        'unidades': unidades,
+        'total': sum(subtotales.values(), Decimal('0.00')),
+        'subtotales': subtotales,
+    }
+
+
+# =============================================
+# CARRITO EN LA BASE (CLIENTES)
+# =============================================
+
+class CarritoBD:
+    def __init__(self, usuario):
+        self.usuario = usuario
+
+    def _filas(self):
+        return Carrito.objects.filter(usuario=self.usuario)
+
+    def cantidad(self, libro_id):
+        return self._filas().filter(libro_id=libro_id).values_list('cantidad', flat=True).first() or 0
+
+    def poner(self, libro, cantidad):
+        """Fija y reserva la cantidad de un libro; 0 o menos lo quita."""
+        if cantidad <= 0:
+            return self.quitar(libro.libroid)
+        with transaction.atomic():
+            reservas.reservar(self.usuario, libro, cantidad)
+            if not self._filas().filter(libro=libro).update(cantidad=cantidad):
+                try:
+                    with transaction.atomic():
+                        Carrito.objects.create(usuario=self.usuario, libro=libro, cantidad=cantidad)
+                except IntegrityError:
+                    # Otra pestaña lo agregó al mismo tiempo (carrito_usuario_libro_uniq)
+                    self._filas().filter(libro=libro).update(cantidad=cantidad)
+        self.invalidar()
+        return True
+
+    def quitar(self, libro_id):
+        with transaction.atomic():
+            borrados, _ = self._filas().filter(libro_id=libro_id).delete()
+            reservas.liberar(self.usuario, libro_id)
+        self.invalidar()
+        return bool(borrados)
+
+    def renovar(self):
+        reservas.renovar(self.usuario)
+
+    def resumen(self):
+        def calcular():
+            return _resumir(
+                Carrito.objects.de_usuario(self.usuario).con_subtotal()
+                .values_list('libro_id', 'cantidad', 'subtotal_linea')
+            )
+
+        return cache.get_or_set(CLAVE_CACHE.format(self.usuario.pk), calcular, _ttl())
+
+    def items_y_resumen(self):
+        """Renglones con su libro y subtotal para ver_carrito; de paso renueva la caché."""
+        items = list(Carrito.objects.de_usuario(self.usuario).con_libro().con_subtotal())
+        datos = _resumir((item.libro_id, item.cantidad, item.subtotal_linea) for item in items)
+        cache.set(CLAVE_CACHE.format(self.usuario.pk), datos, _ttl())
+        return items, datos
+
+    def invalidar(self):
+        cache.delete(CLAVE_CACHE.format(self.usuario.pk))
+
+    def guardar(self, respuesta):
+        pass
+
+
+# =============================================
+# CARRITO EN COOKIE (VISITANTES)
+# =============================================
+
+class CarritoCookie:
+    def __init__(self, request):
+        self.lineas = self._leer(request)
+        self.modificado = False
+
+    @staticmethod
+    def _leer(request):
+        try:
+            datos = json.loads(request.get_signed_cookie(
+                COOKIE, salt=SAL_COOKIE, max_age=DIAS_COOKIE * 86400
+            ))
+            lineas = {int(libro_id): int(cantidad) for libro_id, cantidad in datos.items()}
+        except (KeyError, signing.BadSignature, ValueError, TypeError, AttributeError):
+            return {}
+        return {libro_id: cantidad for libro_id, cantidad in lineas.items() if cantidad > 0}
+
+    def cantidad(self, libro_id):
+        return self.lineas.get(libro_id, 0)
+
+    def poner(self, libro, cantidad):
+        if cantidad <= 0:
+            return self.quitar(libro.libroid)
+        if libro.libroid not in self.lineas and len(self.lineas) >= MAX_LINEAS_ANONIMO:
+            raise CarritoLleno(
+                f'El carrito admite hasta {MAX_LINEAS_ANONIMO} títulos; inicia sesión para agregar más'
+            )
+        reservas.verificar(libro, cantidad)
+        self.lineas[libro.libroid] = cantidad
+        self.modificado = True
+        return True
+
+    def quitar(self, libro_id):
+        if self.lineas.pop(libro_id, None) is None:
+            return False
+        self.modificado = True
+        return True
+
+    def renovar(self):
+        pass
+
+    def vaciar(self):
+        self.modificado = self.modificado or bool(self.lineas)
+        self.lineas = {}
+
+    def resumen(self):
+        if not self.lineas:
+            return _resumir([])
+        # El mismo contenido da la misma clave: los visitantes comparten caché
+        contenido = json.dumps(sorted(self.lineas.items())).encode()
+        clave = CLAVE_CACHE_ANONIMO.format(hashlib.sha1(contenido).hexdigest())
+
+        def calcular():
+            precios = dict(Libro.objects.filter(libroid__in=self.lineas).values_list('libroid', 'precioventa'))
+            return _resumir(
+                (libro_id, cantidad, precios[libro_id] * cantidad)
+                for libro_id, cantidad in self.lineas.items() if libro_id in precios
+            )
+
+        return cache.get_or_set(clave, calcular, _ttl())
+
+    def items_y_resumen(self):
+        libros = Libro.objects.con_autor().in_bulk(list(self.lineas))
+        items = []
+        for libro_id, cantidad in self.lineas.items():
+            if libro_id not in libros:
+                continue
+            # Renglón sin guardar: las plantillas lo usan igual que uno de la base
+            item = Carrito(libro=libros[libro_id], cantidad=cantidad)
+            item.subtotal_linea = libros[libro_id].precioventa * cantidad
+            items.append(item)
+        if len(items) != len(self.lineas):
+            # Se borraron libros del catálogo
+            self.lineas = {item.libro_id: item.cantidad for item in items}
+            self.modificado = True
+        return items, _resumir((item.libro_id, item.cantidad, item.subtotal_linea) for item in items)
+
+    def guardar(self, respuesta):
+        """Escribe la cookie en la respuesta si el carrito cambió."""
+        if not self.modificado:
+            return
+        if self.lineas:
+            respuesta.set_signed_cookie(
+                COOKIE, json.dumps(self.lineas, separators=(',', ':')), salt=SAL_COOKIE,
+                max_age=DIAS_COOKIE * 86400, httponly=True, samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        else:
+            respuesta.delete_cookie(COOKIE, samesite='Lax')
+        self.modificado = False
+
+
+# =============================================
+# ACCESO DESDE LAS VISTAS
+# =============================================
+
+def agregar(cesta, libro, cantidad=1):
+    """
+    Suma unidades de un libro sin pasar de las disponibles (stock menos
+    reservas de otros). Devuelve la nueva cantidad.
+    """
+    nueva = cesta.cantidad(libro.libroid) + cantidad
+    cesta.poner(libro, nueva)
+    return nueva
+
+
+def fijar(cesta, libro, cantidad):
+    """Fija la cantidad de un libro (0 lo quita) sin pasar de las disponibles."""
+    cesta.poner(libro, cantidad)
+    return max(cantidad, 0)
+
+
+def a_json(resumen, libro_id=None):
+    """Resumen (y el renglón de `libro_id`, si se pide) listo para JsonResponse."""
+    datos = {
+        'resumen': {
+            'lineas': resumen['lineas'],
+            'unidades': resumen['unidades'],
+            'total': str(resumen['total']),
+        },
+    }
+    if libro_id is not None:
+        subtotal = resumen['subtotales'].get(libro_id)
+        datos['linea'] = None if subtotal is None else {'libro_id': libro_id, 'subtotal': str(subtotal)}
+    return datos
+
+
+def de_request(request):
+    """El carrito de la petición; se crea una vez y se reutiliza en las plantillas."""
+    if not hasattr(request, '_carrito'):
+        if request.user.is_authenticated:
+            request._carrito = CarritoBD(request.user)
+        else:
+            request._carrito = CarritoCookie(request)
+    return request._carrito
+
+
+def invalidar(usuario):
+    CarritoBD(usuario).invalidar()
+
+
+@transaction.atomic
+def fusionar(request, usuario):
+    """
+    Pasa el carrito de la cookie al del usuario que acaba de iniciar sesión:
+    suma las cantidades de los libros repetidos (sin pasar de las unidades
+    disponibles) con un bulk_update, agrega los nuevos con un bulk_create y
+    reserva el carrito resultante. Devuelve el carrito de la cookie ya
+    vacío; la vista debe llamar a guardar() para borrarla.
+    """
+    anonimo = CarritoCookie(request)
+    if not anonimo.lineas:
+        return anonimo
+
+    stock = reservas.disponibles(anonimo.lineas, usuario)
+    existentes = {
+        item.libro_id: item
+        for item in Carrito.objects.filter(usuario=usuario, libro_id__in=anonimo.lineas)
+    }
+    nuevos, actualizados = [], []
+    for libro_id, cantidad in anonimo.lineas.items():
+        disponible = stock.get(libro_id, 0)
+        if libro_id in existentes:
+            item = existentes[libro_id]
+            suma = min(item.cantidad + cantidad, disponible)
+            if suma > item.cantidad:
+                item.cantidad = suma
+                actualizados.append(item)
+        elif disponible > 0:
+            nuevos.append(Carrito(usuario=usuario, libro_id=libro_id, cantidad=min(cantidad, disponible)))
+
+    Carrito.objects.bulk_update(actualizados, ['cantidad'])
+    # Si otra pestaña agregó el mismo libro entre la lectura y el alta, se
+    # fija la cantidad en lugar de chocar con carrito_usuario_libro_uniq
+    Carrito.objects.bulk_create(
+        nuevos, update_conflicts=True, unique_fields=['usuario', 'libro'], update_fields=['cantidad'],
+    )
+    reservas.reservar_carrito(usuario)
+    invalidar(usuario)
+    anonimo.vaciar()
+    return anonimo
@@ -0,0 +1,185 @@
+# app_Libreria/catalogo.py
+"""Consultas del catálogo público: filtros, búsqueda, orden y paginación por cursor."""
+import base64
+import binascii
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+from . import busqueda
+from .models import Libro
+
+TAMANIO_PAGINA = 24
+TAMANIO_PAGINA_MAX = 100
+
+# Cada orden se define por (campo, descendente). El libroid se usa siempre
+# como desempate para que el cursor apunte a una posición única.
+ORDENES = {
+    'default': ('libroid', False),
+    'precio_asc': ('precioventa', False),
+    'precio_desc': ('precioventa', True),
+    'titulo_asc': ('titulo', False),
+    'titulo_desc': ('titulo', True),
+}
+
+FILTROS_STOCK = ('con_stock', 'sin_stock', 'todos')
+
+
+def _decimal(valor):
+    if valor is None or not str(valor).strip():
+        return None
+    try:
+        numero = Decimal(str(valor).strip())
+    except InvalidOperation:
+        return None
+    return numero if numero >= 0 else None
+
+
+def leer_filtros(params):
+    """Normaliza los parámetros GET del catálogo; ignora los valores inválidos."""
+    generos = {codigo for codigo, _ in Libro.GENEROS}
+    genero = params.get('genero', '')
+    stock = params.get('stock', 'con_stock')
+    orden = params.get('orden', 'default')
+    try:
+        tamanio = int(params.get('tamanio', TAMANIO_PAGINA))
+    except (TypeError, ValueError):
+        tamanio = TAMANIO_PAGINA
+
+    return {
+        'q': params.get('q', '').strip()[:200],
+        'genero': genero if genero in generos else '',
+        'precio_min': _decimal(params.get('precio_min')),
+        'precio_max': _decimal(params.get('precio_max')),
+        'stock': stock if stock in FILTROS_STOCK else 'con_stock',
+        'orden': orden if orden in ORDENES else 'default',
+        'tamanio': max(1, min(tamanio, TAMANIO_PAGINA_MAX)),
+    }
+
+
+def filtrar_libros(filtros, queryset=None):
+    """Aplica los filtros del catálogo sobre un queryset de Libro."""
+    libros = Libro.objects.all() if queryset is None else queryset
+
+    if filtros['stock'] == 'con_stock':
+        libros = libros.filter(stock__gt=0)
+    elif filtros['stock'] == 'sin_stock':
+        libros = libros.filter(stock__lte=0)
+    if filtros['genero']:
+        libros = libros.filter(genero=filtros['genero'])
+    if filtros['precio_min'] is not None:
+        libros = libros.filter(precioventa__gte=filtros['precio_min'])
+    if filtros['precio_max'] is not None:
+        libros = libros.filter(precioventa__lte=filtros['precio_max'])
+    return libros
+
+
+def _codificar(valor, posicion):
+    datos = json.dumps([str(valor), posicion]).encode()
+    return base64.urlsafe_b64encode(datos).decode().rstrip('=')
+
+
+def codificar_cursor(libro, orden):
+    campo, _ = ORDENES[orden]
+    return _codificar(getattr(libro, campo), libro.libroid)
+
+
+def decodificar_cursor(cursor):
+    """Devuelve (valor, libroid) o None si el cursor no es válido."""
+    if not cursor:
+        return None
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valor, libroid = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        return str(valor), int(libroid)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def _despues_del_cursor(libros, orden, cursor):
+    campo, descendente = ORDENES[orden]
+    comparador = 'lt' if descendente else 'gt'
+    valor, libroid = cursor
+
+    if campo == 'libroid':
+        return libros.filter(**{f'libroid__{comparador}': libroid})
+    if campo == 'precioventa':
+        valor = _decimal(valor)
+        if valor is None:
+            return libros
+
+    return libros.filter(
+        Q(**{f'{campo}__{comparador}': valor})
+        | Q(**{campo: valor, f'libroid__{comparador}': libroid})
+    )
+
+
+def _campos_orden(orden):
+    campo, descendente = ORDENES[orden]
+    prefijo = '-' if descendente else ''
+    if campo == 'libroid':
+        return (f'{prefijo}libroid',)
+    return (f'{prefijo}{campo}', f'{prefijo}libroid')
+
+
+def ordenar_libros(libros, orden):
+    return libros.order_by(*_campos_orden(orden))
+
+
+def _pagina_busqueda(filtros, cursor, queryset):
+    # La relevancia (bm25) no sirve como clave de un cursor keyset, así que
+    # las búsquedas de texto se paginan por posición. Los filtros van dentro
+    # de la consulta FTS: la página y el total ya son de los libros filtrados.
+    libros = filtrar_libros(filtros, queryset)
+    orden = () if filtros['orden'] == 'default' else _campos_orden(filtros['orden'])
+    posicion = decodificar_cursor(cursor)
+    inicio = posicion[1] if posicion and posicion[0] == 'busqueda' and posicion[1] > 0 else 0
+    tamanio = filtros['tamanio']
+
+    pagina = busqueda.buscar(filtros['q'], libros, limite=tamanio + 1, inicio=inicio, orden=orden)
+    return {
+        'libros': pagina[:tamanio],
+        'siguiente': _codificar('busqueda', inicio + tamanio) if len(pagina) > tamanio else None,
+        'total': busqueda.contar(filtros['q'], libros),
+    }
+
+
+def obtener_pagina(filtros, cursor=None, queryset=None):
+    """
+    Devuelve una página del catálogo usando paginación por cursor (keyset).
+
+    El resultado es un diccionario con los libros de la página, el cursor
+    de la siguiente (None si ya no hay más resultados) y, en las búsquedas
+    de texto, el total de coincidencias; si no, total es None y la vista
+    lo cuenta aparte.
+    """
+    if filtros['q']:
+        return _pagina_busqueda(filtros, cursor, queryset)
+
+    libros = ordenar_libros(filtrar_libros(filtros, queryset), filtros['orden'])
+    posicion = decodificar_cursor(cursor)
+    if posicion is not None:
+        libros = _despues_del_cursor(libros, filtros['orden'], posicion)
+
+    tamanio = filtros['tamanio']
+    pagina = list(libros[:tamanio + 1])
+    siguiente = None
+    if len(pagina) > tamanio:
+        pagina = pagina[:tamanio]
+        siguiente = codificar_cursor(pagina[-1], filtros['orden'])
+
+    return {'libros': pagina, 'siguiente': siguiente, 'total': None}
+
+
+def serializar_libro(libro):
+    """Representación JSON de un libro del catálogo (requiere autorid cargado)."""
+    return {
+        'libroid': libro.libroid,
+        'titulo': libro.titulo,
+        'autor': str(libro.autorid),
+        'genero': libro.genero,
+        'precioventa': str(libro.precioventa),
+        'stock': libro.stock,
+        'portada': libro.portada.url if libro.portada else None,
+    }
@@ -0,0 +1,15 @@
+# app_Libreria/context_processors.py
+from django.utils.functional import SimpleLazyObject
+
+from . import carrito
+
+
+def carrito_resumen(request):
+    """
+    Expone `carrito_resumen` a las plantillas de clientes y visitantes. Es
+    perezoso: solo se lee la caché (o la base) si la plantilla lo usa.
+    """
+    usuario = getattr(request, 'user', None)
+    if usuario is None or usuario.is_staff:
+        return {}
+    return {'carrito_resumen': SimpleLazyObject(lambda: carrito.de_request(request).resumen())}
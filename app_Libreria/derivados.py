@@ -0,0 +1,203 @@
+# app_Libreria/derivados.py
+"""
+Imágenes derivadas (miniaturas WebP y JPEG) de portadas, eventos y blog.
+
+Cada preset recorta la imagen al tamaño en que se muestra y genera la
+versión 1x y 2x en ambos formatos. Los archivos se guardan en
+MEDIA_ROOT/derivados/ con el hash del contenido del original en el nombre,
+así que nunca cambian y se pueden cachear indefinidamente. Se generan en
+segundo plano al subir la imagen (ver signals.py y tareas.py). Si una
+plantilla pide derivados que no están listos (imágenes anteriores, caché
+vacía), muestra el original y se encola su generación: ninguna petición
+web abre ni redimensiona imágenes.
+"""
+import hashlib
+import io
+import posixpath
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Tamaño (ancho, alto) en píxeles CSS en que se muestra cada imagen
+PRESETS = {
+    'tarjeta': (300, 250),    # tarjetas del catálogo e inicio
+    'miniatura': (64, 80),    # carrito y listados del panel
+    'banner': (560, 200),     # eventos y blog
+}
+DENSIDADES = (1, 2)
+FORMATOS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+CARPETA = 'derivados'
+
+# Originales: se quitan metadatos (EXIF, GPS, perfiles) y se limita el tamaño
+LADO_MAXIMO_ORIGINAL = 1600
+CALIDAD_ORIGINAL = 85
+
+_CLAVE_HASH = 'imagenes:hash:{}'
+_CLAVE_LISTO = 'imagenes:listo:{}:{}'
+_CLAVE_PEDIDO = 'imagenes:pedido:{}'
+# Segundos antes de volver a encolar una imagen cuyos derivados siguen sin
+# aparecer (worker detenido, imagen inválida)
+ESPERA_PEDIDO = 3600
+
+
+class ImagenInvalida(ValueError):
+    pass
+
+
+def _abrir(contenido):
+    """Devuelve (imagen ya rotada según su EXIF, formato original)."""
+    try:
+        imagen = Image.open(contenido)
+        imagen.load()
+    except (UnidentifiedImageError, OSError) as e:
+        raise ImagenInvalida(f'No es una imagen válida: {e}')
+    # Aplica la rotación de la cámara antes de descartar el EXIF
+    return ImageOps.exif_transpose(imagen), imagen.format
+
+
+def _sin_transparencia(imagen):
+    if imagen.mode in ('RGBA', 'LA', 'P'):
+        imagen = imagen.convert('RGBA')
+        fondo = Image.new('RGB', imagen.size, (255, 255, 255))
+        fondo.paste(imagen, mask=imagen.getchannel('A'))
+        return fondo
+    return imagen.convert('RGB')
+
+
+# =============================================
+# ORIGINALES
+# =============================================
+
+def limpiar_original(archivo):
+    """
+    Devuelve (ContentFile, extensión) con la imagen recomprimida y sin
+    metadatos. JPEG se guarda como JPEG; PNG y demás formatos, como PNG.
+    """
+    archivo.seek(0)
+    imagen, formato = _abrir(archivo)
+    formato = 'JPEG' if formato == 'JPEG' else 'PNG'
+    imagen.thumbnail((LADO_MAXIMO_ORIGINAL, LADO_MAXIMO_ORIGINAL), Image.LANCZOS)
+
+    salida = io.BytesIO()
+    if formato == 'JPEG':
+        _sin_transparencia(imagen).save(salida, 'JPEG', quality=CALIDAD_ORIGINAL,
+                                        optimize=True, progressive=True)
+    else:
+        # Guardar sin pasar info= descarta los chunks de texto y EXIF
+        if imagen.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+            imagen = imagen.convert('RGBA')
+        imagen.save(salida, 'PNG', optimize=True)
+    return ContentFile(salida.getvalue()), 'jpg' if formato == 'JPEG' else 'png'
+
+
+# =============================================
+# DERIVADOS
+# =============================================
+
+def hash_de(campo):
+    """Hash del contenido del archivo, cacheado por nombre (los nombres no se reutilizan)."""
+    def calcular():
+        digest = hashlib.sha256()
+        with campo.storage.open(campo.name, 'rb') as archivo:
+            for bloque in iter(lambda: archivo.read(64 * 1024), b''):
+                digest.update(bloque)
+        return digest.hexdigest()[:20]
+
+    return cache.get_or_set(_CLAVE_HASH.format(campo.name), calcular, None)
+
+
+def ruta(hash_contenido, ancho, alto, extension):
+    return posixpath.join(CARPETA, hash_contenido[:2], f'{hash_contenido}-{ancho}x{alto}.{extension}')
+
+
+def tamanios(preset):
+    ancho, alto = PRESETS[preset]
+    return [(densidad, ancho * densidad, alto * densidad) for densidad in DENSIDADES]
+
+
+def generar(campo, preset):
+    """Genera (si faltan) los derivados de un preset. Devuelve el hash del original."""
+    hash_contenido = hash_de(campo)
+    if cache.get(_CLAVE_LISTO.format(hash_contenido, preset)):
+        return hash_contenido
+
+    pendientes = [
+        (ancho, alto, extension)
+        for _, ancho, alto in tamanios(preset)
+        for extension in FORMATOS
+        if not default_storage.exists(ruta(hash_contenido, ancho, alto, extension))
+    ]
+    if pendientes:
+        with campo.storage.open(campo.name, 'rb') as archivo:
+            imagen = _sin_transparencia(_abrir(archivo)[0])
+        for ancho, alto, extension in pendientes:
+            recorte = ImageOps.fit(imagen, (ancho, alto), Image.LANCZOS)
+            formato, opciones = FORMATOS[extension]
+            salida = io.BytesIO()
+            recorte.save(salida, formato, **opciones)
+            nombre = ruta(hash_contenido, ancho, alto, extension)
+            guardado = default_storage.save(nombre, ContentFile(salida.getvalue()))
+            if guardado != nombre:
+                # Otro proceso lo generó al mismo tiempo
+                default_storage.delete(guardado)
+
+    cache.set(_CLAVE_LISTO.format(hash_contenido, preset), True, None)
+    return hash_contenido
+
+
+def generar_todos(campo):
+    for preset in PRESETS:
+        generar(campo, preset)
+
+
+def listo(campo, preset):
+    """Hash del original si los derivados del preset ya existen, o None; solo consulta la caché."""
+    hash_contenido = cache.get(_CLAVE_HASH.format(campo.name))
+    if hash_contenido and cache.get(_CLAVE_LISTO.format(hash_contenido, preset)):
+        return hash_contenido
+    return None
+
+
+def pedir(campo):
+    """Encola la generación de los derivados, a lo más una vez cada ESPERA_PEDIDO segundos."""
+    instancia = getattr(campo, 'instance', None)
+    if instancia is None or instancia.pk is None:
+        return
+    if cache.add(_CLAVE_PEDIDO.format(campo.name), True, ESPERA_PEDIDO):
+        from . import tareas  # tareas importa este módulo
+
+        tareas.encolar('derivados.generar', instancia._meta.label, instancia.pk, campo.field.name, unica=True)
+
+
+def fuentes(campo, preset):
+    """
+    Datos para <picture>: srcset WebP y JPEG con densidades 1x/2x y la URL
+    del JPEG 1x como src. Devuelve None si los derivados todavía no están
+    listos; en ese caso encola su generación.
+    """
+    if not campo:
+        return None
+    hash_contenido = listo(campo, preset)
+    if hash_contenido is None:
+        pedir(campo)
+        return None
+
+    srcset = {}
+    for extension in FORMATOS:
+        srcset[extension] = ', '.join(
+            f'{default_storage.url(ruta(hash_contenido, ancho, alto, extension))} {densidad}x'
+            for densidad, ancho, alto in tamanios(preset)
+        )
+    ancho, alto = PRESETS[preset]
+    return {
+        'webp': srcset['webp'],
+        'jpg': srcset['jpg'],
+        'src': default_storage.url(ruta(hash_contenido, ancho, alto, 'jpg')),
+        'ancho': ancho,
+        'alto': alto,
+    }
@@ -0,0 +1,82 @@
+# app_Libreria/estadisticas.py
+"""Indicadores del panel de administración calculados con agregados en la base."""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import resumenes
+from .models import Evento, Libro, Venta
+
+CLAVE_CACHE = 'libreria:estadisticas_panel'
+# Marca de que ya hay una reconstrucción encolada (ver signals.py)
+CLAVE_PRECALCULO = 'libreria:estadisticas_panel:precalculo'
+DIAS_GRAFICA = 30
+VENTAS_RECIENTES = 5
+
+
+def _ttl():
+    return getattr(settings, 'LIBRERIA_ESTADISTICAS_TTL', 60)
+
+
+def calcular_estadisticas():
+    """
+    Calcula los indicadores del panel sin recorrer filas en Python. Las
+    gráficas leen los resúmenes diarios (ver resumenes.py); solo las ventas
+    de hoy se cuentan en Venta, porque incluyen las pendientes.
+    """
+    hoy = timezone.localdate()
+    desde = hoy - timedelta(days=DIAS_GRAFICA - 1)
+    # Rangos sobre fechaventa y no fechaventa__date, que en SQLite aplica una
+    # función a la columna y no puede usar venta_fecha_idx
+    ventas = Venta.objects.filter(
+        fechaventa__gte=resumenes.inicio_del_dia(hoy),
+        fechaventa__lt=resumenes.inicio_del_dia(hoy + timedelta(days=1)),
+    ).aggregate(
+        ventas_hoy=Count('ventaid'),
+        ingresos_hoy=Coalesce(Sum('montototal', filter=Q(estadoventa='COMPLETADA')), Decimal('0.00')),
+    )
+    ventas['total_ventas'] = Venta.objects.count()
+
+    return {
+        'total_libros': Libro.objects.count(),
+        'total_usuarios': User.objects.count(),
+        'total_eventos': Evento.objects.count(),
+        **ventas,
+        'ingresos_por_dia': resumenes.por_dia(desde),
+        'ingresos_por_metodo': resumenes.por_metodo(),
+        'ingresos_por_genero': resumenes.por_genero(),
+    }
+
+
+def obtener_estadisticas():
+    """Devuelve los indicadores desde la caché o los recalcula si expiraron."""
+    return cache.get_or_set(CLAVE_CACHE, calcular_estadisticas, _ttl())
+
+
+def ventas_recientes(limite=VENTAS_RECIENTES):
+    return Venta.objects.con_cliente().order_by('-fechaventa')[:limite]
+
+
+def reconstruir():
+    """Recalcula y guarda en la caché; lo ejecuta el worker tras cada venta."""
+    # Se quita la marca antes de calcular: una venta que llegue mientras
+    # tanto vuelve a encolar y no se queda fuera de la caché
+    cache.delete(CLAVE_PRECALCULO)
+    datos = calcular_estadisticas()
+    cache.set(CLAVE_CACHE, datos, _ttl())
+    return datos
+
+
+def invalidar():
+    cache.delete(CLAVE_CACHE)
+
+
+def marcar_precalculo():
+    """True si no había una reconstrucción encolada y ahora queda marcada."""
+    return cache.add(CLAVE_PRECALCULO, True, _ttl())
@@ -0,0 +1,247 @@
+# app_Libreria/exportacion.py
+"""
+Exportación de ventas con sus líneas de detalle para contabilidad.
+
+Las ventas y las líneas se leen con values_list().iterator(), ordenadas por
+ventaid, y se combinan en un solo recorrido (merge join), así que la memoria
+no crece con el número de filas. Cada formato es un generador de bloques de
+texto o bytes, listo para StreamingHttpResponse o para escribir a un archivo.
+Las exportaciones grandes se pueden generar en segundo plano (ver tareas.py)
+con guardar(), que las deja en LIBRERIA_EXPORTACIONES_DIR, fuera de MEDIA_ROOT
+porque no deben ser públicas.
+"""
+import csv
+import io
+import json
+import zipfile
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+from .models import DetalleVenta, Venta
+
+TAMANIO_BLOQUE = 2000
+FILAS_POR_ESCRITURA = 500
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'zip': ('application/zip', 'zip'),
+}
+
+CAMPOS_VENTA = (
+    'ventaid', 'fechaventa', 'clienteid__username', 'metodopago', 'estadoventa',
+    'montototal', 'descuentoaplicado', 'pagorecibido', 'cambio',
+)
+ENCABEZADO_VENTA = (
+    'ventaid', 'fechaventa', 'cliente', 'metodopago', 'estadoventa',
+    'montototal', 'descuentoaplicado', 'pagorecibido', 'cambio',
+)
+CAMPOS_DETALLE = (
+    'ventaid_id', 'detalleventaid', 'libroid__isbn', 'libroid__titulo',
+    'cantidad', 'preciounitario', 'iva', 'subtotal',
+)
+ENCABEZADO_DETALLE = (
+    'ventaid', 'detalleventaid', 'isbn', 'titulo', 'cantidad', 'preciounitario', 'iva', 'subtotal',
+)
+
+
+def rango_fechas(desde=None, hasta=None):
+    """Convierte fechas (inclusive) en límites de fechaventa en la zona horaria actual."""
+    filtros = {}
+    if desde:
+        filtros['fechaventa__gte'] = timezone.make_aware(datetime.combine(desde, time.min))
+    if hasta:
+        filtros['fechaventa__lte'] = timezone.make_aware(datetime.combine(hasta, time.max))
+    return filtros
+
+
+def _filtros(desde, hasta, estado):
+    filtros = rango_fechas(desde, hasta)
+    if estado:
+        filtros['estadoventa'] = estado
+    return filtros
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return str(valor)
+
+
+def ventas(desde=None, hasta=None, estado=None):
+    return (
+        Venta.objects.filter(**_filtros(desde, hasta, estado))
+        .order_by('ventaid')
+        .values_list(*CAMPOS_VENTA)
+        .iterator(chunk_size=TAMANIO_BLOQUE)
+    )
+
+
+def detalles(desde=None, hasta=None, estado=None):
+    filtros = {f'ventaid__{campo}': valor for campo, valor in _filtros(desde, hasta, estado).items()}
+    return (
+        DetalleVenta.objects.filter(**filtros)
+        .order_by('ventaid_id', 'detalleventaid')
+        .values_list(*CAMPOS_DETALLE)
+        .iterator(chunk_size=TAMANIO_BLOQUE)
+    )
+
+
+def ventas_con_detalles(desde=None, hasta=None, estado=None):
+    """Genera (venta, [líneas]) recorriendo ventas y detalles a la vez."""
+    lineas = detalles(desde, hasta, estado)
+    pendiente = next(lineas, None)
+    for venta in ventas(desde, hasta, estado):
+        propias = []
+        while pendiente is not None and pendiente[0] <= venta[0]:
+            if pendiente[0] == venta[0]:
+                propias.append(pendiente)
+            pendiente = next(lineas, None)
+        yield venta, propias
+
+
+# =============================================
+# FORMATOS
+# =============================================
+
+def _bloques_csv(encabezado, filas):
+    """Escribe filas CSV en un búfer y lo entrega cada FILAS_POR_ESCRITURA filas."""
+    bufer = io.StringIO()
+    escritor = csv.writer(bufer)
+    escritor.writerow(encabezado)
+    for numero, fila in enumerate(filas, start=1):
+        escritor.writerow([_texto(valor) for valor in fila])
+        if numero % FILAS_POR_ESCRITURA == 0:
+            yield bufer.getvalue()
+            bufer.seek(0)
+            bufer.truncate()
+    yield bufer.getvalue()
+
+
+def exportar_csv(desde=None, hasta=None, estado=None):
+    """Una fila por línea de detalle, con los datos de la venta repetidos."""
+    vacio = ('',) * (len(ENCABEZADO_DETALLE) - 1)
+
+    def filas():
+        for venta, lineas in ventas_con_detalles(desde, hasta, estado):
+            if not lineas:
+                yield venta + vacio
+            for linea in lineas:
+                yield venta + linea[1:]
+
+    return _bloques_csv(ENCABEZADO_VENTA + ENCABEZADO_DETALLE[1:], filas())
+
+
+def _json(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def exportar_jsonl(desde=None, hasta=None, estado=None):
+    """Un objeto JSON por venta con sus líneas anidadas."""
+    bloque = []
+    for venta, lineas in ventas_con_detalles(desde, hasta, estado):
+        objeto = dict(zip(ENCABEZADO_VENTA, map(_json, venta)))
+        objeto['detalles'] = [
+            dict(zip(ENCABEZADO_DETALLE[1:], map(_json, linea[1:]))) for linea in lineas
+        ]
+        bloque.append(json.dumps(objeto, ensure_ascii=False))
+        if len(bloque) >= FILAS_POR_ESCRITURA:
+            yield '\n'.join(bloque) + '\n'
+            bloque = []
+    if bloque:
+        yield '\n'.join(bloque) + '\n'
+
+
+class _Tubo:
+    """Destino de escritura no posicionable: zipfile escribe aquí y el generador vacía."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def exportar_zip(desde=None, hasta=None, estado=None):
+    """ZIP con ventas.csv y detalles.csv, generado al vuelo."""
+    tubo = _Tubo()
+    with zipfile.ZipFile(tubo, 'w', compression=zipfile.ZIP_DEFLATED) as archivo:
+        for nombre, encabezado, filas in (
+            ('ventas.csv', ENCABEZADO_VENTA, ventas(desde, hasta, estado)),
+            ('detalles.csv', ENCABEZADO_DETALLE, detalles(desde, hasta, estado)),
+        ):
+            with archivo.open(nombre, 'w') as destino:
+                for texto in _bloques_csv(encabezado, filas):
+                    destino.write(texto.encode('utf-8'))
+                    datos = tubo.vaciar()
+                    if datos:
+                        yield datos
+    yield tubo.vaciar()
+
+
+def exportar(formato, desde=None, hasta=None, estado=None):
+    generadores = {'csv': exportar_csv, 'jsonl': exportar_jsonl, 'zip': exportar_zip}
+    return generadores[formato](desde, hasta, estado)
+
+
+def nombre_archivo(formato, desde=None, hasta=None):
+    partes = ['ventas']
+    if desde:
+        partes.append(desde.isoformat())
+    if hasta:
+        partes.append(hasta.isoformat())
+    return f"{'_'.join(partes)}.{FORMATOS[formato][1]}"
+
+
+def almacen():
+    return FileSystemStorage(location=settings.LIBRERIA_EXPORTACIONES_DIR)
+
+
+class _Lector(io.RawIOBase):
+    """Archivo de solo lectura sobre un generador, para escribirlo por bloques."""
+
+    def __init__(self, bloques):
+        self.bloques = (b.encode('utf-8') if isinstance(b, str) else b for b in bloques)
+        self.resto = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        while not self.resto:
+            self.resto = next(self.bloques, None)
+            if self.resto is None:
+                self.resto = b''
+                return 0
+        n = min(len(destino), len(self.resto))
+        destino[:n] = self.resto[:n]
+        self.resto = self.resto[n:]
+        return n
+
+
+def guardar(formato, desde=None, hasta=None, estado=None):
+    """Escribe la exportación en el almacén de exportaciones y devuelve su nombre."""
+    marca = timezone.localtime().strftime('%Y%m%d-%H%M%S')
+    nombre = f'{marca}_{nombre_archivo(formato, desde, hasta)}'
+    lector = io.BufferedReader(_Lector(exportar(formato, desde, hasta, estado)))
+    return almacen().save(nombre, File(lector, name=nombre))
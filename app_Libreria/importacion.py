@@ -0,0 +1,367 @@
+# app_Libreria/importacion.py
+"""
+Importación de catálogos (listas de precios de editoriales) desde CSV,
+JSON o JSON Lines.
+
+El archivo se lee en flujo y se procesa por lotes de LOTE filas, así que la
+memoria no depende del tamaño del archivo. En cada lote se resuelven o crean
+autores y editoriales con pocas consultas y los libros se insertan o
+actualizan por ISBN con bulk_create(update_conflicts=True). Las filas con
+errores se reportan y se omiten sin detener el resto del lote.
+"""
+import csv
+import io
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from . import busqueda, estadisticas, resumenes
+from .models import Autor, Editorial, Libro
+
+LOTE = 2000
+MAX_ERRORES = 500
+FORMATOS = ('csv', 'json', 'jsonl')
+
+# Columnas de Libro que se pueden actualizar; solo se actualizan las que
+# vienen en el archivo, para que una lista de precios con isbn, precioventa
+# y stock no borre títulos ni descripciones.
+CAMPOS_LIBRO = ('titulo', 'aniopublicacion', 'genero', 'precioventa', 'stock', 'descripcion')
+OBLIGATORIOS_NUEVO = ('titulo', 'autor', 'editorial', 'aniopublicacion', 'genero', 'precioventa')
+
+# Autor exige fecha de nacimiento; para los creados al importar se usa esta
+# fecha si el archivo no trae la columna autor_fechanacimiento.
+FECHA_DESCONOCIDA = date(1900, 1, 1)
+
+_GENEROS = {codigo.lower(): codigo for codigo, _ in Libro.GENEROS}
+_GENEROS.update({nombre.lower(): codigo for codigo, nombre in Libro.GENEROS})
+
+
+class ErrorFila(ValueError):
+    pass
+
+
+# =============================================
+# LECTURA EN FLUJO
+# =============================================
+
+def _texto(archivo, encoding):
+    """Envuelve un archivo binario (p. ej. una subida de Django) como texto."""
+    # UploadedFile y los archivos temporales envuelven el objeto de io real
+    while not isinstance(archivo, io.IOBase) and hasattr(archivo, 'file'):
+        archivo = archivo.file
+    if isinstance(archivo, io.TextIOBase):
+        return archivo
+    return io.TextIOWrapper(archivo, encoding=encoding, newline='')
+
+
+def _leer_csv(texto, delimitador):
+    lector = csv.DictReader(texto, delimiter=delimitador)
+    for fila in lector:
+        yield lector.line_num, fila
+
+
+def _leer_jsonl(texto):
+    for numero, linea in enumerate(texto, start=1):
+        if linea.strip():
+            try:
+                yield numero, json.loads(linea)
+            except ValueError as e:
+                yield numero, ErrorFila(f'JSON inválido: {e}')
+
+
+def _leer_json(texto, tamanio=64 * 1024):
+    """Recorre un arreglo JSON de objetos sin cargarlo completo en memoria."""
+    decodificador = json.JSONDecoder()
+    bufer, posicion, numero = '', 0, 0
+    abierto = False
+    while True:
+        bloque = texto.read(tamanio)
+        bufer = bufer[posicion:] + bloque
+        posicion = 0
+        while True:
+            while posicion < len(bufer) and bufer[posicion] in ' \t\r\n,':
+                posicion += 1
+            if not abierto and posicion < len(bufer):
+                if bufer[posicion] != '[':
+                    raise ValueError('El archivo JSON debe ser un arreglo de objetos')
+                abierto = True
+                posicion += 1
+                continue
+            if posicion < len(bufer) and bufer[posicion] == ']':
+                return
+            try:
+                objeto, fin = decodificador.raw_decode(bufer, posicion)
+            except ValueError:
+                if not bloque:
+                    if bufer[posicion:].strip():
+                        raise ValueError('El archivo JSON está incompleto')
+                    return
+                break  # objeto partido entre bloques: leer más
+            numero += 1
+            posicion = fin
+            yield numero, objeto
+        if not bloque:
+            return
+
+
+def leer_filas(archivo, formato='csv', encoding='utf-8-sig', delimitador=','):
+    """Genera pares (número de fila, dict) del archivo en el formato indicado."""
+    texto = _texto(archivo, encoding)
+    if formato == 'csv':
+        return _leer_csv(texto, delimitador)
+    if formato == 'jsonl':
+        return _leer_jsonl(texto)
+    if formato == 'json':
+        return _leer_json(texto)
+    raise ValueError(f'Formato no soportado: {formato}')
+
+
+def formato_de(nombre):
+    extension = nombre.rsplit('.', 1)[-1].lower()
+    if extension in ('ndjson', 'jsonl'):
+        return 'jsonl'
+    return extension if extension in FORMATOS else 'csv'
+
+
+# =============================================
+# VALIDACIÓN
+# =============================================
+
+def _limpio(fila, campo):
+    valor = fila.get(campo)
+    return '' if valor is None else str(valor).strip()
+
+
+def _nombre_autor(fila):
+    """Devuelve (nombre, apellido) a partir de autor_nombre/autor_apellido o de autor."""
+    nombre, apellido = _limpio(fila, 'autor_nombre'), _limpio(fila, 'autor_apellido')
+    if not (nombre or apellido):
+        completo = _limpio(fila, 'autor')
+        nombre, _, apellido = completo.partition(' ')
+    return (nombre, apellido) if nombre or apellido else None
+
+
+def validar_fila(fila):
+    """
+    Convierte una fila del archivo en un dict con los valores ya tipados.
+    Solo incluye las columnas presentes; lanza ErrorFila si algún valor es inválido.
+    """
+    if not isinstance(fila, dict):
+        raise ErrorFila('La fila no es un objeto')
+    isbn = _limpio(fila, 'isbn').replace(' ', '')
+    if not isbn:
+        raise ErrorFila('Falta el ISBN')
+    if len(isbn) > 17:
+        raise ErrorFila(f'ISBN demasiado largo: {isbn}')
+
+    datos = {'isbn': isbn}
+    if _limpio(fila, 'titulo'):
+        datos['titulo'] = _limpio(fila, 'titulo')[:255]
+    autor = _nombre_autor(fila)
+    if autor:
+        datos['autor'] = autor
+        datos['autor_nacionalidad'] = _limpio(fila, 'autor_nacionalidad')
+        fecha = _limpio(fila, 'autor_fechanacimiento')
+        try:
+            datos['autor_fechanacimiento'] = date.fromisoformat(fecha) if fecha else FECHA_DESCONOCIDA
+        except ValueError:
+            raise ErrorFila(f'Fecha de nacimiento inválida: {fecha}')
+    if _limpio(fila, 'editorial'):
+        datos['editorial'] = _limpio(fila, 'editorial')[:255]
+    if _limpio(fila, 'genero'):
+        genero = _GENEROS.get(_limpio(fila, 'genero').lower())
+        if genero is None:
+            raise ErrorFila(f'Género desconocido: {_limpio(fila, "genero")}')
+        datos['genero'] = genero
+    if _limpio(fila, 'precioventa'):
+        try:
+            precio = Decimal(_limpio(fila, 'precioventa').replace('$', '').replace(',', ''))
+        except InvalidOperation:
+            raise ErrorFila(f'Precio inválido: {_limpio(fila, "precioventa")}')
+        if precio < 0 or precio >= Decimal('100000000'):
+            raise ErrorFila(f'Precio fuera de rango: {precio}')
+        datos['precioventa'] = precio.quantize(Decimal('0.01'))
+    for campo in ('aniopublicacion', 'stock'):
+        if _limpio(fila, campo):
+            try:
+                datos[campo] = int(_limpio(fila, campo))
+            except ValueError:
+                raise ErrorFila(f'{campo} debe ser un número entero')
+            if datos[campo] < 0:
+                raise ErrorFila(f'{campo} no puede ser negativo')
+    if 'descripcion' in fila:
+        datos['descripcion'] = _limpio(fila, 'descripcion')
+    return datos
+
+
+# =============================================
+# IMPORTACIÓN POR LOTES
+# =============================================
+
+class Importador:
+    """Mantiene los autores y editoriales ya resueltos entre lotes."""
+
+    def __init__(self):
+        self.autores = {}
+        self.editoriales = {}
+        self.resultado = {
+            'leidas': 0, 'creados': 0, 'actualizados': 0,
+            'autores_creados': 0, 'editoriales_creadas': 0,
+            'con_error': 0, 'errores': [],
+        }
+
+    def error(self, numero, mensaje):
+        self.resultado['con_error'] += 1
+        if len(self.resultado['errores']) < MAX_ERRORES:
+            self.resultado['errores'].append((numero, str(mensaje)))
+
+    def _resolver_autores(self, claves):
+        faltantes = {clave for clave in claves if clave not in self.autores}
+        if not faltantes:
+            return
+        for autorid, nombre, apellido in Autor.objects.filter(
+            apellido__in={apellido for _, apellido in faltantes}
+        ).values_list('autorid', 'nombre', 'apellido').order_by('autorid'):
+            self.autores.setdefault((nombre, apellido), autorid)
+
+    def _crear_autores(self, nuevos):
+        autores = Autor.objects.bulk_create([
+            Autor(nombre=nombre, apellido=apellido, nacionalidad=nacionalidad,
+                  fechanacimiento=fecha, bibliografia='')
+            for (nombre, apellido), (nacionalidad, fecha) in nuevos.items()
+        ])
+        for autor in autores:
+            self.autores[(autor.nombre, autor.apellido)] = autor.pk
+        self.resultado['autores_creados'] += len(autores)
+
+    def _resolver_editoriales(self, nombres):
+        faltantes = [nombre for nombre in nombres if nombre not in self.editoriales]
+        if not faltantes:
+            return
+        antes = Editorial.objects.filter(nombre__in=faltantes).count()
+        Editorial.objects.bulk_create(
+            [Editorial(nombre=nombre, direccion='', telefono='', email='', pais='') for nombre in faltantes],
+            ignore_conflicts=True,
+        )
+        self.editoriales.update(
+            Editorial.objects.filter(nombre__in=faltantes).values_list('nombre', 'editorialid')
+        )
+        self.resultado['editoriales_creadas'] += len(faltantes) - antes
+
+    def procesar_lote(self, lote):
+        """lote: lista de (número de fila, datos validados)."""
+        # Un mismo ISBN repetido en el lote: gana la última aparición
+        por_isbn = {}
+        for numero, datos in lote:
+            por_isbn[datos['isbn']] = (numero, datos)
+
+        # Los valores actuales completan las filas que solo actualizan algunas
+        # columnas: INSERT ... ON CONFLICT necesita una fila válida para insertar
+        existentes = {
+            libro['isbn']: libro
+            for libro in Libro.objects.filter(isbn__in=por_isbn).values(
+                'libroid', 'isbn', 'titulo', 'autorid_id', 'editorialid_id', 'aniopublicacion',
+                'genero', 'precioventa',
+            )
+        }
+        validas = []
+        for isbn, (numero, datos) in por_isbn.items():
+            if isbn not in existentes:
+                faltan = [campo for campo in OBLIGATORIOS_NUEVO if campo not in datos]
+                if faltan:
+                    self.error(numero, f'Libro nuevo {isbn} sin: {", ".join(faltan)}')
+                    continue
+            validas.append((numero, datos))
+        if not validas:
+            return
+
+        with transaction.atomic():
+            self._resolver_autores({datos['autor'] for _, datos in validas if 'autor' in datos})
+            nuevos = {}
+            for _, datos in validas:
+                if 'autor' in datos and datos['autor'] not in self.autores:
+                    nuevos.setdefault(datos['autor'], (datos['autor_nacionalidad'], datos['autor_fechanacimiento']))
+            if nuevos:
+                self._crear_autores(nuevos)
+            self._resolver_editoriales({datos['editorial'] for _, datos in validas if 'editorial' in datos})
+
+            # Se agrupan por columnas presentes para no pisar valores que el
+            # archivo no trae (update_fields es común a todo el bulk_create)
+            grupos = {}
+            for _, datos in validas:
+                campos = tuple(campo for campo in CAMPOS_LIBRO if campo in datos)
+                campos += tuple(campo for campo in ('autorid', 'editorialid')
+                                if campo[:-2] in datos)
+                grupos.setdefault(campos, []).append(datos)
+
+            libroids = []
+            for campos, filas in grupos.items():
+                libros = [self._libro(datos, existentes.get(datos['isbn'], {})) for datos in filas]
+                Libro.objects.bulk_create(
+                    libros,
+                    update_conflicts=True,
+                    unique_fields=['isbn'],
+                    update_fields=list(campos) or ['isbn'],
+                )
+                libroids.extend(libro.pk for libro in libros)
+                # bulk_create no dispara las señales de Libro: los resúmenes
+                # por género y editorial se corrigen aquí
+                for libro in libros:
+                    actual = existentes.get(libro.isbn)
+                    if actual is None:
+                        continue
+                    anterior = (actual['genero'], actual['editorialid_id'])
+                    if anterior != (libro.genero, libro.editorialid_id):
+                        resumenes.reclasificar_libro(
+                            actual['libroid'], anterior, (libro.genero, libro.editorialid_id)
+                        )
+
+            busqueda.indexar_libros(libroids)
+
+        creados = sum(1 for _, datos in validas if datos['isbn'] not in existentes)
+        self.resultado['creados'] += creados
+        self.resultado['actualizados'] += len(validas) - creados
+
+    def _libro(self, datos, actual):
+        libro = Libro(isbn=datos['isbn'], stock=datos.get('stock', 0),
+                      descripcion=datos.get('descripcion', ''), **{
+                          campo: valor for campo, valor in actual.items() if campo not in ('isbn', 'libroid')
+                      })
+        for campo in CAMPOS_LIBRO:
+            if campo in datos:
+                setattr(libro, campo, datos[campo])
+        if 'autor' in datos:
+            libro.autorid_id = self.autores[datos['autor']]
+        if 'editorial' in datos:
+            libro.editorialid_id = self.editoriales[datos['editorial']]
+        return libro
+
+
+def importar(filas, lote=LOTE, progreso=None):
+    """
+    Importa las filas producidas por leer_filas. Devuelve un resumen con los
+    libros creados y actualizados y la lista de errores (número de fila, mensaje).
+    """
+    importador = Importador()
+    pendientes = []
+    for numero, fila in filas:
+        importador.resultado['leidas'] += 1
+        try:
+            if isinstance(fila, Exception):
+                raise fila
+            pendientes.append((numero, validar_fila(fila)))
+        except ErrorFila as e:
+            importador.error(numero, e)
+        if len(pendientes) >= lote:
+            importador.procesar_lote(pendientes)
+            pendientes = []
+            if progreso:
+                progreso(importador.resultado)
+    if pendientes:
+        importador.procesar_lote(pendientes)
+
+    estadisticas.invalidar()
+    importador.resultado['errores'].sort()
+    return importador.resultado
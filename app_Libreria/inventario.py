@@ -0,0 +1,83 @@
+# app_Libreria/inventario.py
+"""Listado de inventario del panel y su valuación calculada en la base."""
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Libro
+
+POR_PAGINA = 50
+UMBRAL_STOCK_BAJO = 10
+
+ORDENES = {
+    'libroid': 'libroid',
+    'titulo': 'titulo',
+    '-titulo': '-titulo',
+    'precio': 'precioventa',
+    '-precio': '-precioventa',
+    'stock': 'stock',
+    '-stock': '-stock',
+    'anio': 'aniopublicacion',
+    '-anio': '-aniopublicacion',
+}
+
+VALOR = ExpressionWrapper(
+    F('precioventa') * F('stock'),
+    output_field=DecimalField(max_digits=14, decimal_places=2),
+)
+VALOR_TOTAL = Coalesce(Sum(VALOR), Decimal('0.00'))
+UNIDADES = Coalesce(Sum('stock'), 0)
+
+
+def filtrar_inventario(params):
+    """Filtra y ordena el inventario según los parámetros GET del listado."""
+    libros = Libro.objects.con_relaciones()
+
+    busqueda = params.get('q', '').strip()
+    if busqueda:
+        libros = libros.filter(
+            Q(titulo__icontains=busqueda)
+            | Q(isbn__icontains=busqueda)
+            | Q(autorid__nombre__icontains=busqueda)
+            | Q(autorid__apellido__icontains=busqueda)
+            | Q(editorialid__nombre__icontains=busqueda)
+        )
+    if params.get('genero'):
+        libros = libros.filter(genero=params['genero'])
+    if params.get('editorial', '').isdigit():
+        libros = libros.filter(editorialid_id=int(params['editorial']))
+    if params.get('stock_bajo'):
+        libros = libros.filter(stock__lte=UMBRAL_STOCK_BAJO)
+
+    orden = ORDENES.get(params.get('orden'), 'titulo')
+    return libros.order_by(orden, 'libroid')
+
+
+def valuar_inventario():
+    """Totales del inventario en una sola consulta de agregación."""
+    return Libro.objects.aggregate(
+        total_libros=Count('libroid'),
+        disponibles=Count('libroid', filter=Q(stock__gt=0)),
+        stock_bajo=Count('libroid', filter=Q(stock__gt=0, stock__lte=UMBRAL_STOCK_BAJO)),
+        total_stock=UNIDADES,
+        valor_total=VALOR_TOTAL,
+    )
+
+
+def valuacion_por_editorial():
+    return list(
+        Libro.objects.values('editorialid', 'editorialid__nombre')
+        .annotate(libros=Count('libroid'), unidades=UNIDADES, valor=VALOR_TOTAL)
+        .order_by('-valor')
+    )
+
+
+def valuacion_por_genero():
+    generos = dict(Libro.GENEROS)
+    return [
+        {**fila, 'nombre': generos.get(fila['genero'], fila['genero'])}
+        for fila in Libro.objects.values('genero')
+        .annotate(libros=Count('libroid'), unidades=UNIDADES, valor=VALOR_TOTAL)
+        .order_by('-valor')
+    ]
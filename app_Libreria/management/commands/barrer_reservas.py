@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app_Libreria import reservas
+
+
+class Command(BaseCommand):
+    help = (
+        'Borra las reservas de stock vencidas. El worker (procesar_tareas) ya lo hace '
+        'cada minuto; este comando es para instalaciones sin worker, desde cron'
+    )
+
+    def handle(self, *args, **options):
+        borradas = reservas.barrer()
+        self.stdout.write(self.style.SUCCESS(f'{borradas} reservas vencidas borradas'))
@@ -0,0 +1,231 @@
+import json
+import logging
+import resource
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import resolve, reverse
+
+from app_Libreria import carrito, metricas, sinteticos
+from app_Libreria.models import Carrito, Libro
+
+ESCENARIOS = ['libros', 'inicio', 'ver_carrito', 'procesar_compra', 'admin_ventas', 'panel_admin']
+ARTICULOS_CARRITO = 3
+# Stock con el que se reponen los libros del carrito cuando se agotan
+REPOSICION = 100
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    indice = min(len(valores) - 1, max(0, round(p / 100 * len(valores)) - 1))
+    return valores[indice]
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera datos sintéticos en una base de prueba temporal y mide las vistas '
+        'principales de la tienda con el cliente de pruebas de Django'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', choices=sinteticos.ESCALAS, default='1k',
+                            help='Tamaño del catálogo generado (default: 1k)')
+        parser.add_argument('--semilla', type=int, default=0)
+        parser.add_argument('--iteraciones', type=int, default=30)
+        parser.add_argument('--calentamiento', type=int, default=3)
+        parser.add_argument('--urls', nargs='+', choices=ESCENARIOS, default=ESCENARIOS,
+                            help='Vistas a medir (default: todas)')
+        parser.add_argument('--guardar-base', metavar='ARCHIVO',
+                            help='Guarda los resultados como línea base en un archivo JSON')
+        parser.add_argument('--comparar', metavar='ARCHIVO',
+                            help='Compara contra una línea base guardada previamente')
+        parser.add_argument('--tolerancia', type=float, default=0.2,
+                            help='Aumento relativo del p95 que se considera regresión (default: 0.2)')
+        parser.add_argument('--fallar-si-empeora', action='store_true',
+                            help='Termina con error si hay regresiones respecto a la línea base')
+
+    def handle(self, *args, **options):
+        # Las advertencias de peticiones lentas ensuciarían el informe
+        logging.getLogger('app_Libreria.metricas').setLevel(logging.ERROR)
+        # Se trabaja siempre sobre una base de prueba desechable, nunca sobre la real
+        setup_test_environment()
+        # y con una caché propia, para no mezclar datos con la del servidor
+        cache_aislada = override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        })
+        cache_aislada.enable()
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            filas = sinteticos.generar(
+                sinteticos.ESCALAS[options['escala']], options['semilla'],
+                progreso=lambda mensaje: self.stdout.write(f'  generado {mensaje}'),
+            )
+            resultados = self.medir(options)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            cache_aislada.disable()
+            teardown_test_environment()
+
+        informe = {'escala': options['escala'], 'semilla': options['semilla'],
+                   'filas': filas, 'resultados': resultados}
+        self.imprimir(resultados)
+        self.stdout.write(
+            f"Memoria máxima del proceso: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB"
+        )
+
+        if options['guardar_base']:
+            with open(options['guardar_base'], 'w', encoding='utf-8') as archivo:
+                json.dump(informe, archivo, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Línea base guardada en {options['guardar_base']}"))
+
+        if options['comparar']:
+            regresiones = self.comparar(options['comparar'], informe, options['tolerancia'])
+            if regresiones and options['fallar_si_empeora']:
+                raise CommandError(f'{len(regresiones)} regresiones: {", ".join(regresiones)}')
+
+    # =============================================
+    # ESCENARIOS
+    # =============================================
+
+    def preparar(self):
+        self.anonimo = Client()
+        self.cliente = Client()
+        self.usuario = User.objects.filter(is_staff=False).order_by('pk').first()
+        self.cliente.force_login(self.usuario)
+        self.admin = Client()
+        self.admin.force_login(User.objects.create_user('benchmark_admin', is_staff=True))
+        self.libros_carrito = list(
+            Libro.objects.disponibles().order_by('libroid').values_list('libroid', flat=True)[:ARTICULOS_CARRITO]
+        )
+        self.llenar_carrito()
+
+    def llenar_carrito(self):
+        # Cada compra descuenta una unidad: se repone lo agotado y se parte de
+        # un carrito vacío (carrito_usuario_libro_uniq no admite repetidos)
+        Libro.objects.filter(libroid__in=self.libros_carrito, stock__lt=1).update(stock=REPOSICION)
+        Carrito.objects.filter(usuario=self.usuario).delete()
+        Carrito.objects.bulk_create([
+            Carrito(usuario=self.usuario, libro_id=libroid, cantidad=1)
+            for libroid in self.libros_carrito
+        ])
+        carrito.invalidar(self.usuario)
+
+    def peticion(self, nombre):
+        """Devuelve (preparación, petición) para un escenario."""
+        if nombre == 'procesar_compra':
+            return self.llenar_carrito, lambda: self.cliente.post(
+                reverse('procesar_compra'), {'metodo_pago': 'TARJETA'}
+            )
+        if nombre == 'ver_carrito':
+            return None, lambda: self.cliente.get(reverse('ver_carrito'))
+        if nombre in ('admin_ventas', 'panel_admin'):
+            return None, lambda: self.admin.get(reverse(nombre))
+        return None, lambda: self.anonimo.get(reverse(nombre))
+
+    def verificar(self, nombre, respuesta):
+        if respuesta.status_code >= 400:
+            raise CommandError(f'{nombre} respondió {respuesta.status_code}')
+        # Una compra fallida (sin stock, carrito vacío) también es un 302,
+        # pero al carrito: medirla como venta falsearía el escenario
+        if nombre == 'procesar_compra' and (
+            respuesta.status_code != 302 or resolve(respuesta.url).url_name != 'detalle_venta'
+        ):
+            raise CommandError(f'procesar_compra no registró la venta (respondió {respuesta.status_code} '
+                               f"hacia {respuesta.get('Location', '')})")
+
+    def medir(self, options):
+        self.preparar()
+        resultados = {}
+        for nombre in options['urls']:
+            # procesar_compra vacía el carrito, así que se rellena antes de cada
+            # petición fuera del tiempo medido
+            preparar, peticion = self.peticion(nombre)
+
+            for _ in range(options['calentamiento']):
+                if preparar:
+                    preparar()
+                self.verificar(nombre, peticion())
+
+            tiempos, consultas = [], []
+            for _ in range(options['iteraciones']):
+                if preparar:
+                    preparar()
+                medicion = metricas.Medicion()
+                inicio = time.perf_counter()
+                with connection.execute_wrapper(medicion):
+                    respuesta = peticion()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+                consultas.append(medicion.consultas)
+                self.verificar(nombre, respuesta)
+
+            # Memoria: una petición extra con tracemalloc, que es demasiado
+            # costoso para activarlo durante la medición de latencia
+            if preparar:
+                preparar()
+            tracemalloc.start()
+            respuesta = peticion()
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.verificar(nombre, respuesta)
+
+            resultados[nombre] = {
+                'p50': round(_percentil(tiempos, 50), 2),
+                'p95': round(_percentil(tiempos, 95), 2),
+                'p99': round(_percentil(tiempos, 99), 2),
+                'media': round(statistics.fmean(tiempos), 2),
+                'consultas': max(consultas),
+                'memoria_kb': round(pico / 1024),
+            }
+        return resultados
+
+    # =============================================
+    # INFORMES
+    # =============================================
+
+    def imprimir(self, resultados):
+        self.stdout.write('')
+        self.stdout.write(f"{'Vista':<18}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'consultas':>11}{'pico KB':>10}")
+        for nombre, fila in resultados.items():
+            self.stdout.write(
+                f"{nombre:<18}{fila['p50']:>10.1f}{fila['p95']:>10.1f}{fila['p99']:>10.1f}"
+                f"{fila['consultas']:>11}{fila['memoria_kb']:>10}"
+            )
+
+    def comparar(self, archivo, informe, tolerancia):
+        try:
+            with open(archivo, encoding='utf-8') as entrada:
+                base = json.load(entrada)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'No se pudo leer la línea base {archivo}: {e}')
+
+        if base.get('escala') != informe['escala']:
+            self.stdout.write(self.style.WARNING(
+                f"La línea base es de escala {base.get('escala')} y esta corrida de {informe['escala']}"
+            ))
+
+        self.stdout.write('')
+        self.stdout.write(f"{'Vista':<18}{'p95 base':>10}{'p95':>10}{'Δ':>9}{'consultas':>14}")
+        regresiones = []
+        for nombre, fila in informe['resultados'].items():
+            anterior = base.get('resultados', {}).get(nombre)
+            if anterior is None:
+                continue
+            cambio = (fila['p95'] - anterior['p95']) / anterior['p95'] if anterior['p95'] else 0
+            empeora = cambio > tolerancia or fila['consultas'] > anterior['consultas']
+            linea = (
+                f"{nombre:<18}{anterior['p95']:>10.1f}{fila['p95']:>10.1f}{cambio:>+9.0%}"
+                f"{anterior['consultas']:>7} → {fila['consultas']:<4}"
+            )
+            if empeora:
+                regresiones.append(nombre)
+                self.stdout.write(self.style.ERROR(linea))
+            else:
+                self.stdout.write(linea)
+        return regresiones
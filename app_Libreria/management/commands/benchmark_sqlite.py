@@ -0,0 +1,148 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app_Libreria import basedatos
+
+# Lo que hace Django sin ajustes: diario de reversión, fsync completo,
+# transacciones diferidas y el timeout de 5 s del módulo sqlite3
+SIN_AJUSTES = {'pragmas': {}, 'inicio_transaccion': 'BEGIN', 'timeout': 5.0}
+
+
+def _con_ajustes():
+    return {'pragmas': basedatos.pragmas(), 'inicio_transaccion': 'BEGIN IMMEDIATE', 'timeout': 5.0}
+
+
+def _conectar(ruta, modo):
+    conexion = sqlite3.connect(ruta, timeout=modo['timeout'], isolation_level=None)
+    basedatos.aplicar(conexion.cursor(), modo['pragmas'])
+    return conexion
+
+
+def _crear_base(ruta, filas):
+    conexion = sqlite3.connect(ruta, isolation_level=None)
+    conexion.executescript(
+        'CREATE TABLE libro (libroid INTEGER PRIMARY KEY, titulo TEXT, precio REAL, stock INTEGER);'
+        'CREATE TABLE venta (ventaid INTEGER PRIMARY KEY, libroid INTEGER, cantidad INTEGER, fecha REAL);'
+    )
+    conexion.execute('BEGIN')
+    conexion.executemany(
+        'INSERT INTO libro (titulo, precio, stock) VALUES (?, ?, ?)',
+        ((f'Libro {i:06d}', 100 + i % 400, 1_000_000) for i in range(filas)),
+    )
+    conexion.execute('COMMIT')
+    conexion.close()
+
+
+def _trabajar(ruta, modo, rol, filas, inicio, fin, semilla):
+    """Un proceso lector o escritor; devuelve sus latencias (ms) y errores."""
+    azar = random.Random(semilla)
+    conexion = _conectar(ruta, modo)
+    latencias, errores = [], 0
+    while time.time() < inicio:
+        time.sleep(0.001)
+    while time.time() < fin:
+        libroid = azar.randint(1, filas)
+        antes = time.perf_counter()
+        try:
+            if rol == 'lectura':
+                # Una página del catálogo
+                conexion.execute(
+                    'SELECT libroid, titulo, precio FROM libro WHERE libroid BETWEEN ? AND ? ORDER BY titulo',
+                    (libroid, libroid + 24),
+                ).fetchall()
+            else:
+                # Una compra: lee el stock y luego escribe, como procesar_compra
+                conexion.execute(modo['inicio_transaccion'])
+                try:
+                    conexion.execute('SELECT stock FROM libro WHERE libroid = ?', (libroid,)).fetchone()
+                    conexion.execute('UPDATE libro SET stock = stock - 1 WHERE libroid = ? AND stock > 0', (libroid,))
+                    conexion.execute('INSERT INTO venta (libroid, cantidad, fecha) VALUES (?, 1, ?)',
+                                     (libroid, time.time()))
+                    conexion.execute('COMMIT')
+                except sqlite3.Error:
+                    if conexion.in_transaction:
+                        conexion.execute('ROLLBACK')
+                    raise
+        except sqlite3.OperationalError:
+            errores += 1
+            continue
+        latencias.append((time.perf_counter() - antes) * 1000)
+    conexion.close()
+    return rol, latencias, errores
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, max(0, round(p / 100 * len(valores)) - 1))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide lecturas y escrituras concurrentes sobre una base SQLite temporal, '
+        'con la configuración por omisión y con los ajustes de basedatos.py'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lectores', type=int, default=4, help='Procesos que leen (default: 4)')
+        parser.add_argument('--escritores', type=int, default=2, help='Procesos que escriben (default: 2)')
+        parser.add_argument('--segundos', type=float, default=5.0, help='Duración de cada corrida (default: 5)')
+        parser.add_argument('--filas', type=int, default=20000, help='Libros en la base de prueba (default: 20000)')
+
+    def handle(self, *args, **options):
+        if options['lectores'] < 0 or options['escritores'] < 0 or options['segundos'] <= 0:
+            raise CommandError('--lectores y --escritores deben ser >= 0 y --segundos > 0')
+        self.stdout.write(
+            f"{options['lectores']} lectores y {options['escritores']} escritores durante "
+            f"{options['segundos']:g} s sobre {options['filas']} libros"
+        )
+        resultados = {}
+        with tempfile.TemporaryDirectory() as carpeta:
+            for nombre, modo in (('sin ajustes', SIN_AJUSTES), ('con ajustes', _con_ajustes())):
+                ruta = os.path.join(carpeta, f"{nombre.replace(' ', '_')}.sqlite3")
+                _crear_base(ruta, options['filas'])
+                resultados[nombre] = self.correr(ruta, modo, options)
+        self.imprimir(resultados, options['segundos'])
+
+    def correr(self, ruta, modo, options):
+        roles = ['lectura'] * options['lectores'] + ['escritura'] * options['escritores']
+        # Procesos y no hilos: así trabajan los workers de gunicorn
+        contexto = multiprocessing.get_context('spawn')
+        inicio = time.time() + 1.0  # tiempo para que arranquen todos
+        fin = inicio + options['segundos']
+        with contexto.Pool(len(roles)) as pool:
+            parciales = pool.starmap(_trabajar, [
+                (ruta, modo, rol, options['filas'], inicio, fin, semilla)
+                for semilla, rol in enumerate(roles)
+            ])
+        resultado = {}
+        for rol in ('lectura', 'escritura'):
+            latencias = [ms for r, valores, _ in parciales if r == rol for ms in valores]
+            resultado[rol] = {
+                'operaciones': len(latencias),
+                'errores': sum(errores for r, _, errores in parciales if r == rol),
+                'p50': _percentil(latencias, 50),
+                'p99': _percentil(latencias, 99),
+                'media': statistics.fmean(latencias) if latencias else 0.0,
+            }
+        return resultado
+
+    def imprimir(self, resultados, segundos):
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'Configuración':<14}{'Operación':<11}{'ops/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'bloqueos':>10}"
+        )
+        for nombre, resultado in resultados.items():
+            for rol, fila in resultado.items():
+                self.stdout.write(
+                    f"{nombre:<14}{rol:<11}{fila['operaciones'] / segundos:>10.0f}"
+                    f"{fila['p50']:>9.2f}{fila['p99']:>9.2f}{fila['errores']:>10}"
+                )
@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from app_Libreria import exportacion
+from app_Libreria.models import Venta
+
+
+def _fecha(valor):
+    try:
+        fecha = parse_date(valor)
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        raise CommandError(f'Fecha inválida (use AAAA-MM-DD): {valor}')
+    return fecha
+
+
+class Command(BaseCommand):
+    help = 'Exporta las ventas con sus líneas de detalle en CSV, JSON Lines o ZIP de CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=_fecha, help='Fecha inicial inclusive (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=_fecha, help='Fecha final inclusive (AAAA-MM-DD)')
+        parser.add_argument('--estado', choices=[codigo for codigo, _ in Venta.ESTADOS_VENTA])
+        parser.add_argument('--formato', choices=exportacion.FORMATOS, default='csv')
+        parser.add_argument('--salida', help='Archivo de salida (por defecto, la salida estándar)')
+
+    def handle(self, *args, **options):
+        bloques = exportacion.exportar(
+            options['formato'], options['desde'], options['hasta'], options['estado']
+        )
+        binario = options['formato'] == 'zip'
+        if options['salida']:
+            modo = {'mode': 'wb'} if binario else {'mode': 'w', 'encoding': 'utf-8', 'newline': ''}
+            with open(options['salida'], **modo) as destino:
+                for bloque in bloques:
+                    destino.write(bloque)
+            self.stderr.write(self.style.SUCCESS(f"Ventas exportadas a {options['salida']}"))
+        elif binario:
+            for bloque in bloques:
+                sys.stdout.buffer.write(bloque)
+        else:
+            for bloque in bloques:
+                self.stdout.write(bloque, ending='')
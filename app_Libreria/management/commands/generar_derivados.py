@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from app_Libreria import derivados
+from app_Libreria.signals import IMAGENES
+
+
+class Command(BaseCommand):
+    help = 'Genera las miniaturas WebP/JPEG que falten para portadas, eventos y blog'
+
+    def handle(self, *args, **options):
+        generados = errores = 0
+        for modelo, nombre_campo in IMAGENES.items():
+            consulta = modelo.objects.exclude(**{nombre_campo: ''}).exclude(**{f'{nombre_campo}__isnull': True})
+            for campo in (getattr(instancia, nombre_campo) for instancia in consulta.only(nombre_campo).iterator()):
+                try:
+                    derivados.generar_todos(campo)
+                    generados += 1
+                except (derivados.ImagenInvalida, OSError) as e:
+                    errores += 1
+                    self.stderr.write(f'  {campo.name}: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Derivados listos para {generados} imágenes ({errores} con error)'))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app_Libreria import importacion
+
+
+class Command(BaseCommand):
+    help = 'Importa o actualiza libros por ISBN desde un archivo CSV, JSON o JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument('--formato', choices=importacion.FORMATOS,
+                            help='Formato del archivo (por defecto se deduce de la extensión)')
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--delimitador', default=',', help='Separador de columnas del CSV')
+        parser.add_argument('--lote', type=int, default=importacion.LOTE)
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or importacion.formato_de(options['archivo'])
+        inicio = time.perf_counter()
+
+        def progreso(resultado):
+            self.stdout.write(f"  {resultado['leidas']} filas leídas...")
+
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                filas = importacion.leer_filas(
+                    archivo, formato, options['encoding'], options['delimitador']
+                )
+                resultado = importacion.importar(filas, options['lote'], progreso)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'No se pudo importar {options["archivo"]}: {e}')
+
+        for numero, mensaje in resultado['errores']:
+            self.stderr.write(f'  fila {numero}: {mensaje}')
+        if resultado['con_error'] > len(resultado['errores']):
+            self.stderr.write(f"  ... y {resultado['con_error'] - len(resultado['errores'])} errores más")
+
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['leidas']} filas en {segundos:.1f} s: {resultado['creados']} libros creados, "
+            f"{resultado['actualizados']} actualizados, {resultado['con_error']} con error "
+            f"({resultado['autores_creados']} autores y {resultado['editoriales_creadas']} editoriales nuevos)"
+        ))
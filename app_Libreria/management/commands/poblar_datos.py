@@ -0,0 +1,147 @@
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from app_Libreria import busqueda, estadisticas, resumenes, sinteticos
+from app_Libreria.models import (
+    Autor, Blog, Carrito, Cliente, DetalleVenta, Editorial, Evento, Libro, ResumenDiaClientes, ResumenDiaEditorial,
+    ResumenDiaGenero, ResumenDiaLibro, ResumenDiaMetodo, Venta,
+)
+
+EDITORIALES = [
+    {'nombre': 'Penguin Random House', 'pais': 'Estados Unidos', 'telefono': '+1-555-0101', 'email': 'contacto@penguin.com'},
+    {'nombre': 'Editorial Planeta', 'pais': 'España', 'telefono': '+34-915-555-123', 'email': 'info@planeta.es'},
+    {'nombre': 'Alfaguara', 'pais': 'México', 'telefono': '+52-55-1234-5678', 'email': 'contacto@alfaguara.mx'},
+    {'nombre': 'Anaya', 'pais': 'España', 'telefono': '+34-913-555-789', 'email': 'ventas@anaya.es'},
+    {'nombre': 'Fondo de Cultura Económica', 'pais': 'México', 'telefono': '+52-55-5678-9012', 'email': 'fce@fondodecultura.com'},
+]
+
+AUTORES = [
+    {'nombre': 'Gabriel', 'apellido': 'García Márquez', 'nacionalidad': 'Colombiano', 'fechanacimiento': date(1927, 3, 6), 'bibliografia': 'Premio Nobel de Literatura 1982'},
+    {'nombre': 'Isabel', 'apellido': 'Allende', 'nacionalidad': 'Chilena', 'fechanacimiento': date(1942, 8, 2), 'bibliografia': 'Conocida por La casa de los espíritus'},
+    {'nombre': 'Carlos', 'apellido': 'Ruiz Zafón', 'nacionalidad': 'Español', 'fechanacimiento': date(1964, 9, 25), 'bibliografia': 'Autor de La sombra del viento'},
+    {'nombre': 'Laura', 'apellido': 'Gallego', 'nacionalidad': 'Española', 'fechanacimiento': date(1977, 10, 11), 'bibliografia': 'Autora de Memorias de Idhún'},
+    {'nombre': 'Jorge Luis', 'apellido': 'Borges', 'nacionalidad': 'Argentino', 'fechanacimiento': date(1899, 8, 24), 'bibliografia': 'Uno de los autores más destacados'},
+]
+
+# Autor y editorial se indican por su posición en las listas anteriores
+LIBROS = [
+    {'titulo': 'Cien años de soledad', 'isbn': '978-8437604947', 'aniopublicacion': 1967, 'genero': 'FIC', 'precioventa': Decimal('450.00'), 'stock': 25, 'descripcion': 'La obra maestra del realismo mágico', 'editorial': 0, 'autor': 0},
+    {'titulo': 'La sombra del viento', 'isbn': '978-8408094352', 'aniopublicacion': 2001, 'genero': 'TER', 'precioventa': Decimal('380.00'), 'stock': 18, 'descripcion': 'Una novela de misterio en Barcelona', 'editorial': 1, 'autor': 2},
+    {'titulo': 'La casa de los espíritus', 'isbn': '978-8466337102', 'aniopublicacion': 1982, 'genero': 'FIC', 'precioventa': Decimal('420.00'), 'stock': 15, 'descripcion': 'Crónica de una familia latinoamericana', 'editorial': 2, 'autor': 1},
+    {'titulo': 'Memorias de Idhún: La Resistencia', 'isbn': '978-8467500123', 'aniopublicacion': 2004, 'genero': 'FAN', 'precioventa': Decimal('320.00'), 'stock': 20, 'descripcion': 'Trilogía fantástica', 'editorial': 3, 'autor': 3},
+]
+
+# Un usuario plantilla por rol: la contraseña se cifra una vez por plantilla
+USUARIOS = [
+    {'username': 'admin', 'email': 'admin@libreria.com', 'first_name': 'Admin', 'last_name': 'Principal', 'is_staff': True, 'is_superuser': True},
+    {'username': 'carlos', 'email': 'carlos@email.com', 'first_name': 'Carlos', 'last_name': 'López', 'is_staff': False, 'is_superuser': False},
+]
+CONTRASENA_USUARIOS = 'password123'
+
+# Orden de borrado: primero las tablas que dependen de otras
+TABLAS_A_LIMPIAR = [
+    ResumenDiaMetodo, ResumenDiaLibro, ResumenDiaGenero, ResumenDiaEditorial, ResumenDiaClientes,
+    DetalleVenta, Venta, Carrito, Libro, Autor, Editorial, Evento, Blog, Cliente,
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Carga el catálogo base de la librería y, opcionalmente, un volumen de datos '
+        'sintéticos deterministas (libros, clientes y ventas) con inserciones masivas'
+    )
+
+    def add_arguments(self, parser):
+        volumen = parser.add_mutually_exclusive_group()
+        volumen.add_argument('--libros', type=int, default=0,
+                             help='Número de libros sintéticos a generar (default: 0)')
+        volumen.add_argument('--escala', choices=sinteticos.ESCALAS,
+                             help='Atajo para --libros: 1k, 100k o 1m')
+        parser.add_argument('--semilla', type=int, default=0,
+                            help='Semilla del generador; la misma semilla produce los mismos datos')
+        parser.add_argument('--lote', type=int, default=sinteticos.LOTE,
+                            help=f'Filas por bulk_create (default: {sinteticos.LOTE})')
+        parser.add_argument('--limpiar', action='store_true',
+                            help='Borra los datos existentes antes de cargar')
+
+    def handle(self, *args, **options):
+        libros = sinteticos.ESCALAS[options['escala']] if options['escala'] else options['libros']
+        if libros < 0 or options['lote'] < 1:
+            raise CommandError('--libros debe ser >= 0 y --lote >= 1')
+
+        inicio = time.perf_counter()
+        if options['limpiar']:
+            self.stdout.write('🧹 Limpiando datos existentes...')
+            self.limpiar()
+        elif Editorial.objects.filter(nombre=EDITORIALES[0]['nombre']).exists():
+            raise CommandError('La base ya tiene datos cargados; use --limpiar para reemplazarlos')
+
+        self.stdout.write('📚 Cargando catálogo base...')
+        self.cargar_base()
+
+        if libros:
+            self.stdout.write(f'🏭 Generando {libros} libros sintéticos (semilla {options["semilla"]})...')
+            marca = [time.perf_counter()]
+
+            def progreso(mensaje):
+                ahora = time.perf_counter()
+                self.stdout.write(f'   {mensaje} ({ahora - marca[0]:.1f} s)')
+                marca[0] = ahora
+
+            filas = sinteticos.generar(libros, options['semilla'], progreso, options['lote'])
+            filas['detalles'] = DetalleVenta.objects.count()
+            self.stdout.write('   ' + ', '.join(f'{tabla}: {total}' for tabla, total in filas.items()))
+        else:
+            busqueda.indexar_libros(Libro.objects.values_list('libroid', flat=True))
+            resumenes.reconstruir()
+            estadisticas.invalidar()
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Datos cargados en {time.perf_counter() - inicio:.1f} s'))
+        self.stdout.write(f'📧 Admin: admin / {CONTRASENA_USUARIOS}')
+        if libros:
+            self.stdout.write(f'👥 Clientes: {sinteticos.PREFIJO_CLIENTE}0000000 ... / {sinteticos.CONTRASENA}')
+
+    def limpiar(self):
+        # DELETE directo por tabla: QuerySet.delete() cargaría cada fila para
+        # resolver cascadas y señales, lo que no escala a millones de filas
+        with transaction.atomic(), connection.cursor() as cursor:
+            for modelo in TABLAS_A_LIMPIAR:
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(modelo._meta.db_table)}')
+            User.objects.filter(is_superuser=False, is_staff=False).delete()
+        busqueda.reconstruir_indice()
+
+    @transaction.atomic
+    def cargar_base(self):
+        editoriales = Editorial.objects.bulk_create([
+            Editorial(direccion='', **datos) for datos in EDITORIALES
+        ])
+        autores = Autor.objects.bulk_create([Autor(**datos) for datos in AUTORES])
+        Libro.objects.bulk_create([
+            Libro(
+                autorid_id=autores[datos['autor']].pk,
+                editorialid_id=editoriales[datos['editorial']].pk,
+                **{campo: valor for campo, valor in datos.items() if campo not in ('autor', 'editorial')}
+            )
+            for datos in LIBROS
+        ])
+
+        # Los usuarios que ya existan (p. ej. el admin tras --limpiar) se conservan
+        existentes = set(User.objects.filter(
+            username__in=[datos['username'] for datos in USUARIOS]
+        ).values_list('username', flat=True))
+        contrasena = make_password(CONTRASENA_USUARIOS)
+        usuarios = User.objects.bulk_create([
+            User(password=contrasena, **datos) for datos in USUARIOS
+            if datos['username'] not in existentes
+        ])
+        Cliente.objects.bulk_create([
+            Cliente(user_id=usuario.pk, nombre=usuario.first_name, apellido=usuario.last_name,
+                    email=usuario.email)
+            for usuario in usuarios if not usuario.is_staff
+        ])
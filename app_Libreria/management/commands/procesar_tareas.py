@@ -0,0 +1,130 @@
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app_Libreria import reservas, tareas, worker
+
+PURGAR_CADA = 3600  # segundos
+BARRER_RESERVAS_CADA = 60
+
+
+class Command(BaseCommand):
+    help = (
+        'Worker de la cola de tareas: reclama las tareas pendientes (miniaturas, '
+        'estadísticas del panel, exportaciones) y las ejecuta en un pool de procesos. '
+        'También borra las reservas de stock vencidas'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=min(4, os.cpu_count() or 1),
+                            help='Procesos del pool; 0 ejecuta las tareas en este mismo proceso')
+        parser.add_argument('--intervalo', type=float, default=1.0,
+                            help='Segundos entre consultas a la cola cuando está vacía (default: 1)')
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Procesa lo pendiente y termina, en lugar de quedarse esperando')
+        parser.add_argument('--tiempo-maximo', type=int, default=tareas.TIEMPO_MAXIMO,
+                            help='Segundos tras los que una tarea EN_CURSO se da por perdida')
+
+    def handle(self, *args, **options):
+        if options['procesos'] < 0 or options['intervalo'] <= 0:
+            raise CommandError('--procesos debe ser >= 0 y --intervalo > 0')
+        self.detener = False
+        self.ultimo_barrido = -BARRER_RESERVAS_CADA
+        signal.signal(signal.SIGTERM, self.pedir_detencion)
+        signal.signal(signal.SIGINT, self.pedir_detencion)
+
+        self.stdout.write(f"Worker iniciado ({options['procesos'] or 'sin'} procesos)")
+        if options['procesos'] == 0:
+            ok, fallidas = self.en_este_proceso(options)
+        else:
+            ok, fallidas = self.con_pool(options)
+        self.stdout.write(self.style.SUCCESS(f'Worker detenido: {ok} tareas completadas, {fallidas} con error'))
+
+    def pedir_detencion(self, *args):
+        # Se terminan las tareas en curso antes de salir
+        self.detener = True
+
+    def mantenimiento(self, options, ultima_purga):
+        perdidas = tareas.recuperar_perdidas(options['tiempo_maximo'])
+        if perdidas:
+            self.stderr.write(f'{perdidas} tareas perdidas devueltas a la cola')
+        ahora = time.monotonic()
+        if ahora - self.ultimo_barrido >= BARRER_RESERVAS_CADA:
+            # Las reservas vencidas ya no cuentan; solo se borran las filas
+            reservas.barrer()
+            self.ultimo_barrido = ahora
+        if ahora - ultima_purga >= PURGAR_CADA:
+            tareas.purgar()
+            return ahora
+        return ultima_purga
+
+    def en_este_proceso(self, options):
+        ok = fallidas = 0
+        ultima_purga = self.mantenimiento(options, -PURGAR_CADA)
+        while not self.detener:
+            reclamadas = tareas.reclamar(1)
+            if not reclamadas:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                ultima_purga = self.mantenimiento(options, ultima_purga)
+                continue
+            if tareas.ejecutar(reclamadas[0]):
+                ok += 1
+            else:
+                fallidas += 1
+        return ok, fallidas
+
+    def con_pool(self, options):
+        procesos = options['procesos']
+        # spawn y no fork: cada proceso abre su propia conexión a SQLite
+        contexto = multiprocessing.get_context('spawn')
+        pool = ProcessPoolExecutor(procesos, mp_context=contexto, initializer=worker.inicializar)
+        en_curso = {}
+        ok = fallidas = 0
+        ultima_purga = self.mantenimiento(options, -PURGAR_CADA)
+        try:
+            while en_curso or not self.detener:
+                if not self.detener and len(en_curso) < procesos:
+                    for tareaid in tareas.reclamar(procesos - len(en_curso)):
+                        en_curso[pool.submit(worker.ejecutar, tareaid)] = tareaid
+
+                if not en_curso:
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+                    ultima_purga = self.mantenimiento(options, ultima_purga)
+                    continue
+
+                terminados, _ = wait(en_curso, timeout=options['intervalo'], return_when=FIRST_COMPLETED)
+                rotas = []
+                for futuro in terminados:
+                    tareaid = en_curso.pop(futuro)
+                    try:
+                        if futuro.result():
+                            ok += 1
+                        else:
+                            fallidas += 1
+                    except BrokenProcessPool:
+                        rotas.append(tareaid)
+                if rotas:
+                    # Un proceso murió (p. ej. sin memoria) y el pool entero
+                    # queda inservible: sus tareas y las demás en curso vuelven
+                    # a la cola ya, en lugar de esperar --tiempo-maximo
+                    rotas += en_curso.values()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    en_curso.clear()
+                    devueltas = tareas.devolver(rotas, 'El proceso del worker terminó inesperadamente')
+                    self.stderr.write(
+                        f'Un proceso del pool terminó inesperadamente; {devueltas} tareas devueltas a la cola'
+                    )
+                    pool = ProcessPoolExecutor(procesos, mp_context=contexto,
+                                               initializer=worker.inicializar)
+        finally:
+            pool.shutdown(wait=True)
+        return ok, fallidas
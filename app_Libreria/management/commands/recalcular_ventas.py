@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app_Libreria import resumenes, servicios
+from app_Libreria.models import Venta
+
+MOSTRAR = 20  # ventas distintas que se listan con --verificar
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula desde sus detalles las líneas, unidades, subtotal, monto y cambio '
+        'de las ventas. Con --verificar solo informa las diferencias y termina con '
+        'error si las hay (útil desde cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('ventas', nargs='*', type=int, help='ventaid a revisar (default: todas)')
+        parser.add_argument('--verificar', action='store_true', help='Compara sin escribir nada')
+        parser.add_argument('--lote', type=int, default=500, help='Ventas por transacción (default: 500)')
+
+    def handle(self, *args, **options):
+        if options['lote'] <= 0:
+            raise CommandError('--lote debe ser mayor a cero')
+        verificar = options['verificar']
+        revisadas = 0
+        distintas = []
+        for venta_ids in self.lotes(options['ventas'], options['lote']):
+            revisadas += len(venta_ids)
+            if verificar:
+                distintas.extend(servicios.recalcular_totales(venta_ids, guardar=False))
+                continue
+            # Un monto corregido cambia los ingresos de los resúmenes diarios
+            with resumenes.actualizando(venta_ids):
+                distintas.extend(servicios.recalcular_totales(venta_ids))
+
+        if not verificar:
+            self.stdout.write(self.style.SUCCESS(
+                f'{revisadas} ventas revisadas, {len(distintas)} corregidas'
+            ))
+            return
+        for venta in distintas[:MOSTRAR]:
+            self.stdout.write(
+                f'Venta #{venta.ventaid}: {venta.num_lineas} líneas, {venta.num_items} unidades, '
+                f'monto esperado ${venta.montototal}'
+            )
+        if distintas:
+            raise CommandError(f'{len(distintas)} de {revisadas} ventas no coinciden con sus detalles')
+        self.stdout.write(self.style.SUCCESS(f'{revisadas} ventas revisadas, todas coinciden'))
+
+    def lotes(self, venta_ids, tamanio):
+        """Los ventaid en lotes, paginando por clave para no cargarlos todos."""
+        ventas = Venta.objects.order_by('ventaid')
+        if venta_ids:
+            ventas = ventas.filter(ventaid__in=venta_ids)
+        ultimo = 0
+        while True:
+            lote = list(ventas.filter(ventaid__gt=ultimo).values_list('ventaid', flat=True)[:tamanio])
+            if not lote:
+                return
+            yield lote
+            ultimo = lote[-1]
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from app_Libreria import estadisticas, resumenes
+
+
+def _fecha(valor):
+    try:
+        fecha = parse_date(valor)
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        raise CommandError(f'Fecha inválida (use AAAA-MM-DD): {valor}')
+    return fecha
+
+
+class Command(BaseCommand):
+    help = (
+        'Rehace los resúmenes diarios de ventas y clientes desde Venta, DetalleVenta y '
+        'Cliente. Se usa para llenarlos la primera vez y tras cargas masivas o cambios hechos con SQL'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=_fecha, help='Primer día a rehacer (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=_fecha, help='Último día a rehacer (AAAA-MM-DD)')
+
+    def handle(self, *args, **options):
+        if options['desde'] and options['hasta'] and options['desde'] > options['hasta']:
+            raise CommandError('--desde no puede ser posterior a --hasta')
+        inicio = time.perf_counter()
+        filas = resumenes.reconstruir(options['desde'], options['hasta'])
+        estadisticas.invalidar()
+        for tabla, total in filas.items():
+            self.stdout.write(f'   {tabla}: {total}')
+        self.stdout.write(self.style.SUCCESS(f'Resúmenes reconstruidos en {time.perf_counter() - inicio:.1f} s'))
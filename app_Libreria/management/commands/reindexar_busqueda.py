@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from app_Libreria import busqueda
+from app_Libreria.models import Libro
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de texto completo de libros'
+
+    def handle(self, *args, **options):
+        if not busqueda.disponible():
+            self.stdout.write(self.style.WARNING('La búsqueda FTS5 solo está disponible en SQLite'))
+            return
+        busqueda.reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f'Índice reconstruido: {Libro.objects.count()} libros'))
@@ -0,0 +1,250 @@
+# app_Libreria/metricas.py
+"""
+Instrumentación por petición: consultas SQL, tiempo en base de datos,
+consultas duplicadas y tiempo de renderizado de plantillas.
+
+MetricasMiddleware instala un execute_wrapper sobre la conexión mientras
+atiende cada petición. Las muestras se guardan en memoria del proceso por
+nombre de URL (ventana de las últimas MUESTRAS_POR_VISTA peticiones), así
+que cada worker lleva su propio histograma.
+"""
+import logging
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+MUESTRAS_POR_VISTA = 500
+# Límites superiores (ms) de los intervalos del histograma; el último es abierto
+INTERVALOS_MS = (10, 25, 50, 100, 250, 500, 1000)
+
+_medicion_actual = ContextVar('medicion_actual', default=None)
+
+
+class Medicion:
+    """Acumula lo ocurrido durante una petición."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_db = 0.0
+        self.tiempo_render = 0.0
+        self.sentencias = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # Firma de connection.execute_wrapper
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempo_db += time.perf_counter() - inicio
+            self.consultas += 1
+            self.sentencias[(sql, _clave_parametros(params, many))] += 1
+
+    @property
+    def duplicadas(self):
+        """Consultas repetidas con el mismo SQL y los mismos parámetros."""
+        return sum(veces - 1 for veces in self.sentencias.values() if veces > 1)
+
+    def mas_repetida(self):
+        if not self.sentencias:
+            return None, 0
+        (sql, _), veces = self.sentencias.most_common(1)[0]
+        return sql, veces
+
+
+def _clave_parametros(params, many):
+    if many or params is None:
+        return None
+    try:
+        return tuple(params) if not isinstance(params, dict) else tuple(sorted(params.items()))
+    except TypeError:
+        return repr(params)
+
+
+# =============================================
+# HISTOGRAMA EN MEMORIA
+# =============================================
+
+_muestras = defaultdict(lambda: deque(maxlen=MUESTRAS_POR_VISTA))
+_candado = threading.Lock()
+
+
+def registrar(vista, total_ms, medicion):
+    with _candado:
+        _muestras[vista].append((
+            total_ms, medicion.consultas, medicion.tiempo_db * 1000,
+            medicion.duplicadas, medicion.tiempo_render * 1000,
+        ))
+
+
+def _percentil(valores, p):
+    # valores debe venir ordenado
+    indice = min(len(valores) - 1, max(0, round(p / 100 * len(valores)) - 1))
+    return valores[indice]
+
+
+def _histograma(tiempos):
+    conteo = [0] * (len(INTERVALOS_MS) + 1)
+    for tiempo in tiempos:
+        for i, limite in enumerate(INTERVALOS_MS):
+            if tiempo <= limite:
+                conteo[i] += 1
+                break
+        else:
+            conteo[-1] += 1
+    return conteo
+
+
+def resumen():
+    """Percentiles, promedios e histograma por vista, de la más lenta a la más rápida."""
+    with _candado:
+        copia = {vista: list(muestras) for vista, muestras in _muestras.items()}
+
+    filas = []
+    for vista, muestras in copia.items():
+        n = len(muestras)
+        tiempos = sorted(muestra[0] for muestra in muestras)
+        filas.append({
+            'vista': vista,
+            'peticiones': n,
+            'p50': _percentil(tiempos, 50),
+            'p95': _percentil(tiempos, 95),
+            'p99': _percentil(tiempos, 99),
+            'consultas': sum(m[1] for m in muestras) / n,
+            'consultas_max': max(m[1] for m in muestras),
+            'tiempo_db': sum(m[2] for m in muestras) / n,
+            'duplicadas': sum(m[3] for m in muestras) / n,
+            'tiempo_render': sum(m[4] for m in muestras) / n,
+            'histograma': _histograma(tiempos),
+        })
+    return sorted(filas, key=lambda fila: fila['p95'], reverse=True)
+
+
+def etiquetas_intervalos():
+    etiquetas = [f'≤{limite}' for limite in INTERVALOS_MS]
+    return etiquetas + [f'>{INTERVALOS_MS[-1]}']
+
+
+def reiniciar():
+    with _candado:
+        _muestras.clear()
+
+
+# =============================================
+# MIDDLEWARE
+# =============================================
+
+def _vista_de(request):
+    coincidencia = getattr(request, 'resolver_match', None)
+    if coincidencia is None or not coincidencia.url_name:
+        return None
+    if not coincidencia.func.__module__.startswith('app_Libreria.'):
+        return None
+    return coincidencia.url_name
+
+
+def _mostrar_cabeceras(request):
+    if settings.DEBUG:
+        return True
+    usuario = getattr(request, 'user', None)
+    return bool(usuario and usuario.is_staff)
+
+
+class MetricasMiddleware:
+    """Mide cada petición a las vistas de app_Libreria y agrega las cabeceras X-DB-*."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.umbral_consultas = getattr(settings, 'LIBRERIA_METRICAS_UMBRAL_CONSULTAS', 50)
+        self.umbral_ms = getattr(settings, 'LIBRERIA_METRICAS_UMBRAL_MS', 500)
+
+    def __call__(self, request):
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            with connection.execute_wrapper(medicion):
+                response = self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        total_ms = (time.perf_counter() - inicio) * 1000
+
+        vista = _vista_de(request)
+        if vista is None:
+            return response
+
+        registrar(vista, total_ms, medicion)
+        self._registrar_log(vista, total_ms, medicion)
+
+        if _mostrar_cabeceras(request):
+            response['X-DB-Consultas'] = str(medicion.consultas)
+            response['X-DB-Duplicadas'] = str(medicion.duplicadas)
+            response['Server-Timing'] = (
+                f'db;dur={medicion.tiempo_db * 1000:.1f}, '
+                f'render;dur={medicion.tiempo_render * 1000:.1f}, '
+                f'total;dur={total_ms:.1f}'
+            )
+        return response
+
+    def _registrar_log(self, vista, total_ms, medicion):
+        datos = {
+            'vista': vista,
+            'total_ms': round(total_ms, 1),
+            'consultas': medicion.consultas,
+            'db_ms': round(medicion.tiempo_db * 1000, 1),
+            'duplicadas': medicion.duplicadas,
+            'render_ms': round(medicion.tiempo_render * 1000, 1),
+        }
+        if medicion.consultas > self.umbral_consultas or total_ms > self.umbral_ms:
+            sql, veces = medicion.mas_repetida()
+            logger.warning(
+                'Petición lenta en %s: %.1f ms, %d consultas (%d duplicadas); '
+                'consulta más repetida (%d veces): %s',
+                vista, total_ms, medicion.consultas, medicion.duplicadas, veces, sql,
+                extra={'metricas': datos},
+            )
+        else:
+            logger.debug('%s: %.1f ms, %d consultas', vista, total_ms,
+                         medicion.consultas, extra={'metricas': datos})
+
+
+# =============================================
+# TIEMPO DE RENDERIZADO
+# =============================================
+
+class _PlantillaMedida:
+    def __init__(self, plantilla):
+        self.plantilla = plantilla
+
+    def __getattr__(self, nombre):
+        return getattr(self.plantilla, nombre)
+
+    def render(self, context=None, request=None):
+        medicion = _medicion_actual.get()
+        if medicion is None:
+            return self.plantilla.render(context, request)
+        inicio = time.perf_counter()
+        try:
+            return self.plantilla.render(context, request)
+        finally:
+            medicion.tiempo_render += time.perf_counter() - inicio
+
+
+class DjangoTemplatesMedidos(DjangoTemplates):
+    """
+    Motor de plantillas de Django que suma al tiempo de renderizado de la
+    petición en curso. Las consultas perezosas evaluadas dentro de la
+    plantilla cuentan tanto en el tiempo de base de datos como en el de render.
+    """
+
+    def from_string(self, template_code):
+        return _PlantillaMedida(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _PlantillaMedida(super().get_template(template_name))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Libreria', '0002_remove_cliente_preferenciasgenero_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cliente',
+            name='preferencias_genero',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['genero', 'precioventa'], name='libro_genero_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['precioventa', 'libroid'], name='libro_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['titulo', 'libroid'], name='libro_titulo_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# Copia fija del esquema de busqueda.py a la fecha de esta migración: si el
+# módulo cambia, las migraciones ya aplicadas deben seguir igual
+TABLA = 'app_Libreria_libro_fts'
+SQL_CREAR = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA} USING fts5("
+    "titulo, autor, editorial, isbn, descripcion, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+SQL_LLENAR = (
+    f'INSERT INTO {TABLA} (rowid, titulo, autor, editorial, isbn, descripcion) '
+    "SELECT l.libroid, l.titulo, a.nombre || ' ' || a.apellido, e.nombre, l.isbn, l.descripcion "
+    'FROM app_Libreria_libro l '
+    'JOIN app_Libreria_autor a ON a.autorid = l.autorid '
+    'JOIN app_Libreria_editorial e ON e.editorialid = l.editorialid'
+)
+SQL_ELIMINAR = f'DROP TABLE IF EXISTS {TABLA}'
+
+
+def crear_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(SQL_CREAR)
+        cursor.execute(SQL_LLENAR)
+
+
+def eliminar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(SQL_ELIMINAR)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Libreria', '0003_indices_catalogo'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
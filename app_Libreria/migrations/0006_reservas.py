@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Libreria', '0005_tareas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reserva',
+            fields=[
+                ('reservaid', models.AutoField(primary_key=True, serialize=False)),
+                ('cantidad', models.IntegerField()),
+                ('expira', models.DateTimeField()),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='app_Libreria.libro')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Reservas',
+                'indexes': [models.Index(fields=['libro', 'expira'], name='reserva_libro_expira_idx'), models.Index(fields=['expira'], name='reserva_expira_idx')],
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'libro'), name='reserva_usuario_libro_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def unir_renglones_repetidos(apps, schema_editor):
+    # Antes de la restricción única: cada par (usuario, libro) repetido queda
+    # en su renglón más antiguo con la suma de las cantidades
+    Carrito = apps.get_model('app_Libreria', 'Carrito')
+    repetidos = (
+        Carrito.objects.values('usuario_id', 'libro_id')
+        .annotate(filas=Count('carritoid'), primero=Min('carritoid'), total=Sum('cantidad'))
+        .filter(filas__gt=1)
+    )
+    for grupo in repetidos:
+        Carrito.objects.filter(carritoid=grupo['primero']).update(cantidad=grupo['total'])
+        Carrito.objects.filter(usuario_id=grupo['usuario_id'], libro_id=grupo['libro_id']).exclude(
+            carritoid=grupo['primero']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Libreria', '0007_venta_clave_idempotencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='carrito',
+            name='usuario',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='venta',
+            name='clienteid',
+            field=models.ForeignKey(db_column='clienteid', db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['-fechapublicacion'], name='blog_activo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['fecha'], name='evento_activo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['libroid'], name='libro_disp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['genero', 'libroid'], name='libro_disp_genero_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['precioventa', 'libroid'], name='libro_disp_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['titulo', 'libroid'], name='libro_disp_titulo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['clienteid', '-fechaventa'], name='venta_cliente_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['fechaventa'], name='venta_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['estadoventa', 'fechaventa'], name='venta_estado_fecha_idx'),
+        ),
+        migrations.RunPython(unir_renglones_repetidos, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='carrito',
+            constraint=models.UniqueConstraint(fields=('usuario', 'libro'), name='carrito_usuario_libro_uniq'),
+        ),
+    ]
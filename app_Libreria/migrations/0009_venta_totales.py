@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:34
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def llenar_totales(apps, schema_editor):
+    # Solo los campos nuevos: montototal puede haberse capturado a mano y no se
+    # toca aquí; `manage.py recalcular_ventas --verificar` muestra las diferencias
+    Venta = apps.get_model('app_Libreria', 'Venta')
+    DetalleVenta = apps.get_model('app_Libreria', 'DetalleVenta')
+    totales = (
+        DetalleVenta.objects.values('ventaid')
+        .annotate(lineas=Count('detalleventaid'), items=Sum('cantidad'), subtotal=Sum('subtotal'))
+        .order_by('ventaid')
+        .iterator(chunk_size=2000)
+    )
+    lote = []
+    for fila in totales:
+        lote.append(Venta(
+            ventaid=fila['ventaid'], num_lineas=fila['lineas'], num_items=fila['items'],
+            subtotal_lineas=fila['subtotal'],
+        ))
+        if len(lote) == 500:
+            Venta.objects.bulk_update(lote, ['num_lineas', 'num_items', 'subtotal_lineas'])
+            lote = []
+    Venta.objects.bulk_update(lote, ['num_lineas', 'num_items', 'subtotal_lineas'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Libreria', '0008_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venta',
+            name='num_items',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='num_lineas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='subtotal_lineas',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(llenar_totales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Libreria', '0009_venta_totales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiaClientes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('nuevos', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Resúmenes diarios de clientes',
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenDiaGenero',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('genero', models.CharField(choices=[('FIC', 'Ficción'), ('ROM', 'Romance'), ('TER', 'Terror'), ('CIE', 'Ciencia Ficción'), ('FAN', 'Fantasía'), ('HIS', 'Histórico'), ('BIO', 'Biografía'), ('INF', 'Infantil')], max_length=100)),
+            ],
+            options={
+                'verbose_name_plural': 'Resúmenes diarios por género',
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'genero'), name='resumen_genero_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenDiaMetodo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('metodopago', models.CharField(choices=[('EFECTIVO', 'Efectivo'), ('TARJETA', 'Tarjeta'), ('TRANSFERENCIA', 'Transferencia')], max_length=50)),
+                ('ventas', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Resúmenes diarios por método de pago',
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'metodopago'), name='resumen_metodo_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenDiaEditorial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('editorial', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='app_Libreria.editorial')),
+            ],
+            options={
+                'verbose_name_plural': 'Resúmenes diarios por editorial',
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'editorial'), name='resumen_editorial_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenDiaLibro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='app_Libreria.libro')),
+            ],
+            options={
+                'verbose_name_plural': 'Resúmenes diarios por libro',
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'libro'), name='resumen_libro_uniq')],
+            },
+        ),
+    ]
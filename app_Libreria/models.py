@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 class Autor(models.Model):
@@ -49,6 +50,20 @@ class Cliente(models.Model):
     def __str__(self):
         return f"{self.nombre} {self.apellido}"
 
+class LibroQuerySet(models.QuerySet):
+    def disponibles(self):
+        return self.filter(stock__gt=0)
+
+    def con_autor(self):
+        return self.select_related('autorid')
+
+    def con_relaciones(self):
+        return self.select_related('autorid', 'editorialid')
+
+    def con_disponibles(self, excepto=None):
+        # Stock menos las reservas vigentes (sin contar las del usuario `excepto`)
+        return self.annotate(disponibles=models.F('stock') - reservado(models.OuterRef('pk'), excepto))
+
 class Libro(models.Model):
     GENEROS = [
         ('FIC', 'Ficción'),
@@ -73,8 +88,22 @@ class Libro(models.Model):
     descripcion = models.TextField(blank=True)
     portada = models.ImageField(upload_to='portadas/', blank=True, null=True)
     
+    objects = LibroQuerySet.as_manager()
+    
     class Meta:
         verbose_name_plural = "Libros"
+        indexes = [
+            # Filtros y órdenes del catálogo (ver catalogo.py)
+            models.Index(fields=['genero', 'precioventa'], name='libro_genero_precio_idx'),
+            models.Index(fields=['precioventa', 'libroid'], name='libro_precio_idx'),
+            models.Index(fields=['titulo', 'libroid'], name='libro_titulo_idx'),
+            # Parciales para el filtro por omisión del catálogo (stock > 0): solo
+            # contienen los libros disponibles y sirven los mismos órdenes
+            models.Index(fields=['libroid'], condition=models.Q(stock__gt=0), name='libro_disp_idx'),
+            models.Index(fields=['genero', 'libroid'], condition=models.Q(stock__gt=0), name='libro_disp_genero_idx'),
+            models.Index(fields=['precioventa', 'libroid'], condition=models.Q(stock__gt=0), name='libro_disp_precio_idx'),
+            models.Index(fields=['titulo', 'libroid'], condition=models.Q(stock__gt=0), name='libro_disp_titulo_idx'),
+        ]
     
     def __str__(self):
         return self.titulo
@@ -83,6 +112,18 @@ class Libro(models.Model):
         return self.stock > 0
 from decimal import Decimal
 
+class VentaQuerySet(models.QuerySet):
+    def de_cliente(self, usuario):
+        return self.filter(clienteid=usuario).order_by('-fechaventa')
+
+    def con_cliente(self):
+        return self.select_related('clienteid')
+
+    def con_detalles(self):
+        return self.prefetch_related(
+            models.Prefetch('detalles', queryset=DetalleVenta.objects.con_libro())
+        )
+
 class Venta(models.Model):
     METODOS_PAGO = [
         ('EFECTIVO', 'Efectivo'),
@@ -97,7 +138,8 @@ class Venta(models.Model):
     ]
     
     ventaid = models.AutoField(primary_key=True)
-    clienteid = models.ForeignKey(User, on_delete=models.CASCADE, db_column='clienteid')
+    # Sin índice propio: lo cubre venta_cliente_fecha_idx
+    clienteid = models.ForeignKey(User, on_delete=models.CASCADE, db_column='clienteid', db_index=False)
     fechaventa = models.DateTimeField(default=timezone.now)
     montototal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     metodopago = models.CharField(max_length=50, choices=METODOS_PAGO)
@@ -105,9 +147,25 @@ class Venta(models.Model):
     descuentoaplicado = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     pagorecibido = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     cambio = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Desnormalizados desde los detalles (ver fijar_totales y
+    # servicios.recalcular_totales); recalcular_ventas los verifica en lote
+    num_lineas = models.PositiveIntegerField(default=0, editable=False)
+    num_items = models.PositiveIntegerField(default=0, editable=False)
+    subtotal_lineas = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    # Clave del formulario de pago que originó la venta (ver servicios.procesar_compra)
+    clave_idempotencia = models.CharField(max_length=64, unique=True, blank=True, null=True, editable=False)
+    
+    objects = VentaQuerySet.as_manager()
     
     class Meta:
         verbose_name_plural = "Ventas"
+        indexes = [
+            # Historial de un cliente (de_cliente) ya ordenado
+            models.Index(fields=['clienteid', '-fechaventa'], name='venta_cliente_fecha_idx'),
+            # Listado del panel y rangos de fechas de exportaciones e indicadores
+            models.Index(fields=['fechaventa'], name='venta_fecha_idx'),
+            models.Index(fields=['estadoventa', 'fechaventa'], name='venta_estado_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"Venta #{self.ventaid} - {self.clienteid.username}"
@@ -121,6 +179,18 @@ class Venta(models.Model):
             self.cambio = Decimal('0.00')
         return self.cambio
 
+    def fijar_totales(self, num_lineas, num_items, subtotal):
+        """Totales a partir de las líneas de detalle: el monto es el subtotal menos el descuento."""
+        self.num_lineas = num_lineas
+        self.num_items = num_items
+        self.subtotal_lineas = subtotal
+        self.montototal = max(subtotal - Decimal(str(self.descuentoaplicado)), Decimal('0.00'))
+        self.calcular_cambio()
+
+class DetalleVentaQuerySet(models.QuerySet):
+    def con_libro(self):
+        return self.select_related('libroid__autorid').order_by('detalleventaid')
+
 class DetalleVenta(models.Model):
     detalleventaid = models.AutoField(primary_key=True)
     ventaid = models.ForeignKey(Venta, on_delete=models.CASCADE, related_name='detalles', db_column='ventaid')
@@ -130,6 +200,8 @@ class DetalleVenta(models.Model):
     iva = models.DecimalField(max_digits=5, decimal_places=2, default=0.16)
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
     
+    objects = DetalleVentaQuerySet.as_manager()
+    
     class Meta:
         verbose_name_plural = "Detalles de Venta"
     
@@ -137,19 +209,89 @@ class DetalleVenta(models.Model):
         self.subtotal = self.cantidad * self.preciounitario
         super().save(*args, **kwargs)
 
+class CarritoQuerySet(models.QuerySet):
+    def de_usuario(self, usuario):
+        return self.filter(usuario=usuario).order_by('carritoid')
+
+    def con_libro(self):
+        return self.select_related('libro__autorid')
+
+    def con_subtotal(self):
+        # Precio por cantidad calculado en la base, sin cargar cada libro
+        return self.annotate(subtotal_linea=models.ExpressionWrapper(
+            models.F('cantidad') * models.F('libro__precioventa'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ))
+
+    def con_disponibles(self):
+        # Unidades que el dueño de cada renglón puede comprar (ver Reserva)
+        return self.annotate(disponibles=models.F('libro__stock') - reservado(
+            models.OuterRef('libro_id'), models.OuterRef('usuario_id')
+        ))
+
 class Carrito(models.Model):
     carritoid = models.AutoField(primary_key=True)
-    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Sin índice propio: lo cubre carrito_usuario_libro_uniq
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     libro = models.ForeignKey(Libro, on_delete=models.CASCADE)
     cantidad = models.IntegerField(default=1)
     fechaagregado = models.DateTimeField(default=timezone.now)
     
+    objects = CarritoQuerySet.as_manager()
+    
     class Meta:
         verbose_name_plural = "Carritos"
+        constraints = [
+            # Un renglón por libro: dos altas simultáneas no pueden duplicarlo
+            models.UniqueConstraint(fields=['usuario', 'libro'], name='carrito_usuario_libro_uniq'),
+        ]
     
     def subtotal(self):
         return Decimal(str(self.libro.precioventa)) * self.cantidad
 
+class ReservaQuerySet(models.QuerySet):
+    def vigentes(self):
+        return self.filter(expira__gt=timezone.now())
+
+class Reserva(models.Model):
+    """Unidades de un libro apartadas para el carrito de un cliente (ver reservas.py)."""
+    reservaid = models.AutoField(primary_key=True)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reservas')
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='reservas')
+    cantidad = models.IntegerField()
+    expira = models.DateTimeField()
+    
+    objects = ReservaQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name_plural = "Reservas"
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'libro'], name='reserva_usuario_libro_uniq'),
+        ]
+        indexes = [
+            # Suma de las reservas vigentes de un libro
+            models.Index(fields=['libro', 'expira'], name='reserva_libro_expira_idx'),
+            models.Index(fields=['expira'], name='reserva_expira_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.cantidad} x {self.libro_id} para {self.usuario_id}"
+
+def reservado(libro, excepto=None):
+    """
+    Subconsulta con las unidades de `libro` en reservas vigentes, sin contar
+    las de `excepto` (un usuario o un OuterRef). Nunca es NULL.
+    """
+    reservas = Reserva.objects.vigentes().filter(libro=libro)
+    if excepto is not None:
+        reservas = reservas.exclude(usuario=excepto)
+    return Coalesce(
+        models.Subquery(
+            reservas.order_by().values('libro').annotate(total=models.Sum('cantidad')).values('total')
+        ),
+        0,
+    )
+
 # Agregar modelos faltantes
 class Evento(models.Model):
     eventoid = models.AutoField(primary_key=True)
@@ -160,6 +302,13 @@ class Evento(models.Model):
     imagen = models.ImageField(upload_to='eventos/', blank=True, null=True)
     activo = models.BooleanField(default=True)
     
+    class Meta:
+        indexes = [
+            # Parcial: Django filtra activo=True como "WHERE activo", que no usa
+            # un índice sobre la columna pero sí uno con esa misma condición
+            models.Index(fields=['fecha'], condition=models.Q(activo=True), name='evento_activo_fecha_idx'),
+        ]
+    
     def __str__(self):
         return self.titulo
 
@@ -172,6 +321,108 @@ class Blog(models.Model):
     imagen = models.ImageField(upload_to='blog/', blank=True, null=True)
     activo = models.BooleanField(default=True)
     
+    class Meta:
+        indexes = [
+            # Parcial por la misma razón que evento_activo_fecha_idx
+            models.Index(fields=['-fechapublicacion'], condition=models.Q(activo=True), name='blog_activo_fecha_idx'),
+        ]
+    
     def __str__(self):
         return self.titulo
-    
\ No newline at end of file
+    
+class TareaQuerySet(models.QuerySet):
+    def pendientes(self):
+        return self.filter(estado='PENDIENTE', ejecutar_despues__lte=timezone.now())
+
+class Tarea(models.Model):
+    """Trabajo diferido que ejecuta el comando procesar_tareas (ver tareas.py)."""
+    ESTADOS = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_CURSO', 'En curso'),
+        ('COMPLETADA', 'Completada'),
+        ('FALLIDA', 'Fallida'),
+    ]
+    
+    tareaid = models.AutoField(primary_key=True)
+    nombre = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=list, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='PENDIENTE')
+    intentos = models.IntegerField(default=0)
+    max_intentos = models.IntegerField(default=3)
+    ejecutar_despues = models.DateTimeField(default=timezone.now)
+    creada = models.DateTimeField(default=timezone.now)
+    iniciada = models.DateTimeField(blank=True, null=True)
+    terminada = models.DateTimeField(blank=True, null=True)
+    resultado = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    
+    objects = TareaQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name_plural = "Tareas"
+        indexes = [
+            # El worker busca las pendientes cuya hora ya llegó
+            models.Index(fields=['estado', 'ejecutar_despues'], name='tarea_estado_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.nombre} #{self.tareaid} ({self.estado})"
+
+# =============================================
+# RESÚMENES DIARIOS DE VENTAS (ver resumenes.py)
+# =============================================
+
+class ResumenDia(models.Model):
+    """Totales de un día de ventas COMPLETADAS; cada subclase los separa por una dimensión."""
+    fecha = models.DateField()
+    unidades = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        abstract = True
+
+class ResumenDiaMetodo(ResumenDia):
+    metodopago = models.CharField(max_length=50, choices=Venta.METODOS_PAGO)
+    ventas = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name_plural = "Resúmenes diarios por método de pago"
+        constraints = [
+            # También es el índice de las consultas por rango de fechas
+            models.UniqueConstraint(fields=['fecha', 'metodopago'], name='resumen_metodo_uniq'),
+        ]
+
+class ResumenDiaLibro(ResumenDia):
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='resumenes')
+    
+    class Meta:
+        verbose_name_plural = "Resúmenes diarios por libro"
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'libro'], name='resumen_libro_uniq'),
+        ]
+
+class ResumenDiaGenero(ResumenDia):
+    genero = models.CharField(max_length=100, choices=Libro.GENEROS)
+    
+    class Meta:
+        verbose_name_plural = "Resúmenes diarios por género"
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'genero'], name='resumen_genero_uniq'),
+        ]
+
+class ResumenDiaEditorial(ResumenDia):
+    editorial = models.ForeignKey(Editorial, on_delete=models.CASCADE, related_name='resumenes')
+    
+    class Meta:
+        verbose_name_plural = "Resúmenes diarios por editorial"
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'editorial'], name='resumen_editorial_uniq'),
+        ]
+
+class ResumenDiaClientes(models.Model):
+    """Clientes registrados por día."""
+    fecha = models.DateField(unique=True)
+    nuevos = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name_plural = "Resúmenes diarios de clientes"
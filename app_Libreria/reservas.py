@@ -0,0 +1,107 @@
+# app_Libreria/reservas.py
+"""
+Reservas de stock para los carritos de los clientes.
+
+Cuando un cliente agrega un libro, las unidades quedan apartadas durante
+LIBRERIA_RESERVA_MINUTOS; mientras tanto nadie más puede comprarlas ni
+agregarlas a su carrito. Las unidades disponibles para un usuario son el
+stock menos las reservas vigentes de los demás, calculado en una sola
+consulta (LibroQuerySet.con_disponibles). Al comprar, procesar_compra
+descuenta el stock y borra las reservas en la misma transacción.
+
+Las reservas vencidas dejan de contar en cuanto vencen; barrer() solo borra
+las filas y lo llama el worker (procesar_tareas) o el comando
+barrer_reservas desde cron.
+
+Los carritos de visitantes anónimos no reservan: cualquiera podría apartar
+todo el catálogo sin una cuenta. Se validan contra las unidades disponibles
+y reservan al iniciar sesión (ver carrito.fusionar).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Carrito, Libro, Reserva
+from .servicios import StockInsuficiente
+
+
+def vencimiento():
+    return timezone.now() + timedelta(minutes=getattr(settings, 'LIBRERIA_RESERVA_MINUTOS', 15))
+
+
+def disponibles(libro_ids, excepto=None):
+    """{libroid: unidades disponibles} para `excepto` (o para un anónimo) en una consulta."""
+    return dict(
+        Libro.objects.filter(libroid__in=libro_ids).con_disponibles(excepto)
+        .values_list('libroid', 'disponibles')
+    )
+
+
+def verificar(libro, cantidad, usuario=None):
+    """Lanza StockInsuficiente si `cantidad` supera lo disponible para `usuario`."""
+    if cantidad > libro.stock:
+        # Sin consultar: ni sin reservas alcanzaría
+        raise StockInsuficiente(libro, libro.stock)
+    disponible = disponibles([libro.libroid], usuario).get(libro.libroid, 0)
+    if cantidad > disponible:
+        raise StockInsuficiente(libro, max(disponible, 0))
+
+
+@transaction.atomic
+def reservar(usuario, libro, cantidad):
+    """
+    Fija la reserva de `usuario` sobre `libro` en `cantidad` unidades y
+    renueva su vencimiento. La reserva se escribe antes de comprobar el
+    stock: en SQLite la escritura toma el bloqueo de la base y en otros
+    motores se bloquea la fila del libro, así que dos clientes nunca reservan
+    a la vez las mismas unidades. Si no alcanza, se revierte y se lanza
+    StockInsuficiente.
+    """
+    if connection.features.has_select_for_update:
+        list(Libro.objects.select_for_update().filter(libroid=libro.libroid).values_list('libroid'))
+    expira = vencimiento()
+    if not Reserva.objects.filter(usuario=usuario, libro=libro).update(cantidad=cantidad, expira=expira):
+        Reserva.objects.create(usuario=usuario, libro=libro, cantidad=cantidad, expira=expira)
+    verificar(libro, cantidad, usuario)
+
+
+def liberar(usuario, libro_id):
+    Reserva.objects.filter(usuario=usuario, libro_id=libro_id).delete()
+
+
+def renovar(usuario):
+    """
+    Extiende las reservas vigentes de un cliente que sigue activo en su
+    carrito. Si vencieron algunas (el cliente volvió después de
+    LIBRERIA_RESERVA_MINUTOS), vuelve a reservar el carrito entero hasta lo
+    que esté disponible. Devuelve cuántas reservas renovó.
+    """
+    renovadas = Reserva.objects.vigentes().filter(usuario=usuario).update(expira=vencimiento())
+    if renovadas < Carrito.objects.filter(usuario=usuario).count():
+        reservar_carrito(usuario)
+    return renovadas
+
+
+@transaction.atomic
+def reservar_carrito(usuario):
+    """
+    Vuelve a reservar todo el carrito de `usuario` (tras fusionar el de la
+    cookie), cada renglón hasta lo que esté disponible. Son dos escrituras
+    masivas sin importar el número de renglones.
+    """
+    lineas = dict(Carrito.objects.filter(usuario=usuario).values_list('libro_id', 'cantidad'))
+    libres = disponibles(lineas, usuario)
+    expira = vencimiento()
+    Reserva.objects.filter(usuario=usuario).delete()
+    Reserva.objects.bulk_create([
+        Reserva(usuario=usuario, libro_id=libro_id, cantidad=min(cantidad, libres[libro_id]), expira=expira)
+        for libro_id, cantidad in lineas.items()
+        if libres.get(libro_id, 0) > 0
+    ])
+
+
+def barrer():
+    """Borra las reservas vencidas. Devuelve cuántas borró."""
+    return Reserva.objects.filter(expira__lte=timezone.now()).delete()[0]
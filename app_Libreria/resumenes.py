@@ -0,0 +1,261 @@
+# app_Libreria/resumenes.py
+"""
+Resúmenes diarios de ventas para los reportes y el panel.
+
+Las tablas ResumenDia* guardan, por día y por método de pago, libro, género
+o editorial, las unidades y los ingresos de las ventas COMPLETADAS;
+ResumenDiaClientes cuenta los clientes registrados por día. Un reporte de un
+año lee unos cientos de filas en lugar de recorrer Venta y DetalleVenta.
+
+Se mantienen de forma incremental, en la misma transacción que la venta:
+sumar() al completarla (procesar_compra, registrar_venta), quitar() antes de
+cancelarla (cancelar_ventas) y actualizando() alrededor de cualquier otro
+cambio a una venta o a sus detalles. Las dos leen el estado actual de las
+ventas, así que solo cuentan las COMPLETADAS. Cada tabla se actualiza con un
+INSERT ... ON CONFLICT DO UPDATE (SQLite 3.24+ o PostgreSQL) por lote.
+
+Los ingresos por método son el montototal (con descuento); los de libro,
+género y editorial, los subtotales de las líneas. El género y la editorial
+son los actuales del libro, igual que en quitar() y reconstruir(): si
+cambian, reclasificar_libro() (desde las señales de Libro y desde la
+importación, que usa bulk_create) mueve su aporte de todos los días al
+grupo nuevo.
+
+Lo que no pasa por aquí (bulk_create de sinteticos, SQL a mano, borrar un
+libro con ventas) se corrige con `manage.py reconstruir_resumenes`.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import (
+    Cliente, DetalleVenta, Libro, ResumenDiaClientes, ResumenDiaEditorial, ResumenDiaGenero, ResumenDiaLibro,
+    ResumenDiaMetodo, Venta,
+)
+
+# Filas por executemany
+LOTE = 1000
+DIAS_REPORTE = 365
+# Rango máximo que aceptan el reporte y la analítica
+MAX_DIAS_REPORTE = 5 * DIAS_REPORTE
+LIMITE_REPORTE = 10
+
+TABLAS = (ResumenDiaMetodo, ResumenDiaLibro, ResumenDiaGenero, ResumenDiaEditorial, ResumenDiaClientes)
+
+
+def inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def _sumar_filas(modelo, claves, valores, filas):
+    """
+    Suma `filas` (tuplas con las claves y luego los valores) a la tabla de
+    `modelo`: las claves nuevas se insertan y a las existentes se les suman
+    los valores. `claves` debe ser la restricción única de la tabla.
+    """
+    nombre = connection.ops.quote_name
+    tabla = nombre(modelo._meta.db_table)
+    campos = [modelo._meta.get_field(campo) for campo in (*claves, *valores)]
+    columnas = [nombre(campo.column) for campo in campos]
+    sumas = ', '.join(f'{c} = {tabla}.{c} + excluded.{c}' for c in columnas[len(claves):])
+    sql = (
+        f'INSERT INTO {tabla} ({", ".join(columnas)}) VALUES ({", ".join(["%s"] * len(columnas))}) '
+        f'ON CONFLICT ({", ".join(columnas[:len(claves)])}) DO UPDATE SET {sumas}'
+    )
+    filas = iter(filas)
+    with connection.cursor() as cursor:
+        while lote := list(islice(filas, LOTE)):
+            cursor.executemany(sql, [
+                [campo.get_db_prep_save(valor, connection) for campo, valor in zip(campos, fila)]
+                for fila in lote
+            ])
+
+
+def _aplicar(ventas, signo):
+    """
+    Suma (signo=1) o resta (signo=-1) a los resúmenes el aporte de las ventas
+    COMPLETADAS de `ventas`: dos consultas agregadas y una escritura por
+    tabla, sin importar cuántas ventas o líneas sean.
+    """
+    completadas = ventas.filter(estadoventa='COMPLETADA')
+    _sumar_filas(ResumenDiaMetodo, ('fecha', 'metodopago'), ('ventas', 'unidades', 'ingresos'), (
+        (fila['fecha'], fila['metodopago'], signo * fila['ventas'], signo * fila['unidades'],
+         signo * fila['ingresos'])
+        for fila in completadas.annotate(fecha=TruncDate('fechaventa'))
+        .values('fecha', 'metodopago')
+        .annotate(ventas=Count('ventaid'), unidades=Sum('num_items'), ingresos=Sum('montototal'))
+        .order_by()
+    ))
+
+    # Género y editorial dependen del libro: se acumulan en Python mientras
+    # las filas por libro se escriben
+    lineas = (
+        DetalleVenta.objects.filter(ventaid__in=completadas.values('ventaid'))
+        .values(
+            fecha=TruncDate('ventaid__fechaventa'), libro=F('libroid'),
+            genero=F('libroid__genero'), editorial=F('libroid__editorialid'),
+        )
+        .annotate(unidades=Sum('cantidad'), ingresos=Sum('subtotal'))
+        .order_by()
+    )
+    generos = defaultdict(lambda: [0, Decimal('0.00')])
+    editoriales = defaultdict(lambda: [0, Decimal('0.00')])
+
+    def por_libro():
+        for fila in lineas.iterator(chunk_size=LOTE):
+            unidades, ingresos = signo * fila['unidades'], signo * fila['ingresos']
+            for totales in (generos[fila['fecha'], fila['genero']], editoriales[fila['fecha'], fila['editorial']]):
+                totales[0] += unidades
+                totales[1] += ingresos
+            yield fila['fecha'], fila['libro'], unidades, ingresos
+
+    _sumar_filas(ResumenDiaLibro, ('fecha', 'libro'), ('unidades', 'ingresos'), por_libro())
+    _sumar_filas(ResumenDiaGenero, ('fecha', 'genero'), ('unidades', 'ingresos'),
+                 (clave + tuple(totales) for clave, totales in generos.items()))
+    _sumar_filas(ResumenDiaEditorial, ('fecha', 'editorial'), ('unidades', 'ingresos'),
+                 (clave + tuple(totales) for clave, totales in editoriales.items()))
+
+
+def sumar(venta_ids):
+    """Agrega a los resúmenes las ventas recién completadas."""
+    _aplicar(Venta.objects.filter(ventaid__in=venta_ids), 1)
+
+
+def quitar(venta_ids):
+    """Resta de los resúmenes las ventas antes de cancelarlas o borrarlas."""
+    _aplicar(Venta.objects.filter(ventaid__in=venta_ids), -1)
+
+
+@contextmanager
+def actualizando(venta_ids):
+    """
+    Para cambios arbitrarios a ventas o sus detalles: resta su aporte, deja
+    hacer el cambio y suma el nuevo, todo en una transacción.
+    """
+    venta_ids = list(venta_ids)
+    with transaction.atomic():
+        quitar(venta_ids)
+        yield
+        sumar(venta_ids)
+
+
+def reclasificar_libro(libro_id, anterior, actual):
+    """
+    Mueve lo que el libro aportó a ResumenDiaGenero y ResumenDiaEditorial de
+    `anterior` a `actual`, ambos (genero, editorial_id). Sus filas de
+    ResumenDiaLibro dicen cuánto vendió cada día.
+    """
+    dias = list(ResumenDiaLibro.objects.filter(libro_id=libro_id).values_list('fecha', 'unidades', 'ingresos'))
+    for modelo, clave, viejo, nuevo in (
+        (ResumenDiaGenero, 'genero', anterior[0], actual[0]),
+        (ResumenDiaEditorial, 'editorial', anterior[1], actual[1]),
+    ):
+        if viejo == nuevo:
+            continue
+        _sumar_filas(modelo, ('fecha', clave), ('unidades', 'ingresos'), (
+            fila
+            for fecha, unidades, ingresos in dias
+            for fila in ((fecha, viejo, -unidades, -ingresos), (fecha, nuevo, unidades, ingresos))
+        ))
+
+
+def contar_cliente(fecharegistro, signo=1):
+    _sumar_filas(ResumenDiaClientes, ('fecha',), ('nuevos',), [(timezone.localdate(fecharegistro), signo)])
+
+
+@transaction.atomic
+def reconstruir(desde=None, hasta=None):
+    """
+    Rehace los resúmenes de los días [desde, hasta] (todos si se omiten) a
+    partir de Venta, DetalleVenta y Cliente. Devuelve las filas por tabla.
+    """
+    dias, ventas, clientes = {}, Venta.objects.all(), Cliente.objects.all()
+    if desde:
+        dias['fecha__gte'] = desde
+        ventas = ventas.filter(fechaventa__gte=inicio_del_dia(desde))
+        clientes = clientes.filter(fecharegistro__gte=inicio_del_dia(desde))
+    if hasta:
+        dias['fecha__lte'] = hasta
+        ventas = ventas.filter(fechaventa__lt=inicio_del_dia(hasta + timedelta(days=1)))
+        clientes = clientes.filter(fecharegistro__lt=inicio_del_dia(hasta + timedelta(days=1)))
+    for modelo in TABLAS:
+        modelo.objects.filter(**dias).delete()
+
+    _aplicar(ventas, 1)
+    _sumar_filas(ResumenDiaClientes, ('fecha',), ('nuevos',), (
+        (fila['fecha'], fila['nuevos'])
+        for fila in clientes.annotate(fecha=TruncDate('fecharegistro'))
+        .values('fecha').annotate(nuevos=Count('clienteid')).order_by()
+    ))
+    return {modelo._meta.verbose_name_plural: modelo.objects.filter(**dias).count() for modelo in TABLAS}
+
+
+# =============================================
+# CONSULTAS PARA REPORTES
+# =============================================
+
+def _totales(resumenes, *campos):
+    return resumenes.values(*campos).annotate(unidades=Sum('unidades'), ingresos=Sum('ingresos')).order_by()
+
+
+def por_dia(desde):
+    """Ventas e ingresos de cada día desde `desde`, para la gráfica del panel."""
+    return list(
+        ResumenDiaMetodo.objects.filter(fecha__gte=desde)
+        .values(dia=F('fecha'))
+        .annotate(ventas=Sum('ventas'), ingresos=Sum('ingresos'))
+        .filter(ventas__gt=0)
+        .order_by('dia')
+    )
+
+
+def por_metodo(**rango):
+    metodos = dict(Venta.METODOS_PAGO)
+    return [
+        {**fila, 'nombre': metodos.get(fila['metodopago'], fila['metodopago'])}
+        for fila in _totales(ResumenDiaMetodo.objects.filter(**rango), 'metodopago')
+        .annotate(ventas=Sum('ventas')).filter(ventas__gt=0).order_by('-ingresos')
+    ]
+
+
+def por_genero(**rango):
+    generos = dict(Libro.GENEROS)
+    return [
+        {**fila, 'nombre': generos.get(fila['genero'], fila['genero'])}
+        for fila in _totales(ResumenDiaGenero.objects.filter(**rango), 'genero')
+        .filter(unidades__gt=0).order_by('-ingresos')
+    ]
+
+
+def reporte(desde, hasta, limite=LIMITE_REPORTE):
+    """Indicadores de los días [desde, hasta] leyendo solo los resúmenes."""
+    rango = {'fecha__gte': desde, 'fecha__lte': hasta}
+    metodos = ResumenDiaMetodo.objects.filter(**rango)
+    return {
+        'desde': desde,
+        'hasta': hasta,
+        'totales': metodos.aggregate(ventas=Sum('ventas'), unidades=Sum('unidades'), ingresos=Sum('ingresos')),
+        'clientes_nuevos': ResumenDiaClientes.objects.filter(**rango).aggregate(total=Sum('nuevos'))['total'] or 0,
+        'por_mes': list(
+            metodos.values(mes=TruncMonth('fecha'))
+            .annotate(ventas=Sum('ventas'), unidades=Sum('unidades'), ingresos=Sum('ingresos'))
+            .filter(ventas__gt=0).order_by('mes')
+        ),
+        'por_metodo': por_metodo(**rango),
+        'por_genero': por_genero(**rango),
+        'libros': list(
+            _totales(ResumenDiaLibro.objects.filter(**rango), 'libro', 'libro__titulo')
+            .filter(unidades__gt=0).order_by('-ingresos')[:limite]
+        ),
+        'editoriales': list(
+            _totales(ResumenDiaEditorial.objects.filter(**rango), 'editorial', 'editorial__nombre')
+            .filter(unidades__gt=0).order_by('-ingresos')[:limite]
+        ),
+    }
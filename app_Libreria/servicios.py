@@ -0,0 +1,353 @@
+# app_Libreria/servicios.py
+"""
+Servicios de venta que modifican stock: compras, ventas del panel y
+cancelaciones; y los totales desnormalizados de cada venta.
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+
+from . import estadisticas, resumenes
+from .models import Carrito, DetalleVenta, Libro, Reserva, Venta
+
+# Títulos por sentencia UPDATE; cada título usa cuatro parámetros y SQLite
+# admite como máximo 999 por consulta.
+LOTE_STOCK = 150
+
+# Campos de Venta que fija Venta.fijar_totales
+CAMPOS_TOTALES = ('num_lineas', 'num_items', 'subtotal_lineas', 'montototal', 'cambio')
+SIN_LINEAS = (0, 0, Decimal('0.00'))
+
+
+class ErrorVenta(Exception):
+    """Error de negocio al registrar una venta; el mensaje se muestra al usuario."""
+
+
+class StockInsuficiente(ErrorVenta):
+    def __init__(self, libro, disponible):
+        self.libro = libro
+        self.disponible = disponible
+        super().__init__(
+            f'No hay suficiente stock de "{libro.titulo}". Disponible: {disponible}'
+        )
+
+
+def _lotes(elementos, tamanio=LOTE_STOCK):
+    elementos = list(elementos)
+    for inicio in range(0, len(elementos), tamanio):
+        yield elementos[inicio:inicio + tamanio]
+
+
+def descontar_stock(cantidades, comprador=None):
+    """
+    Descuenta stock con un UPDATE condicional por lote de títulos.
+
+    `cantidades` es un diccionario {libroid: cantidad}. Solo se actualizan
+    las filas cuyas unidades disponibles (stock menos las reservas vigentes
+    de otros usuarios que no son `comprador`) alcanzan; si alguna no alcanza
+    se lanza StockInsuficiente y la transacción que envuelve la llamada se
+    revierte. Debe llamarse dentro de transaction.atomic().
+    """
+    for lote in _lotes(cantidades.items()):
+        ids = [libroid for libroid, _ in lote]
+        pedido = Case(
+            *[When(libroid=libroid, then=Value(cantidad)) for libroid, cantidad in lote],
+            output_field=IntegerField(),
+        )
+        actualizados = (
+            Libro.objects.con_disponibles(comprador)
+            .filter(libroid__in=ids, disponibles__gte=pedido)
+            .update(stock=F('stock') - pedido)
+        )
+        if actualizados != len(lote):
+            _lanzar_stock_insuficiente(dict(lote), comprador)
+
+
+def restaurar_stock(cantidades):
+    """Devuelve al stock las cantidades {libroid: cantidad} con un UPDATE por lote."""
+    for lote in _lotes(cantidades.items()):
+        devolucion = Case(
+            *[When(libroid=libroid, then=Value(cantidad)) for libroid, cantidad in lote],
+            output_field=IntegerField(),
+        )
+        Libro.objects.filter(libroid__in=[libroid for libroid, _ in lote]).update(
+            stock=F('stock') + devolucion
+        )
+
+
+def _lanzar_stock_insuficiente(cantidades, comprador=None):
+    # Solo se llega aquí cuando falla la compra: se relee el stock para el mensaje
+    for libro in Libro.objects.filter(libroid__in=cantidades).con_disponibles(comprador).order_by('libroid'):
+        if libro.disponibles < cantidades[libro.libroid]:
+            raise StockInsuficiente(libro, max(libro.disponibles, 0))
+    raise ErrorVenta('Uno de los libros ya no está disponible')
+
+
+def validar_pago(metodo_pago, pago_recibido, total):
+    if metodo_pago not in dict(Venta.METODOS_PAGO):
+        raise ErrorVenta('Debes seleccionar un método de pago')
+    if metodo_pago == 'EFECTIVO':
+        if pago_recibido <= Decimal('0.00'):
+            raise ErrorVenta('Para pago en efectivo, debes ingresar la cantidad recibida')
+        if pago_recibido < total:
+            raise ErrorVenta(
+                f'Pago insuficiente. Total: ${total:.2f}, Recibido: ${pago_recibido:.2f}'
+            )
+
+
+def venta_con_clave(usuario, clave):
+    """Venta de `usuario` creada con la clave de idempotencia `clave`, o None."""
+    if not clave:
+        return None
+    return Venta.objects.filter(clienteid=usuario, clave_idempotencia=clave).first()
+
+
+def procesar_compra(usuario, metodo_pago, pago_recibido=Decimal('0.00'), clave=None):
+    """
+    Convierte el carrito del usuario en una venta COMPLETADA.
+
+    `clave` es la clave de idempotencia del formulario de pago: si ya hay una
+    venta del usuario con esa clave (doble clic, reintento del navegador o
+    del balanceador) se devuelve esa venta, marcada con repetida=True, sin
+    volver a ejecutar nada. Si dos envíos llegan a la vez, la restricción
+    UNIQUE deja pasar solo uno y el otro devuelve la venta del primero.
+    """
+    try:
+        return _procesar_compra(usuario, metodo_pago, pago_recibido, clave)
+    except IntegrityError:
+        venta = venta_con_clave(usuario, clave)
+        if venta is None:
+            raise
+        venta.repetida = True
+        return venta
+
+
+@transaction.atomic
+def _procesar_compra(usuario, metodo_pago, pago_recibido, clave):
+    """
+    Todo ocurre en una transacción: el stock se descuenta con UPDATE
+    condicionales (nunca queda negativo aunque haya compras simultáneas, ni
+    toma unidades reservadas por otros clientes), los detalles se insertan
+    con bulk_create y el carrito y las reservas del usuario se borran. Ante
+    cualquier error se revierte la venta completa.
+    """
+    # Dentro de la transacción: un envío repetido que esperó al primero lo ve
+    venta = venta_con_clave(usuario, clave)
+    if venta is not None:
+        venta.repetida = True
+        return venta
+
+    items = list(Carrito.objects.de_usuario(usuario).select_related('libro').con_disponibles())
+    if not items:
+        raise ErrorVenta('Tu carrito está vacío')
+
+    for item in items:
+        if item.cantidad > item.disponibles:
+            raise StockInsuficiente(item.libro, max(item.disponibles, 0))
+
+    total = sum((item.libro.precioventa * item.cantidad for item in items), Decimal('0.00'))
+    validar_pago(metodo_pago, pago_recibido, total)
+
+    venta = Venta(
+        clienteid=usuario,
+        metodopago=metodo_pago,
+        pagorecibido=pago_recibido,
+        estadoventa='COMPLETADA',
+        clave_idempotencia=clave or None,
+    )
+    venta.fijar_totales(len(items), sum(item.cantidad for item in items), total)
+    venta.save()
+
+    cantidades = {}
+    for item in items:
+        cantidades[item.libro_id] = cantidades.get(item.libro_id, 0) + item.cantidad
+    descontar_stock(cantidades, usuario)
+
+    # bulk_create no llama a save(), por eso el subtotal se calcula aquí
+    DetalleVenta.objects.bulk_create([
+        DetalleVenta(
+            ventaid=venta,
+            libroid=item.libro,
+            cantidad=item.cantidad,
+            preciounitario=item.libro.precioventa,
+            subtotal=item.libro.precioventa * item.cantidad,
+        )
+        for item in items
+    ])
+
+    resumenes.sumar([venta.ventaid])
+
+    Carrito.objects.filter(carritoid__in=[item.carritoid for item in items]).delete()
+    # Las unidades reservadas ya son parte de la venta
+    Reserva.objects.filter(usuario=usuario).delete()
+    venta.repetida = False
+    return venta
+
+
+def leer_lineas(libros_ids, cantidades):
+    """
+    Convierte las listas libros[] y cantidades[] del formulario en
+    {libroid: cantidad}, sumando las líneas repetidas de un mismo libro.
+    """
+    lineas = {}
+    for libro_id, cantidad in zip(libros_ids, cantidades):
+        if not str(libro_id).strip():
+            continue
+        try:
+            libro_id, cantidad = int(libro_id), int(cantidad)
+        except (TypeError, ValueError):
+            raise ErrorVenta(f'Línea inválida: libro "{libro_id}", cantidad "{cantidad}"')
+        if cantidad <= 0:
+            raise ErrorVenta('Las cantidades deben ser mayores a cero')
+        lineas[libro_id] = lineas.get(libro_id, 0) + cantidad
+    return lineas
+
+
+@transaction.atomic
+def registrar_venta(cliente_id, metodo_pago, lineas, descuento=Decimal('0.00'),
+                    pago_recibido=Decimal('0.00')):
+    """
+    Registra una venta capturada desde el panel de administración.
+
+    `lineas` es {libroid: cantidad} (ver leer_lineas). Los precios y el
+    total se calculan con los datos de la base, nunca con los enviados por
+    el navegador. Todos los libros se validan en una sola consulta y la
+    venta se escribe completa o no se escribe: el número de consultas no
+    depende de la cantidad de líneas.
+    """
+    if metodo_pago not in dict(Venta.METODOS_PAGO):
+        raise ErrorVenta('Método de pago no válido')
+    if descuento < 0 or pago_recibido < 0:
+        raise ErrorVenta('Los valores no pueden ser negativos')
+    if not lineas:
+        raise ErrorVenta('Debes agregar al menos un libro a la venta')
+    if not User.objects.filter(id=cliente_id, is_staff=False).exists():
+        raise ErrorVenta('Cliente no válido o no encontrado')
+
+    # Las unidades reservadas en carritos de la tienda en línea no se venden
+    libros = Libro.objects.con_disponibles().in_bulk(list(lineas))
+    faltantes = sorted(set(lineas) - set(libros))
+    if faltantes:
+        raise ErrorVenta(f'Los libros con ID {", ".join(map(str, faltantes))} no existen')
+    for libroid, cantidad in lineas.items():
+        if cantidad > libros[libroid].disponibles:
+            raise StockInsuficiente(libros[libroid], max(libros[libroid].disponibles, 0))
+
+    subtotal = sum(
+        (libros[libroid].precioventa * cantidad for libroid, cantidad in lineas.items()),
+        Decimal('0.00'),
+    )
+    total = max(subtotal - descuento, Decimal('0.00'))
+    if metodo_pago == 'EFECTIVO' and pago_recibido < total:
+        raise ErrorVenta(
+            f'Para pago en efectivo, el pago recibido (${pago_recibido}) debe ser '
+            f'mayor o igual al total (${total})'
+        )
+
+    venta = Venta(
+        clienteid_id=cliente_id,
+        metodopago=metodo_pago,
+        descuentoaplicado=descuento,
+        pagorecibido=pago_recibido,
+        estadoventa='COMPLETADA',
+    )
+    venta.fijar_totales(len(lineas), sum(lineas.values()), subtotal)
+    venta.save()
+
+    descontar_stock(lineas)
+    DetalleVenta.objects.bulk_create([
+        DetalleVenta(
+            ventaid=venta,
+            libroid=libros[libroid],
+            cantidad=cantidad,
+            preciounitario=libros[libroid].precioventa,
+            subtotal=libros[libroid].precioventa * cantidad,
+        )
+        for libroid, cantidad in lineas.items()
+    ])
+    resumenes.sumar([venta.ventaid])
+    return venta
+
+
+@transaction.atomic
+def cancelar_ventas(venta_ids):
+    """
+    Cancela las ventas COMPLETADAS de `venta_ids` y devuelve su stock.
+
+    Es idempotente: las ventas ya canceladas o pendientes se ignoran, así
+    que repetir la operación no vuelve a sumar stock. El stock se restaura
+    con una sola actualización por título, sin importar cuántas ventas o
+    detalles haya. Devuelve la lista de ventaid efectivamente canceladas.
+    """
+    completadas = list(
+        Venta.objects.select_for_update()
+        .filter(ventaid__in=venta_ids, estadoventa='COMPLETADA')
+        .values_list('ventaid', flat=True)
+    )
+    if not completadas:
+        return []
+    # Mientras siguen COMPLETADAS, para restar exactamente lo que sumaron
+    resumenes.quitar(completadas)
+
+    # La condición sobre el estado evita cancelar dos veces la misma venta
+    # si otra petición se adelantó entre la lectura y la actualización.
+    canceladas = Venta.objects.filter(
+        ventaid__in=completadas, estadoventa='COMPLETADA'
+    ).update(estadoventa='CANCELADA')
+    if canceladas != len(completadas):
+        raise ErrorVenta('Otra operación modificó estas ventas; intenta de nuevo')
+
+    devoluciones = (
+        DetalleVenta.objects.filter(ventaid__in=completadas)
+        .values('libroid')
+        .annotate(cantidad=Sum('cantidad'))
+        .order_by()
+    )
+    restaurar_stock({fila['libroid']: fila['cantidad'] for fila in devoluciones})
+    # update() no envía señales, así que la caché del panel se invalida aquí
+    transaction.on_commit(estadisticas.invalidar)
+    return completadas
+
+
+# =============================================
+# TOTALES DESNORMALIZADOS
+# =============================================
+
+def totales_de_lineas(venta_ids):
+    """{ventaid: (num_lineas, num_items, subtotal)} calculados desde DetalleVenta en una consulta."""
+    filas = (
+        DetalleVenta.objects.filter(ventaid__in=venta_ids)
+        .values('ventaid')
+        .annotate(lineas=Count('detalleventaid'), items=Sum('cantidad'), subtotal=Sum('subtotal'))
+        .order_by()
+    )
+    return {fila['ventaid']: (fila['lineas'], fila['items'], fila['subtotal']) for fila in filas}
+
+
+@transaction.atomic
+def recalcular_totales(venta_ids, guardar=True):
+    """
+    Recalcula con sus detalles los totales de las ventas de `venta_ids`
+    (líneas, unidades, subtotal, monto y cambio) y devuelve las que tenían
+    valores distintos. Las vistas que modifican detalles lo llaman en la misma
+    transacción que el cambio. Con guardar=False solo compara, sin escribir
+    (recalcular_ventas --verificar). Son dos consultas y, si algo cambió, un
+    bulk_update, sin importar el número de ventas.
+    """
+    ventas = Venta.objects.filter(ventaid__in=venta_ids).only(*CAMPOS_TOTALES, 'descuentoaplicado', 'pagorecibido')
+    if guardar:
+        ventas = ventas.select_for_update()
+    totales = totales_de_lineas(venta_ids)
+    distintas = []
+    for venta in ventas:
+        antes = [getattr(venta, campo) for campo in CAMPOS_TOTALES]
+        venta.fijar_totales(*totales.get(venta.ventaid, SIN_LINEAS))
+        if [getattr(venta, campo) for campo in CAMPOS_TOTALES] != antes:
+            distintas.append(venta)
+    if guardar and distintas:
+        Venta.objects.bulk_update(distintas, CAMPOS_TOTALES)
+        # bulk_update no envía señales
+        transaction.on_commit(estadisticas.invalidar)
+    return distintas
@@ -0,0 +1,114 @@
+# app_Libreria/signals.py
+import logging
+import posixpath
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import busqueda, derivados, estadisticas, resumenes, tareas
+from .models import Autor, Blog, Cliente, DetalleVenta, Editorial, Evento, Libro, Venta
+
+logger = logging.getLogger(__name__)
+
+# Campo de imagen de cada modelo que tiene derivados
+IMAGENES = {Libro: 'portada', Evento: 'imagen', Blog: 'imagen'}
+
+
+def _precalcular_estadisticas():
+    # La marca en caché evita consultar y escribir Tarea por cada venta:
+    # solo la primera venta desde la última reconstrucción encola otra
+    if estadisticas.marcar_precalculo():
+        tareas.encolar('estadisticas.reconstruir', unica=True)
+
+
+@receiver([post_save, post_delete], sender=Venta)
+@receiver([post_save, post_delete], sender=DetalleVenta)
+def actualizar_estadisticas(sender, **kwargs):
+    # Tras el commit se borra la caché, así que el panel nunca muestra datos
+    # viejos aunque no haya un worker corriendo; si lo hay, la reconstrucción
+    # en segundo plano la deja lista antes de la siguiente visita.
+    # robust=True: si la base está ocupada, la venta ya se guardó y no debe
+    # parecer fallida
+    transaction.on_commit(estadisticas.invalidar)
+    transaction.on_commit(_precalcular_estadisticas, robust=True)
+
+
+@receiver(post_save, sender=Cliente)
+def contar_cliente_nuevo(sender, instance, created, **kwargs):
+    if created:
+        resumenes.contar_cliente(instance.fecharegistro)
+
+
+@receiver(post_delete, sender=Cliente)
+def descontar_cliente(sender, instance, **kwargs):
+    # reconstruir_resumenes cuenta los clientes que existen
+    resumenes.contar_cliente(instance.fecharegistro, -1)
+
+
+@receiver(pre_save, sender=Libro)
+def recordar_clasificacion(sender, instance, update_fields=None, **kwargs):
+    # Solo si el guardado puede cambiar el género o la editorial
+    if instance.pk is None or (update_fields is not None and not {'genero', 'editorialid'} & set(update_fields)):
+        return
+    instance._clasificacion_anterior = (
+        Libro.objects.filter(pk=instance.pk).values_list('genero', 'editorialid').first()
+    )
+
+
+@receiver(post_save, sender=Libro)
+def reclasificar_resumenes(sender, instance, **kwargs):
+    anterior = getattr(instance, '_clasificacion_anterior', None)
+    instance._clasificacion_anterior = None
+    actual = (instance.genero, instance.editorialid_id)
+    if anterior and anterior != actual:
+        resumenes.reclasificar_libro(instance.libroid, anterior, actual)
+
+
+@receiver(post_save, sender=Libro)
+def indexar_libro(sender, instance, **kwargs):
+    busqueda.indexar_libros([instance.libroid])
+
+
+@receiver(post_delete, sender=Libro)
+def desindexar_libro(sender, instance, **kwargs):
+    busqueda.eliminar_libros([instance.libroid])
+
+
+@receiver(post_save, sender=Autor)
+def reindexar_libros_de_autor(sender, instance, created, **kwargs):
+    if not created:
+        busqueda.indexar_libros(instance.libro_set.values_list('libroid', flat=True))
+
+
+@receiver(post_save, sender=Editorial)
+def reindexar_libros_de_editorial(sender, instance, created, **kwargs):
+    if not created:
+        busqueda.indexar_libros(instance.libro_set.values_list('libroid', flat=True))
+
+
+@receiver(pre_save, sender=Libro)
+@receiver(pre_save, sender=Evento)
+@receiver(pre_save, sender=Blog)
+def limpiar_imagen_subida(sender, instance, **kwargs):
+    campo = getattr(instance, IMAGENES[sender])
+    # Solo los archivos recién subidos, que todavía no están en el storage
+    if not campo or campo._committed:
+        return
+    try:
+        contenido, extension = derivados.limpiar_original(campo.file)
+    except derivados.ImagenInvalida as e:
+        logger.warning('Imagen subida inválida (%s): %s', campo.name, e)
+        return
+    nombre = posixpath.splitext(posixpath.basename(campo.name))[0]
+    campo.save(f'{nombre}.{extension}', contenido, save=False)
+    instance._derivados_pendientes = True
+
+
+@receiver(post_save, sender=Libro)
+@receiver(post_save, sender=Evento)
+@receiver(post_save, sender=Blog)
+def generar_derivados(sender, instance, **kwargs):
+    if getattr(instance, '_derivados_pendientes', False):
+        instance._derivados_pendientes = False
+        tareas.encolar('derivados.generar', instance._meta.label, instance.pk, IMAGENES[sender])
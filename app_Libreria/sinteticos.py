@@ -0,0 +1,209 @@
+# app_Libreria/sinteticos.py
+"""
+Generación de datos sintéticos y deterministas (a partir de una semilla)
+para benchmarks y pruebas de carga.
+
+Todo se inserta con bulk_create por lotes y las llaves foráneas se
+resuelven con los ids devueltos por cada inserción, sin volver a consultar.
+Como bulk_create no dispara señales, al final se reconstruyen el índice de
+búsqueda y los resúmenes diarios, y se invalida la caché del panel.
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import busqueda, estadisticas, resumenes
+from .models import Autor, Cliente, DetalleVenta, Editorial, Libro, Venta
+
+ESCALAS = {
+    '1k': 1_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+LOTE = 5000
+CONTRASENA = 'libreria123'
+PREFIJO_CLIENTE = 'cliente'
+
+NOMBRES = ['Gabriel', 'Isabel', 'Carlos', 'Laura', 'Mario', 'Elena', 'Julio', 'Rosa',
+           'Pablo', 'Octavio', 'Juana', 'Jorge', 'Alfonsina', 'Rubén', 'Gioconda', 'Ernesto']
+APELLIDOS = ['García', 'Allende', 'Ruiz', 'Esquivel', 'Vargas', 'Poniatowska', 'Cortázar',
+             'Castellanos', 'Neruda', 'Paz', 'Borges', 'Storni', 'Darío', 'Belli', 'Sabato', 'Rulfo']
+PAISES = ['México', 'España', 'Argentina', 'Colombia', 'Chile', 'Perú', 'Uruguay']
+PALABRAS = ['sombra', 'viento', 'casa', 'espíritus', 'soledad', 'amor', 'tiempo', 'ciudad',
+            'perros', 'laberinto', 'río', 'noche', 'memoria', 'jardín', 'mar', 'silencio',
+            'fuego', 'invierno', 'espejo', 'camino', 'luna', 'olvido', 'ceniza', 'puerta']
+METODOS = [codigo for codigo, _ in Venta.METODOS_PAGO]
+GENEROS = [codigo for codigo, _ in Libro.GENEROS]
+
+
+def proporciones(libros):
+    """Número de filas de cada tabla para un catálogo de `libros` títulos."""
+    return {
+        'editoriales': max(5, libros // 1000),
+        'autores': max(10, libros // 20),
+        'libros': libros,
+        'clientes': max(10, libros // 10),
+        'ventas': libros,
+    }
+
+
+def _lotes(total, tamanio=LOTE):
+    for inicio in range(0, total, tamanio):
+        yield inicio, min(inicio + tamanio, total)
+
+
+def _titulo(rng):
+    return ' '.join(rng.sample(PALABRAS, rng.randint(2, 4))).capitalize()
+
+
+def _crear_editoriales(rng, total, lote):
+    editoriales = Editorial.objects.bulk_create([
+        Editorial(
+            nombre=f'Editorial {rng.choice(APELLIDOS)} {i}',
+            direccion=f'Calle {i}',
+            telefono=f'+52-55-{i:08d}',
+            email=f'contacto{i}@editorial.test',
+            pais=rng.choice(PAISES),
+        )
+        for i in range(total)
+    ], batch_size=lote)
+    return [editorial.pk for editorial in editoriales]
+
+
+def _crear_autores(rng, total, lote):
+    ids = []
+    for inicio, fin in _lotes(total, lote):
+        autores = Autor.objects.bulk_create([
+            Autor(
+                nombre=rng.choice(NOMBRES),
+                apellido=f'{rng.choice(APELLIDOS)} {i}',
+                nacionalidad=rng.choice(PAISES),
+                fechanacimiento=date(1900, 1, 1) + timedelta(days=rng.randint(0, 36500)),
+                bibliografia='',
+            )
+            for i in range(inicio, fin)
+        ])
+        ids.extend(autor.pk for autor in autores)
+    return ids
+
+
+def _crear_libros(rng, total, autores, editoriales, lote):
+    """Devuelve (ids, precios) en el mismo orden de inserción."""
+    ids, precios = [], []
+    for inicio, fin in _lotes(total, lote):
+        libros = []
+        for i in range(inicio, fin):
+            precio = Decimal(rng.randint(9900, 89900)) / 100
+            libros.append(Libro(
+                titulo=_titulo(rng),
+                autorid_id=rng.choice(autores),
+                editorialid_id=rng.choice(editoriales),
+                isbn=f'978{i:010d}',
+                aniopublicacion=rng.randint(1950, 2025),
+                genero=rng.choice(GENEROS),
+                precioventa=precio,
+                # Uno de cada diez títulos agotado
+                stock=0 if rng.random() < 0.1 else rng.randint(1, 200),
+                descripcion=' '.join(rng.choices(PALABRAS, k=12)),
+            ))
+            precios.append(precio)
+        ids.extend(libro.pk for libro in Libro.objects.bulk_create(libros))
+    return ids, precios
+
+
+def _crear_clientes(rng, total, lote):
+    # La contraseña se cifra una sola vez y se comparte entre todos los clientes
+    contrasena = make_password(CONTRASENA)
+    ids = []
+    for inicio, fin in _lotes(total, lote):
+        usuarios = User.objects.bulk_create([
+            User(
+                username=f'{PREFIJO_CLIENTE}{i:07d}',
+                email=f'{PREFIJO_CLIENTE}{i:07d}@libreria.test',
+                first_name=rng.choice(NOMBRES),
+                last_name=rng.choice(APELLIDOS),
+                password=contrasena,
+            )
+            for i in range(inicio, fin)
+        ])
+        # Perfil de cliente, como lo crea crear_perfil_cliente en el registro
+        Cliente.objects.bulk_create([
+            Cliente(
+                user_id=usuario.pk,
+                nombre=usuario.first_name,
+                apellido=usuario.last_name,
+                email=usuario.email,
+                preferencias_genero=rng.choice(GENEROS),
+            )
+            for usuario in usuarios
+        ])
+        ids.extend(usuario.pk for usuario in usuarios)
+    return ids
+
+
+def _crear_ventas(rng, total, clientes, libros, precios, lote, dias=365):
+    ahora = timezone.now()
+    iva = Decimal('0.16')
+    for inicio, fin in _lotes(total, lote):
+        ventas, lineas_por_venta = [], []
+        for _ in range(inicio, fin):
+            lineas = []
+            for posicion in rng.sample(range(len(libros)), min(len(libros), rng.randint(1, 4))):
+                cantidad = rng.randint(1, 3)
+                lineas.append((libros[posicion], cantidad, precios[posicion]))
+            monto = sum(cantidad * precio for _, cantidad, precio in lineas)
+            venta = Venta(
+                clienteid_id=rng.choice(clientes),
+                fechaventa=ahora - timedelta(seconds=rng.randint(0, dias * 86400)),
+                metodopago=rng.choice(METODOS),
+                estadoventa='CANCELADA' if rng.random() < 0.05 else 'COMPLETADA',
+                pagorecibido=monto,
+            )
+            venta.fijar_totales(len(lineas), sum(cantidad for _, cantidad, _ in lineas), monto)
+            ventas.append(venta)
+            lineas_por_venta.append(lineas)
+
+        ventas = Venta.objects.bulk_create(ventas)
+        DetalleVenta.objects.bulk_create([
+            DetalleVenta(
+                ventaid_id=venta.pk, libroid_id=libroid, cantidad=cantidad,
+                preciounitario=precio, iva=iva, subtotal=cantidad * precio,
+            )
+            for venta, lineas in zip(ventas, lineas_por_venta)
+            for libroid, cantidad, precio in lineas
+        ], batch_size=lote)
+
+
+def generar(libros, semilla=0, progreso=None, lote=LOTE):
+    """
+    Genera un catálogo de `libros` títulos con sus autores, editoriales,
+    clientes y ventas. Devuelve el número de filas creadas por tabla.
+    """
+    rng = random.Random(semilla)
+    filas = proporciones(libros)
+    avisar = progreso or (lambda mensaje: None)
+
+    # avisar() se llama al terminar cada etapa
+    with transaction.atomic():
+        editoriales = _crear_editoriales(rng, filas['editoriales'], lote)
+        avisar(f"editoriales: {filas['editoriales']}")
+        autores = _crear_autores(rng, filas['autores'], lote)
+        avisar(f"autores: {filas['autores']}")
+        libro_ids, precios = _crear_libros(rng, filas['libros'], autores, editoriales, lote)
+        avisar(f"libros: {filas['libros']}")
+        clientes = _crear_clientes(rng, filas['clientes'], lote)
+        avisar(f"clientes: {filas['clientes']}")
+        _crear_ventas(rng, filas['ventas'], clientes, libro_ids, precios, lote)
+        avisar(f"ventas: {filas['ventas']}")
+
+    busqueda.reconstruir_indice()
+    avisar('índice de búsqueda')
+    resumenes.reconstruir()
+    avisar('resúmenes diarios')
+    estadisticas.invalidar()
+    return filas
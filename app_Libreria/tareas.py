@@ -0,0 +1,193 @@
+# app_Libreria/tareas.py
+"""
+Cola de tareas en la base de datos, sin broker externo.
+
+Las vistas y señales llaman a encolar(), que solo inserta una fila en Tarea
+(dentro de la transacción en curso, así que la tarea existe solo si los
+datos que la originaron se guardaron). El comando procesar_tareas reclama
+las pendientes y las ejecuta en un pool de procesos; si una falla se
+reintenta con espera exponencial hasta max_intentos.
+
+Las funciones que se pueden encolar se registran con @tarea('nombre') en
+este mismo módulo, para que los procesos del pool las encuentren con solo
+importarlo.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import derivados, estadisticas, exportacion
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+MAX_INTENTOS = 3
+RETRASO_BASE = 30       # segundos; se duplica en cada reintento
+TIEMPO_MAXIMO = 600     # una tarea EN_CURSO por más tiempo se da por perdida
+
+REGISTRO = {}
+
+
+def tarea(nombre):
+    def registrar(funcion):
+        REGISTRO[nombre] = funcion
+        return funcion
+    return registrar
+
+
+def encolar(nombre, *argumentos, retraso=0, unica=False, max_intentos=MAX_INTENTOS):
+    """
+    Inserta una tarea pendiente. Con unica=True no se encola si ya hay otra
+    pendiente con el mismo nombre y argumentos. Devuelve la Tarea o None.
+    """
+    if nombre not in REGISTRO:
+        raise ValueError(f'Tarea desconocida: {nombre}')
+    argumentos = list(argumentos)
+    if unica and Tarea.objects.filter(nombre=nombre, argumentos=argumentos, estado='PENDIENTE').exists():
+        return None
+    return Tarea.objects.create(
+        nombre=nombre,
+        argumentos=argumentos,
+        max_intentos=max_intentos,
+        ejecutar_despues=timezone.now() + timedelta(seconds=retraso),
+    )
+
+
+# =============================================
+# EJECUCIÓN
+# =============================================
+
+def reclamar(limite):
+    """
+    Marca como EN_CURSO hasta `limite` tareas pendientes y devuelve sus ids.
+    El UPDATE condicionado a estado='PENDIENTE' hace que dos workers nunca
+    reclamen la misma tarea.
+    """
+    candidatas = list(
+        Tarea.objects.pendientes()
+        .order_by('ejecutar_despues', 'tareaid')
+        .values_list('tareaid', flat=True)[:limite]
+    )
+    reclamadas = []
+    for tareaid in candidatas:
+        if Tarea.objects.filter(tareaid=tareaid, estado='PENDIENTE').update(
+            estado='EN_CURSO', iniciada=timezone.now(), intentos=F('intentos') + 1
+        ):
+            reclamadas.append(tareaid)
+    return reclamadas
+
+
+def _fallar(tarea_, error):
+    if tarea_.intentos < tarea_.max_intentos:
+        espera = RETRASO_BASE * 2 ** max(tarea_.intentos - 1, 0)
+        Tarea.objects.filter(tareaid=tarea_.tareaid).update(
+            estado='PENDIENTE', error=error,
+            ejecutar_despues=timezone.now() + timedelta(seconds=espera),
+        )
+    else:
+        Tarea.objects.filter(tareaid=tarea_.tareaid).update(
+            estado='FALLIDA', error=error, terminada=timezone.now(),
+        )
+
+
+def ejecutar(tareaid):
+    """Ejecuta una tarea ya reclamada. Devuelve True si terminó bien."""
+    tarea_ = Tarea.objects.get(tareaid=tareaid)
+    funcion = REGISTRO.get(tarea_.nombre)
+    try:
+        if funcion is None:
+            raise LookupError(f'Tarea desconocida: {tarea_.nombre}')
+        resultado = funcion(*tarea_.argumentos)
+    except Exception:
+        logger.exception('Falló la tarea %s (intento %s de %s)',
+                         tarea_, tarea_.intentos, tarea_.max_intentos)
+        _fallar(tarea_, traceback.format_exc())
+        return False
+    Tarea.objects.filter(tareaid=tareaid).update(
+        estado='COMPLETADA', resultado=resultado, error='', terminada=timezone.now(),
+    )
+    return True
+
+
+def devolver(tareaids, error):
+    """
+    Devuelve a la cola las tareas EN_CURSO de un proceso que murió, sin
+    esperar a recuperar_perdidas; las que agotaron sus intentos quedan
+    FALLIDAS. El filtro por estado respeta las que alcanzaron a terminar.
+    Devuelve cuántas volvieron a la cola.
+    """
+    en_curso = Tarea.objects.filter(tareaid__in=list(tareaids), estado='EN_CURSO')
+    en_curso.filter(intentos__gte=F('max_intentos')).update(
+        estado='FALLIDA', error=error, terminada=timezone.now(),
+    )
+    return en_curso.filter(intentos__lt=F('max_intentos')).update(
+        estado='PENDIENTE', error=error, ejecutar_despues=timezone.now(),
+    )
+
+
+def recuperar_perdidas(tiempo_maximo=TIEMPO_MAXIMO):
+    """Devuelve a la cola (o da por fallidas) las tareas de un worker que murió."""
+    limite = timezone.now() - timedelta(seconds=tiempo_maximo)
+    perdidas = list(Tarea.objects.filter(estado='EN_CURSO', iniciada__lt=limite))
+    for tarea_ in perdidas:
+        _fallar(tarea_, f'Sin terminar después de {tiempo_maximo} s')
+    return len(perdidas)
+
+
+def purgar():
+    """Borra las tareas completadas más antiguas que LIBRERIA_TAREAS_RETENCION_DIAS."""
+    dias = getattr(settings, 'LIBRERIA_TAREAS_RETENCION_DIAS', 7)
+    limite = timezone.now() - timedelta(days=dias)
+    return Tarea.objects.filter(estado='COMPLETADA', terminada__lt=limite).delete()[0]
+
+
+def procesar_pendientes(limite=100):
+    """Ejecuta en este proceso las tareas pendientes. Devuelve cuántas corrió."""
+    ejecutadas = 0
+    while ejecutadas < limite:
+        reclamadas = reclamar(min(10, limite - ejecutadas))
+        if not reclamadas:
+            break
+        for tareaid in reclamadas:
+            ejecutar(tareaid)
+        ejecutadas += len(reclamadas)
+    return ejecutadas
+
+
+# =============================================
+# TAREAS
+# =============================================
+
+@tarea('derivados.generar')
+def generar_derivados(modelo, pk, nombre_campo):
+    instancia = apps.get_model(modelo).objects.filter(pk=pk).only(nombre_campo).first()
+    campo = getattr(instancia, nombre_campo, None)
+    if not campo:
+        # Se borró el registro o la imagen antes de procesarla
+        return None
+    try:
+        derivados.generar_todos(campo)
+    except derivados.ImagenInvalida as e:
+        # Reintentar no la va a arreglar
+        logger.warning('No se pudieron generar derivados de %s: %s', campo.name, e)
+        return {'error': str(e)}
+    return {'archivo': campo.name}
+
+
+@tarea('estadisticas.reconstruir')
+def reconstruir_estadisticas():
+    estadisticas.reconstruir()
+
+
+@tarea('exportacion.ventas')
+def exportar_ventas(formato, desde=None, hasta=None, estado=None):
+    nombre = exportacion.guardar(
+        formato, parse_date(desde) if desde else None, parse_date(hasta) if hasta else None, estado
+    )
+    return {'archivo': nombre}
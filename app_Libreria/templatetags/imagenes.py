@@ -0,0 +1,34 @@
+from django import template
+from django.utils.html import format_html
+
+from app_Libreria import derivados
+
+register = template.Library()
+
+
+@register.simple_tag
+def imagen_responsiva(campo, preset, alt='', clase='', respaldo='', carga='lazy'):
+    """
+    <picture> con derivados WebP/JPEG 1x y 2x del preset indicado.
+
+    Uso: {% imagen_responsiva libro.portada 'tarjeta' alt=libro.titulo clase='card-img-top' %}
+    Si no hay imagen se usa la URL de `respaldo`; si sus derivados todavía
+    no están listos, la del original.
+    """
+    ancho, alto = derivados.PRESETS[preset]
+    estilo = f'height: {alto}px; object-fit: cover;'
+    datos = derivados.fuentes(campo, preset)
+    if datos is None:
+        src = respaldo or (campo.url if campo else '')
+        return format_html(
+            '<img src="{}" class="{}" alt="{}" style="{}" loading="{}">',
+            src, clase, alt, estilo, carga,
+        )
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}">'
+        '<img src="{}" srcset="{}" width="{}" height="{}" class="{}" alt="{}" style="{}" loading="{}" decoding="async">'
+        '</picture>',
+        datos['webp'], datos['src'], datos['jpg'], datos['ancho'], datos['alto'],
+        clase, alt, estilo, carga,
+    )
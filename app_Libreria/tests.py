@@ -1,3 +1,1511 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteWrapper
+from django.db.models import Sum
+from django.http import HttpResponseRedirect
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    analitica, basedatos, busqueda, carrito, catalogo, derivados, estadisticas, exportacion, importacion, inventario,
+    metricas, reservas, resumenes, servicios, sinteticos, tareas,
+)
+from .management.commands import benchmark, procesar_tareas
+from .models import (
+    Autor, Blog, Cliente, Editorial, Evento, Libro, Venta, DetalleVenta, Carrito, Reserva, ResumenDiaClientes,
+    ResumenDiaEditorial, ResumenDiaGenero, ResumenDiaLibro, ResumenDiaMetodo, Tarea,
+)
+
+# Las clases que leen o borran la caché usan una en memoria: no deben tocar
+# la caché en archivos del servidor de desarrollo (settings.CACHES)
+CACHE_EN_MEMORIA = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def crear_autor_y_editorial():
+    autor = Autor.objects.create(
+        nombre='Gabriel', apellido='García Márquez', nacionalidad='Colombiana',
+        fechanacimiento=datetime.date(1927, 3, 6), bibliografia=''
+    )
+    editorial = Editorial.objects.create(
+        nombre='Editorial Planeta', direccion='Av. Diagonal 662', telefono='555-0101',
+        email='info@planeta.es', pais='España'
+    )
+    return autor, editorial
+
+
+def crear_libros(cantidad, autor, editorial, stock=10, inicio=0):
+    return Libro.objects.bulk_create([
+        Libro(
+            titulo=f'Libro {i:05d}', autorid=autor, editorialid=editorial,
+            isbn=f'978-{i:09d}', aniopublicacion=2000, genero='FIC',
+            precioventa=Decimal('100.00') + i, stock=stock,
+        )
+        for i in range(inicio, inicio + cantidad)
+    ])
+
+
+@override_settings(CACHES=CACHE_EN_MEMORIA)
+class ConsultasConstantesTests(TestCase):
+    """Cada vista debe ejecutar el mismo número de consultas sin importar cuántas filas muestre."""
+
+    TAMANIOS = (10, 100, 1000)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor, cls.editorial = crear_autor_y_editorial()
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+        cls.cliente = User.objects.create_user('cliente')
+
+    def setUp(self):
+        self.libros = []
+        cache.clear()
+
+    def completar_datos(self, cantidad):
+        """Lleva libros, carrito, ventas y detalles hasta `cantidad` filas cada uno."""
+        faltantes = cantidad - len(self.libros)
+        nuevos = crear_libros(faltantes, self.autor, self.editorial, inicio=len(self.libros))
+        self.libros.extend(nuevos)
+
+        Carrito.objects.bulk_create([
+            Carrito(usuario=self.cliente, libro=libro, cantidad=1) for libro in nuevos
+        ])
+        # Como un carrito real, cada renglón con su reserva vigente
+        reservas.reservar_carrito(self.cliente)
+        carrito.invalidar(self.cliente)
+        Venta.objects.bulk_create([
+            Venta(clienteid=self.cliente, metodopago='TARJETA', estadoventa='COMPLETADA')
+            for _ in range(faltantes)
+        ])
+        venta = Venta.objects.order_by('ventaid').first()
+        DetalleVenta.objects.bulk_create([
+            DetalleVenta(
+                ventaid=venta, libroid=libro, cantidad=1,
+                preciounitario=libro.precioventa, subtotal=libro.precioventa,
+            )
+            for libro in nuevos
+        ])
+        return venta
+
+    def contar_consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return len(consultas)
+
+    def assertConsultasConstantes(self, usuario, obtener_url):
+        if usuario is not None:
+            self.client.force_login(usuario)
+        conteos = []
+        for cantidad in self.TAMANIOS:
+            venta = self.completar_datos(cantidad)
+            conteos.append(self.contar_consultas(obtener_url(venta)))
+        self.assertEqual(len(set(conteos)), 1, f'Consultas por tamaño {self.TAMANIOS}: {conteos}')
+
+    def test_libros(self):
+        self.assertConsultasConstantes(None, lambda venta: reverse('libros'))
+
+    def test_libros_cliente(self):
+        self.assertConsultasConstantes(self.cliente, lambda venta: reverse('libros'))
+
+    def test_inicio(self):
+        self.assertConsultasConstantes(self.cliente, lambda venta: reverse('inicio'))
+
+    def test_ver_carrito(self):
+        self.assertConsultasConstantes(self.cliente, lambda venta: reverse('ver_carrito'))
+
+    def test_admin_ventas(self):
+        self.assertConsultasConstantes(self.admin, lambda venta: reverse('admin_ventas'))
+
+    def test_detalle_venta_admin(self):
+        self.assertConsultasConstantes(
+            self.admin, lambda venta: reverse('detalle_venta_admin', args=[venta.ventaid])
+        )
+
+    def test_detalle_venta(self):
+        self.assertConsultasConstantes(
+            self.cliente, lambda venta: reverse('detalle_venta', args=[venta.ventaid])
+        )
+
+    def test_mis_compras(self):
+        self.assertConsultasConstantes(self.cliente, lambda venta: reverse('mis_compras'))
+
+
+@override_settings(CACHES=CACHE_EN_MEMORIA)
+class ProcesarCompraTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        autor, editorial = crear_autor_y_editorial()
+        cls.libros = crear_libros(3, autor, editorial, stock=5)
+        cls.cliente = User.objects.create_user('cliente')
+
+    def setUp(self):
+        for libro in self.libros:
+            Carrito.objects.create(usuario=self.cliente, libro=libro, cantidad=2)
+
+    def test_compra_descuenta_stock_y_vacia_carrito(self):
+        venta = servicios.procesar_compra(self.cliente, 'TARJETA')
+
+        self.assertEqual(venta.estadoventa, 'COMPLETADA')
+        self.assertEqual(venta.montototal, sum(libro.precioventa * 2 for libro in self.libros))
+        self.assertEqual(venta.detalles.count(), 3)
+        self.assertEqual(
+            list(Libro.objects.order_by('libroid').values_list('stock', flat=True)), [3, 3, 3]
+        )
+        self.assertFalse(Carrito.objects.filter(usuario=self.cliente).exists())
+
+    def test_consultas_no_dependen_del_tamanio_del_carrito(self):
+        with CaptureQueriesContext(connection) as consultas:
+            servicios.procesar_compra(self.cliente, 'TARJETA')
+        autor, editorial = self.libros[0].autorid, self.libros[0].editorialid
+        otros = crear_libros(50, autor, editorial, stock=5, inicio=100)
+        Carrito.objects.bulk_create([Carrito(usuario=self.cliente, libro=libro) for libro in otros])
+        with CaptureQueriesContext(connection) as consultas_grandes:
+            servicios.procesar_compra(self.cliente, 'TARJETA')
+        self.assertEqual(len(consultas), len(consultas_grandes))
+
+    def test_stock_insuficiente_no_crea_venta(self):
+        Libro.objects.filter(libroid=self.libros[1].libroid).update(stock=1)
+
+        with self.assertRaises(servicios.StockInsuficiente):
+            servicios.procesar_compra(self.cliente, 'TARJETA')
+
+        self.assertFalse(Venta.objects.exists())
+        self.assertEqual(Carrito.objects.filter(usuario=self.cliente).count(), 3)
+
+    def test_error_a_mitad_de_la_compra_revierte_todo(self):
+        with mock.patch.object(DetalleVenta.objects, 'bulk_create', side_effect=RuntimeError('falla')):
+            with self.assertRaises(RuntimeError):
+                servicios.procesar_compra(self.cliente, 'TARJETA')
+
+        self.assertFalse(Venta.objects.exists())
+        self.assertEqual(set(Libro.objects.values_list('stock', flat=True)), {5})
+        self.assertEqual(Carrito.objects.filter(usuario=self.cliente).count(), 3)
+
+    def test_pago_en_efectivo_insuficiente(self):
+        with self.assertRaises(servicios.ErrorVenta):
+            servicios.procesar_compra(self.cliente, 'EFECTIVO', Decimal('1.00'))
+        self.assertFalse(Venta.objects.exists())
+
+    def test_vista_redirige_al_detalle(self):
+        self.client.force_login(self.cliente)
+        respuesta = self.client.post(reverse('procesar_compra'), {'metodo_pago': 'TARJETA'})
+        venta = Venta.objects.get()
+        self.assertRedirects(respuesta, reverse('detalle_venta', args=[venta.ventaid]))
+
+    def test_envio_repetido_devuelve_la_misma_venta(self):
+        self.client.force_login(self.cliente)
+        clave = self.client.get(reverse('ver_carrito')).context['clave_idempotencia']
+        datos = {'metodo_pago': 'TARJETA', 'clave_idempotencia': clave}
+        primera = self.client.post(reverse('procesar_compra'), datos)
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = self.client.post(reverse('procesar_compra'), datos)
+        # sesión, usuario y la venta con esa clave: no se vuelve a ejecutar nada
+        sentencias = [c['sql'] for c in consultas if not c['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len(sentencias), 3)
+
+        venta = Venta.objects.get()
+        self.assertEqual(venta.clave_idempotencia, clave)
+        self.assertRedirects(primera, reverse('detalle_venta', args=[venta.ventaid]), fetch_redirect_response=False)
+        self.assertRedirects(segunda, reverse('detalle_venta', args=[venta.ventaid]), fetch_redirect_response=False)
+        self.assertContains(self.client.get(segunda.url), 'Esta compra ya se había procesado')
+        self.assertEqual(set(Libro.objects.values_list('stock', flat=True)), {3})
+
+    def test_envios_simultaneos_con_la_misma_clave(self):
+        original = servicios.procesar_compra(self.cliente, 'TARJETA', clave='a' * 32)
+        # El segundo envío no ve la venta al empezar (llegó a la vez) y choca con UNIQUE
+        Carrito.objects.create(usuario=self.cliente, libro=self.libros[0])
+        buscar = servicios.venta_con_clave
+        with mock.patch.object(servicios, 'venta_con_clave', side_effect=[None, buscar(self.cliente, 'a' * 32)]):
+            repetida = servicios.procesar_compra(self.cliente, 'TARJETA', clave='a' * 32)
+        self.assertEqual((repetida.pk, repetida.repetida), (original.pk, True))
+        self.assertEqual(Venta.objects.count(), 1)
+        self.assertEqual(Libro.objects.get(pk=self.libros[0].pk).stock, 3)
+
+
+class RegistrarVentaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor, cls.editorial = crear_autor_y_editorial()
+        cls.libros = crear_libros(300, cls.autor, cls.editorial, stock=10)
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+        cls.cliente = User.objects.create_user('cliente')
+
+    def test_total_se_calcula_en_el_servidor(self):
+        self.client.force_login(self.admin)
+        libro = self.libros[0]
+        self.client.post(reverse('agregar_venta'), {
+            'clienteid': self.cliente.id, 'metodopago': 'TARJETA',
+            'montototal': '0.01', 'descuentoaplicado': '10',
+            'libros[]': [libro.libroid], 'cantidades[]': ['3'], 'precios[]': ['0.01'],
+        })
+        venta = Venta.objects.get()
+        self.assertEqual(venta.montototal, libro.precioventa * 3 - 10)
+        self.assertEqual(venta.detalles.get().preciounitario, libro.precioventa)
+        libro.refresh_from_db()
+        self.assertEqual(libro.stock, 7)
+
+    def test_consultas_constantes_con_cientos_de_lineas(self):
+        def contar(libros):
+            lineas = {libro.libroid: 1 for libro in libros}
+            with CaptureQueriesContext(connection) as consultas:
+                servicios.registrar_venta(self.cliente.id, 'TARJETA', lineas)
+            return len(consultas)
+
+        # Solo los lotes por el límite de parámetros de SQLite agregan consultas
+        self.assertEqual(contar(self.libros[:5]), contar(self.libros[5:145]))
+        self.assertLessEqual(contar(self.libros[145:300]), contar(self.libros[:5]) + 2)
+
+    def test_libro_inexistente_no_escribe_nada(self):
+        lineas = {self.libros[0].libroid: 1, 999999: 1}
+        with self.assertRaises(servicios.ErrorVenta):
+            servicios.registrar_venta(self.cliente.id, 'TARJETA', lineas)
+        self.assertFalse(Venta.objects.exists())
+        self.assertEqual(Libro.objects.get(libroid=self.libros[0].libroid).stock, 10)
+
+    def test_lineas_repetidas_se_suman(self):
+        lineas = servicios.leer_lineas(['1', '2', '1', ''], ['2', '1', '3', '1'])
+        self.assertEqual(lineas, {1: 5, 2: 1})
+
+
+class CancelarVentasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        autor, editorial = crear_autor_y_editorial()
+        cls.libros = crear_libros(3, autor, editorial, stock=10)
+        cls.cliente = User.objects.create_user('cliente')
+
+    def crear_venta(self, cantidades):
+        lineas = {libro.libroid: cantidad for libro, cantidad in zip(self.libros, cantidades)}
+        return servicios.registrar_venta(self.cliente.id, 'TARJETA', lineas)
+
+    def stock(self):
+        return list(Libro.objects.order_by('libroid').values_list('stock', flat=True))
+
+    def test_cancelar_restaura_stock_una_sola_vez(self):
+        venta = self.crear_venta([2, 3, 4])
+
+        self.assertEqual(servicios.cancelar_ventas([venta.ventaid]), [venta.ventaid])
+        self.assertEqual(servicios.cancelar_ventas([venta.ventaid]), [])
+
+        self.assertEqual(self.stock(), [10, 10, 10])
+        venta.refresh_from_db()
+        self.assertEqual(venta.estadoventa, 'CANCELADA')
+
+    def test_cancelar_en_lote_agrega_por_titulo(self):
+        ventas = [self.crear_venta([1, 1, 1]) for _ in range(5)]
+        ids = [venta.ventaid for venta in ventas]
+
+        with CaptureQueriesContext(connection) as consultas:
+            canceladas = servicios.cancelar_ventas(ids)
+
+        self.assertEqual(sorted(canceladas), sorted(ids))
+        self.assertEqual(self.stock(), [10, 10, 10])
+        # lectura, cambio de estado, agregado de detalles y una actualización de
+        # stock; más dos agregados y una escritura por tabla de resúmenes
+        self.assertEqual(
+            len([q for q in consultas if 'SAVEPOINT' not in q['sql']]), 4 + 2 + 4
+        )
+
+    def test_venta_pendiente_no_se_cancela(self):
+        venta = Venta.objects.create(clienteid=self.cliente, metodopago='TARJETA')
+        self.assertEqual(servicios.cancelar_ventas([venta.ventaid]), [])
+        venta.refresh_from_db()
+        self.assertEqual(venta.estadoventa, 'PENDIENTE')
+
+
+class TotalesVentaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        autor, editorial = crear_autor_y_editorial()
+        cls.libros = crear_libros(3, autor, editorial, stock=10)
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+        cls.cliente = User.objects.create_user('cliente')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def crear_venta(self, cantidades, descuento=Decimal('0.00')):
+        lineas = {libro.libroid: cantidad for libro, cantidad in zip(self.libros, cantidades)}
+        return servicios.registrar_venta(self.cliente.id, 'TARJETA', lineas, descuento=descuento)
+
+    def totales(self, venta):
+        venta.refresh_from_db()
+        return venta.num_lineas, venta.num_items, venta.subtotal_lineas, venta.montototal
+
+    def test_registrar_venta_fija_los_totales(self):
+        venta = self.crear_venta([2, 3], descuento=Decimal('5.00'))
+        # precios 100 y 101
+        self.assertEqual(self.totales(venta), (2, 5, Decimal('503.00'), Decimal('498.00')))
+
+    def test_vistas_de_detalle_mantienen_los_totales(self):
+        venta, otra = self.crear_venta([1]), self.crear_venta([1])
+        libro = self.libros[2]
+        self.client.post(reverse('agregar_detalle_venta'), {
+            'ventaid': venta.ventaid, 'libroid': libro.libroid, 'cantidad': '4', 'preciounitario': '10.50',
+        })
+        self.assertEqual(self.totales(venta), (2, 5, Decimal('142.00'), Decimal('142.00')))
+
+        # Mover el detalle a otra venta cambia las dos
+        detalle = venta.detalles.get(libroid=libro)
+        self.client.post(reverse('editar_detalle_venta', args=[detalle.detalleventaid]), {
+            'ventaid': otra.ventaid, 'libroid': libro.libroid, 'cantidad': '2', 'preciounitario': '10.50',
+        })
+        self.assertEqual(self.totales(venta), (1, 1, Decimal('100.00'), Decimal('100.00')))
+        self.assertEqual(self.totales(otra), (2, 3, Decimal('121.00'), Decimal('121.00')))
+
+        self.client.post(reverse('eliminar_detalle_venta', args=[detalle.detalleventaid]))
+        self.assertEqual(self.totales(otra), (1, 1, Decimal('100.00'), Decimal('100.00')))
+
+    def test_detalle_invalido_no_cambia_la_venta(self):
+        venta = self.crear_venta([1])
+        self.client.post(reverse('agregar_detalle_venta'), {
+            'ventaid': venta.ventaid, 'libroid': self.libros[1].libroid, 'cantidad': 'dos', 'preciounitario': '1',
+        })
+        self.assertEqual(venta.detalles.count(), 1)
+        self.assertEqual(self.totales(venta), (1, 1, Decimal('100.00'), Decimal('100.00')))
+
+    def test_editar_venta_no_acepta_un_monto_a_mano(self):
+        venta = self.crear_venta([2])
+        self.client.post(reverse('editar_venta', args=[venta.ventaid]), {
+            'clienteid': self.cliente.id, 'metodopago': 'EFECTIVO', 'estadoventa': 'COMPLETADA',
+            'montototal': '1.00', 'descuentoaplicado': '20', 'pagorecibido': '200',
+        })
+        venta.refresh_from_db()
+        self.assertEqual(venta.montototal, Decimal('180.00'))
+        self.assertEqual(venta.cambio, Decimal('20.00'))
+
+    def test_comando_verifica_y_corrige(self):
+        ventas = [self.crear_venta([1, 1]) for _ in range(3)]
+        Venta.objects.filter(ventaid=ventas[1].ventaid).update(montototal=1, num_items=9)
+
+        salida = io.StringIO()
+        with self.assertRaisesMessage(CommandError, '1 de 3 ventas'):
+            call_command('recalcular_ventas', verificar=True, lote=2, stdout=salida)
+        self.assertIn(f'Venta #{ventas[1].ventaid}', salida.getvalue())
+        self.assertEqual(Venta.objects.get(ventaid=ventas[1].ventaid).num_items, 9)
+
+        call_command('recalcular_ventas', lote=2, stdout=salida)
+        self.assertEqual(self.totales(ventas[1]), (2, 2, Decimal('201.00'), Decimal('201.00')))
+        call_command('recalcular_ventas', verificar=True, stdout=salida)
+
+
+class ResumenesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        autor, editorial = crear_autor_y_editorial()
+        cls.libros = crear_libros(2, autor, editorial, stock=10)
+        Libro.objects.filter(libroid=cls.libros[1].libroid).update(genero='HIS')
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+        cls.cliente = User.objects.create_user('cliente')
+
+    def vender(self, cantidades, metodo='TARJETA'):
+        lineas = {libro.libroid: cantidad for libro, cantidad in zip(self.libros, cantidades) if cantidad}
+        return servicios.registrar_venta(self.cliente.id, metodo, lineas, pago_recibido=Decimal('10000'))
+
+    def contenido(self):
+        """Filas de todas las tablas de resúmenes, sin las que quedaron en cero."""
+        return {
+            modelo.__name__: sorted(
+                modelo.objects.exclude(**{campo: 0})
+                .values_list(*[f.attname for f in modelo._meta.fields if f.name != 'id'])
+            )
+            for modelo, campo in (
+                (ResumenDiaMetodo, 'ventas'), (ResumenDiaLibro, 'unidades'), (ResumenDiaGenero, 'unidades'),
+                (ResumenDiaEditorial, 'unidades'), (ResumenDiaClientes, 'nuevos'),
+            )
+        }
+
+    def test_venta_y_cancelacion(self):
+        hoy = timezone.localdate()
+        venta = self.vender([2, 1])
+        self.vender([0, 3], metodo='EFECTIVO')
+
+        reporte = resumenes.reporte(hoy, hoy)
+        self.assertEqual(reporte['totales'], {'ventas': 2, 'unidades': 6, 'ingresos': Decimal('604.00')})
+        self.assertEqual({f['genero']: f['unidades'] for f in reporte['por_genero']}, {'FIC': 2, 'HIS': 4})
+        self.assertEqual(reporte['libros'][0]['libro'], self.libros[1].libroid)
+
+        servicios.cancelar_ventas([venta.ventaid])
+        reporte = resumenes.reporte(hoy, hoy)
+        self.assertEqual(reporte['totales']['ingresos'], Decimal('303.00'))
+        self.assertEqual([f['metodopago'] for f in reporte['por_metodo']], ['EFECTIVO'])
+
+    def test_incremental_coincide_con_reconstruir(self):
+        Cliente.objects.create(user=self.cliente, email='cliente@example.com')
+        ventas = [self.vender([1, 2]), self.vender([3, 0]), self.vender([1, 1], metodo='EFECTIVO')]
+        servicios.cancelar_ventas([ventas[1].ventaid])
+        self.client.force_login(self.admin)
+        detalle = ventas[0].detalles.get(libroid=self.libros[0])
+        self.client.post(reverse('editar_detalle_venta', args=[detalle.detalleventaid]), {
+            'ventaid': ventas[2].ventaid, 'libroid': self.libros[0].libroid, 'cantidad': '5', 'preciounitario': '7',
+        })
+        self.client.post(reverse('editar_venta', args=[ventas[2].ventaid]), {
+            'clienteid': self.cliente.id, 'metodopago': 'TARJETA', 'estadoventa': 'COMPLETADA',
+            'descuentoaplicado': '10', 'pagorecibido': '0',
+        })
+        self.assertEqual(DetalleVenta.objects.get(pk=detalle.pk).ventaid_id, ventas[2].ventaid)
+        self.assertEqual(Venta.objects.get(pk=ventas[2].pk).montototal, Decimal('226.00'))
+        self.client.post(reverse('eliminar_venta', args=[ventas[0].ventaid]))
+
+        incremental = self.contenido()
+        self.assertEqual(incremental['ResumenDiaClientes'], [(timezone.localdate(), 1)])
+        resumenes.reconstruir()
+        self.assertEqual(self.contenido(), incremental)
+
+    def test_reclasificar_libro(self):
+        venta = self.vender([2, 1])
+        otra = Editorial.objects.create(nombre='Anagrama', direccion='', telefono='', email='a@example.com', pais='')
+        libro = Libro.objects.get(pk=self.libros[0].pk)
+        libro.genero, libro.editorialid = 'BIO', otra
+        libro.save()
+        # Cancelar después del cambio resta del grupo nuevo: nada queda en negativo
+        servicios.cancelar_ventas([venta.ventaid])
+        self.assertFalse(ResumenDiaGenero.objects.filter(unidades__lt=0).exists())
+        self.assertFalse(ResumenDiaEditorial.objects.filter(unidades__lt=0).exists())
+
+        self.vender([1, 0])
+        incremental = self.contenido()
+        self.assertEqual([(fila[-1], fila[1]) for fila in incremental['ResumenDiaGenero']], [('BIO', 1)])
+        resumenes.reconstruir()
+        self.assertEqual(self.contenido(), incremental)
+
+    def test_reporte_lee_solo_resumenes(self):
+        for _ in range(3):
+            self.vender([1, 1])
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('reporte_ventas'), {
+                'desde': '2000-01-01', 'hasta': timezone.localdate().isoformat(),
+            })
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['reporte']['totales']['ventas'], 3)
+        self.assertFalse([c for c in consultas if 'detalleventa' in c['sql'] or 'app_libreria_venta' in c['sql']])
+
+    def test_comando_reconstruye(self):
+        self.vender([1, 1])
+        ResumenDiaMetodo.objects.all().delete()
+        call_command('reconstruir_resumenes', '--desde', timezone.localdate().isoformat(), stdout=io.StringIO())
+        self.assertEqual(ResumenDiaMetodo.objects.get().ingresos, Decimal('201.00'))
+
+
+@override_settings(CACHES=CACHE_EN_MEMORIA)
+class AnaliticaTests(TestCase):
+    """Dos semanas completas, del lunes 2 al domingo 15 de marzo de 2026."""
+
+    DESDE, HASTA = datetime.date(2026, 3, 2), datetime.date(2026, 3, 15)
+
+    @classmethod
+    def setUpTestData(cls):
+        autor, editorial = crear_autor_y_editorial()
+        cls.libros = crear_libros(3, autor, editorial, stock=20)
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+        cliente = User.objects.create_user('cliente')
+        for dia, lineas in ((2, {cls.libros[0].libroid: 1}),
+                            (9, {cls.libros[0].libroid: 7, cls.libros[1].libroid: 1})):
+            venta = servicios.registrar_venta(cliente.id, 'TARJETA', lineas)
+            Venta.objects.filter(pk=venta.pk).update(
+                fechaventa=timezone.make_aware(datetime.datetime(2026, 3, dia, 12))
+            )
+        resumenes.reconstruir()
+
+    def setUp(self):
+        cache.clear()
+
+    def metrica(self, nombre, **parametros):
+        return analitica.METRICAS[nombre](self.DESDE, self.HASTA, **parametros)
+
+    @skipUnless(analitica.disponible(), 'NumPy no está instalado')
+    def test_series_y_crecimiento(self):
+        dias = self.metrica('ingresos-diarios')['dias']
+        self.assertEqual(len(dias), 14)
+        self.assertEqual([d['media_7'] for d in dias[:7]], [None] * 6 + [14.29])
+        self.assertEqual(dias[7], {'dia': datetime.date(2026, 3, 9), 'ventas': 1, 'ingresos': 801.0,
+                                   'media_7': 114.43, 'media_28': None})
+
+        semanas = self.metrica('crecimiento-semanal')['semanas']
+        self.assertEqual([(s['inicio'], s['ingresos'], s['variacion']) for s in semanas], [
+            (datetime.date(2026, 3, 2), 100.0, None), (datetime.date(2026, 3, 9), 801.0, 701.0),
+        ])
+
+    @skipUnless(analitica.disponible(), 'NumPy no está instalado')
+    def test_libros_canasta_y_abc(self):
+        self.assertEqual(
+            [(f['libro_id'], f['unidades']) for f in self.metrica('mas-vendidos')['libros']],
+            [(self.libros[0].libroid, 8), (self.libros[1].libroid, 1)],
+        )
+
+        canasta = self.metrica('canasta')
+        self.assertEqual(canasta['ventas'], 2)
+        self.assertEqual({f['unidades']: f['ventas'] for f in canasta['distribucion'] if f['ventas']},
+                         {'1': 1, '8': 1})
+        self.assertEqual(canasta['ticket_promedio'], 450.5)
+
+        abc = self.metrica('abc')
+        self.assertEqual([f['clase'] for f in abc['libros']], ['A', 'B'])
+        self.assertEqual({clase: datos['libros'] for clase, datos in abc['resumen'].items()},
+                         {'A': 1, 'B': 1, 'C': 1})
+
+    @skipUnless(analitica.disponible(), 'NumPy no está instalado')
+    def test_api(self):
+        self.client.force_login(self.admin)
+        url = reverse('analitica_ventas', args=['mas-vendidos'])
+        respuesta = self.client.get(url, {'desde': '2026-03-02', 'hasta': '2026-03-15', 'limite': '1'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(respuesta.json()['libros']), 1)
+        self.assertIn('private', respuesta['Cache-Control'])
+        self.assertIn(f'max-age={analitica.ttl()}', respuesta['Cache-Control'])
+        # La segunda vez sale de la caché
+        with self.assertNumQueries(2):  # sesión y usuario
+            self.client.get(url, {'desde': '2026-03-02', 'hasta': '2026-03-15', 'limite': '1'})
+
+        self.assertEqual(self.client.get(reverse('analitica_ventas', args=['nada'])).status_code, 404)
+
+    @skipUnless(analitica.disponible(), 'NumPy no está instalado')
+    def test_rango_de_fechas_acotado(self):
+        self.client.force_login(self.admin)
+        url = reverse('analitica_ventas', args=['canasta'])
+        for parametros, esperado in (
+            ({'hasta': '0001-01-05'}, None),
+            ({'desde': '0001-01-01', 'hasta': '9999-12-31'}, None),
+            ({'desde': '2000-01-01', 'hasta': '2026-03-15'},
+             ('2026-03-15', resumenes.MAX_DIAS_REPORTE)),
+        ):
+            with self.subTest(**parametros):
+                respuesta = self.client.get(url, parametros)
+                self.assertEqual(respuesta.status_code, 200)
+                desde = datetime.date.fromisoformat(respuesta.json()['desde'])
+                hasta = datetime.date.fromisoformat(respuesta.json()['hasta'])
+                if esperado is None:
+                    self.assertEqual(hasta, timezone.localdate())
+                else:
+                    self.assertEqual((hasta.isoformat(), (hasta - desde).days + 1), esperado)
+
+    def test_api_sin_numpy_o_sin_permisos(self):
+        url = reverse('analitica_ventas', args=['abc'])
+        self.client.force_login(User.objects.create_user('otro'))
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.admin)
+        with mock.patch.object(analitica, 'np', None):
+            self.assertEqual(self.client.get(url).status_code, 503)
+
+
+@override_settings(CACHES=CACHE_EN_MEMORIA)
+class PanelAdminTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        autor, editorial = crear_autor_y_editorial()
+        cls.libros = crear_libros(2, autor, editorial, stock=10)
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+        cls.cliente = User.objects.create_user('cliente')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def vender(self):
+        return servicios.registrar_venta(self.cliente.id, 'EFECTIVO', {self.libros[0].libroid: 2},
+                                         pago_recibido=Decimal('1000'))
+
+    def test_indicadores_y_ventas_recientes(self):
+        venta = self.vender()
+        respuesta = self.client.get(reverse('panel_admin'))
+
+        stats = respuesta.context['stats']
+        self.assertEqual(stats['ventas_hoy'], 1)
+        self.assertEqual(stats['ingresos_hoy'], venta.montototal)
+        self.assertEqual(stats['ingresos_por_metodo'][0]['metodopago'], 'EFECTIVO')
+        self.assertEqual(stats['ingresos_por_genero'][0]['unidades'], 2)
+        self.assertEqual(list(respuesta.context['ventas_recientes']), [venta])
+
+    def test_cache_se_invalida_al_vender_y_cancelar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            venta = self.vender()
+        self.assertEqual(self.client.get(reverse('panel_admin')).context['stats']['ingresos_hoy'],
+                         venta.montototal)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            servicios.cancelar_ventas([venta.ventaid])
+        self.assertEqual(self.client.get(reverse('panel_admin')).context['stats']['ingresos_hoy'], 0)
+
+
+class InventarioTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        autor, cls.planeta = crear_autor_y_editorial()
+        cls.libros = crear_libros(3, autor, cls.planeta)
+        for libro, stock in zip(cls.libros, (0, 5, 20)):
+            libro.stock = stock
+        Libro.objects.bulk_update(cls.libros, ['stock'])
+        borges = Autor.objects.create(nombre='Jorge Luis', apellido='Borges', nacionalidad='Argentina',
+                                      fechanacimiento=datetime.date(1899, 8, 24), bibliografia='')
+        cls.anagrama = Editorial.objects.create(nombre='Anagrama', direccion='', telefono='',
+                                                email='info@anagrama.es', pais='España')
+        cls.ficciones = Libro.objects.create(
+            titulo='Ficciones', autorid=borges, editorialid=cls.anagrama, isbn='978-8420633114',
+            aniopublicacion=1944, genero='HIS', precioventa=Decimal('250.50'), stock=4,
+        )
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+
+    def test_valuacion(self):
+        # 100 × 0 + 101 × 5 + 102 × 20 + 250.50 × 4
+        self.assertEqual(inventario.valuar_inventario(), {
+            'total_libros': 4, 'disponibles': 3, 'stock_bajo': 2, 'total_stock': 29,
+            'valor_total': Decimal('3547.00'),
+        })
+        self.assertEqual(
+            [(f['editorialid__nombre'], f['libros'], f['unidades'], f['valor'])
+             for f in inventario.valuacion_por_editorial()],
+            [('Editorial Planeta', 3, 25, Decimal('2545.00')), ('Anagrama', 1, 4, Decimal('1002.00'))],
+        )
+        self.assertEqual(
+            {f['nombre']: f['valor'] for f in inventario.valuacion_por_genero()},
+            {'Ficción': Decimal('2545.00'), 'Histórico': Decimal('1002.00')},
+        )
+
+    def test_filtros(self):
+        def ids(**params):
+            return [libro.libroid for libro in inventario.filtrar_inventario(params)]
+
+        self.assertEqual(ids(stock_bajo='1', orden='libroid'),
+                         [self.libros[0].libroid, self.libros[1].libroid, self.ficciones.libroid])
+        for busqueda in ('ficc', '8420633', 'borges', 'JORGE', 'anagrama'):
+            with self.subTest(q=busqueda):
+                self.assertEqual(ids(q=busqueda), [self.ficciones.libroid])
+        self.assertEqual(ids(q='planeta', genero='FIC', orden='-precio'),
+                         [libro.libroid for libro in reversed(self.libros)])
+        self.assertEqual(ids(editorial=str(self.anagrama.pk)), [self.ficciones.libroid])
+
+    def test_listado_paginado_con_consultas_constantes(self):
+        crear_libros(2 * inventario.POR_PAGINA, self.libros[0].autorid, self.planeta, inicio=10)
+        self.client.force_login(self.admin)
+        consultas = []
+        for pagina in (1, 3):
+            with CaptureQueriesContext(connection) as capturadas:
+                respuesta = self.client.get(reverse('admin_libros'), {'page': pagina, 'orden': 'libroid'})
+            consultas.append(len(capturadas))
+            self.assertEqual(respuesta.context['pagina'].number, pagina)
+        self.assertEqual(len(self.client.get(reverse('admin_libros')).context['libros']), inventario.POR_PAGINA)
+        self.assertEqual(respuesta.context['pagina'].paginator.num_pages, 3)
+        self.assertEqual(consultas[0], consultas[1])
+
+
+class CatalogoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        autor, editorial = crear_autor_y_editorial()
+        cls.libros = crear_libros(23, autor, editorial)
+        # Precios y títulos repetidos: el cursor tiene que desempatar por libroid
+        for i, libro in enumerate(cls.libros):
+            libro.precioventa = Decimal('100.00') + i % 3
+            libro.titulo = f'Título {i % 4}'
+        Libro.objects.bulk_update(cls.libros, ['precioventa', 'titulo'])
+
+    def recorrer(self, orden, tamanio=5):
+        filtros = catalogo.leer_filtros({'orden': orden, 'tamanio': str(tamanio)})
+        libros, cursor = [], None
+        while True:
+            pagina = catalogo.obtener_pagina(filtros, cursor)
+            self.assertLessEqual(len(pagina['libros']), tamanio)
+            libros += pagina['libros']
+            cursor = pagina['siguiente']
+            if cursor is None:
+                return libros
+
+    def test_cada_libro_aparece_una_vez(self):
+        for orden in catalogo.ORDENES:
+            with self.subTest(orden=orden):
+                campo, descendente = catalogo.ORDENES[orden]
+                libros = self.recorrer(orden)
+                self.assertEqual(sorted(libro.libroid for libro in libros),
+                                 sorted(libro.libroid for libro in self.libros))
+                claves = [(getattr(libro, campo), libro.libroid) for libro in libros]
+                self.assertEqual(claves, sorted(claves, reverse=descendente))
+
+    def test_cursor_invalido_vuelve_al_inicio(self):
+        filtros = catalogo.leer_filtros({'orden': 'precio_asc', 'tamanio': '5'})
+        primera = [libro.libroid for libro in catalogo.obtener_pagina(filtros)['libros']]
+        alterado = catalogo._codificar('no-es-precio', 0)
+        for cursor in ('basura', '!!!', alterado, catalogo._codificar('busqueda', 5)[:-3]):
+            with self.subTest(cursor=cursor):
+                pagina = catalogo.obtener_pagina(filtros, cursor)
+                self.assertEqual([libro.libroid for libro in pagina['libros']], primera)
+
+    def test_api(self):
+        respuesta = self.client.get(reverse('libros_api'), {'orden': 'titulo_desc', 'tamanio': '20'})
+        datos = respuesta.json()
+        self.assertEqual(set(datos), {'resultados', 'siguiente'})
+        self.assertEqual(len(datos['resultados']), 20)
+        self.assertEqual(set(datos['resultados'][0]), {
+            'libroid', 'titulo', 'autor', 'genero', 'precioventa', 'stock', 'portada',
+        })
+        self.assertEqual(datos['resultados'][0]['titulo'], 'Título 3')
+        self.assertEqual(datos['resultados'][0]['autor'], 'Gabriel García Márquez')
+
+        siguiente = self.client.get(
+            reverse('libros_api'), {'orden': 'titulo_desc', 'tamanio': '20', 'cursor': datos['siguiente']}
+        ).json()
+        self.assertEqual(len(siguiente['resultados']), 3)
+        self.assertIsNone(siguiente['siguiente'])
+
+
+class BusquedaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor, cls.editorial = crear_autor_y_editorial()
+        datos = {
+            'autorid': cls.autor, 'editorialid': cls.editorial, 'aniopublicacion': 1967,
+            'genero': 'FIC', 'precioventa': Decimal('450.00'), 'stock': 5,
+        }
+        cls.cien_anios = Libro.objects.create(
+            titulo='Cien años de soledad', isbn='978-8437604947',
+            descripcion='La obra maestra del realismo mágico', **datos
+        )
+        cls.otro = Libro.objects.create(
+            titulo='El otoño del patriarca', isbn='978-8497592437',
+            descripcion='Novela sobre la soledad del poder', **datos
+        )
+
+    def test_sin_acentos_y_por_prefijo(self):
+        self.assertEqual(busqueda.buscar_ids('anos'), [self.cien_anios.libroid])
+        self.assertEqual(busqueda.buscar_ids('MAGI'), [self.cien_anios.libroid])
+        self.assertEqual(set(busqueda.buscar_ids('garcia marq')), {self.cien_anios.libroid, self.otro.libroid})
+
+    def test_titulo_pesa_mas_que_descripcion(self):
+        self.assertEqual(busqueda.buscar_ids('soledad'), [self.cien_anios.libroid, self.otro.libroid])
+
+    def test_isbn_exacto(self):
+        self.assertEqual(busqueda.buscar_ids('978-8497592437'), [self.otro.libroid])
+
+    def test_caracteres_especiales_no_rompen_la_consulta(self):
+        self.assertEqual(busqueda.buscar_ids('"soledad" AND (NEAR'), [])
+        self.assertEqual(busqueda.buscar_ids('*'), [])
+
+    def test_indice_sigue_a_los_modelos(self):
+        self.autor.apellido = 'Borges'
+        self.autor.save()
+        self.assertEqual(len(busqueda.buscar_ids('borges')), 2)
+
+        self.otro.delete()
+        self.assertEqual(busqueda.buscar_ids('borges'), [self.cien_anios.libroid])
+
+    def test_catalogo_con_busqueda(self):
+        respuesta = self.client.get(reverse('libros_api'), {'q': 'patriarca'})
+        self.assertEqual([libro['titulo'] for libro in respuesta.json()['resultados']],
+                         ['El otoño del patriarca'])
+
+    def test_filtros_antes_del_limite(self):
+        # Más coincidencias que busqueda.LIMITE: los filtros no deben aplicarse sobre las primeras 100
+        Libro.objects.bulk_create([
+            Libro(
+                titulo=f'La sombra {i:03d}', autorid=self.autor, editorialid=self.editorial,
+                isbn=f'979-{i:09d}', aniopublicacion=2000, genero='BIO' if i % 4 == 0 else 'FIC',
+                precioventa=Decimal('100.00') + i % 7, stock=i % 2,
+            )
+            for i in range(2 * busqueda.LIMITE + 60)
+        ])
+        busqueda.reconstruir_indice()
+        en_stock = Libro.objects.filter(titulo__startswith='La sombra', stock__gt=0)
+
+        for parametros, esperados in (
+            ({'q': 'sombra'}, en_stock),
+            ({'q': 'sombra', 'genero': 'BIO', 'stock': 'todos'}, Libro.objects.filter(genero='BIO')),
+        ):
+            with self.subTest(**parametros):
+                filtros = catalogo.leer_filtros({**parametros, 'tamanio': '40'})
+                vistos, cursor = [], None
+                while True:
+                    pagina = catalogo.obtener_pagina(filtros, cursor)
+                    self.assertEqual(pagina['total'], esperados.count())
+                    vistos += [libro.libroid for libro in pagina['libros']]
+                    cursor = pagina['siguiente']
+                    if cursor is None:
+                        break
+                self.assertEqual(len(vistos), len(set(vistos)))
+                self.assertEqual(set(vistos), set(esperados.values_list('libroid', flat=True)))
+
+        filtros = catalogo.leer_filtros({'q': 'sombra', 'orden': 'precio_desc', 'tamanio': '100'})
+        precios = [libro.precioventa for libro in catalogo.obtener_pagina(filtros)['libros']]
+        self.assertEqual(precios, sorted(precios, reverse=True))
+        self.assertEqual(busqueda.contar('sombra', en_stock), en_stock.count())
+
+
+class MetricasTests(TestCase):
+    def setUp(self):
+        metricas.reiniciar()
+        autor, editorial = crear_autor_y_editorial()
+        crear_libros(3, autor, editorial)
+
+    def test_cabeceras_e_histograma(self):
+        with self.settings(DEBUG=True):
+            respuesta = self.client.get(reverse('libros'))
+        self.assertGreater(int(respuesta['X-DB-Consultas']), 0)
+        self.assertEqual(respuesta['X-DB-Duplicadas'], '0')
+        self.assertIn('render;dur=', respuesta['Server-Timing'])
+
+        fila = next(fila for fila in metricas.resumen() if fila['vista'] == 'libros')
+        self.assertEqual(fila['peticiones'], 1)
+        self.assertGreater(fila['tiempo_render'], 0)
+        self.assertEqual(sum(fila['histograma']), 1)
+
+    def test_sin_cabeceras_para_anonimos_en_produccion(self):
+        with self.settings(DEBUG=False):
+            respuesta = self.client.get(reverse('libros'))
+        self.assertNotIn('X-DB-Consultas', respuesta)
+
+    def test_detecta_consultas_duplicadas(self):
+        medicion = metricas.Medicion()
+        with connection.execute_wrapper(medicion):
+            for _ in range(3):
+                list(Libro.objects.filter(libroid=1))
+        self.assertEqual(medicion.consultas, 3)
+        self.assertEqual(medicion.duplicadas, 2)
+
+    def test_panel_de_metricas_solo_staff(self):
+        self.client.get(reverse('inicio'))
+        admin = User.objects.create_user('admin', is_staff=True)
+        self.client.force_login(admin)
+        respuesta = self.client.get(reverse('metricas_panel'))
+        self.assertContains(respuesta, '<code>inicio</code>', html=False)
+
+
+class DatosSinteticosTests(TestCase):
+    def test_generar_es_consistente(self):
+        filas = sinteticos.generar(200, semilla=7)
+        self.assertEqual(Libro.objects.count(), filas['libros'])
+        self.assertEqual(Venta.objects.count(), filas['ventas'])
+        self.assertEqual(User.objects.count(), filas['clientes'])
+
+        venta = Venta.objects.order_by('ventaid').first()
+        self.assertEqual(venta.detalles.aggregate(total=Sum('subtotal'))['total'], venta.montototal)
+        self.assertTrue(self.client.login(username='cliente0000000', password=sinteticos.CONTRASENA))
+        # El índice de búsqueda se reconstruye aunque bulk_create no dispare señales
+        self.assertTrue(busqueda.buscar_ids(Libro.objects.first().titulo))
+
+    def test_poblar_datos_es_determinista(self):
+        salida = io.StringIO()
+        call_command('poblar_datos', libros=100, semilla=3, stdout=salida)
+        primera = list(Libro.objects.order_by('isbn').values_list('titulo', 'precioventa', 'stock'))
+        call_command('poblar_datos', libros=100, semilla=3, limpiar=True, stdout=salida)
+        segunda = list(Libro.objects.order_by('isbn').values_list('titulo', 'precioventa', 'stock'))
+
+        self.assertEqual(primera, segunda)
+        self.assertEqual(Libro.objects.count(), 100 + 4)
+        self.assertEqual(User.objects.filter(username='admin', is_staff=True).count(), 1)
+
+
+@override_settings(CACHES=CACHE_EN_MEMORIA)
+class BenchmarkTests(TestCase):
+    OPCIONES = {'calentamiento': 1, 'iteraciones': 3}
+
+    @classmethod
+    def setUpTestData(cls):
+        sinteticos.generar(200, semilla=7)
+
+    def test_compra_repone_el_stock_del_carrito(self):
+        # Con una unidad por título, la segunda compra ya no tendría stock
+        primeros = Libro.objects.disponibles().order_by('libroid').values_list('libroid', flat=True)[:3]
+        Libro.objects.filter(libroid__in=list(primeros)).update(stock=1)
+        ventas = Venta.objects.count()
+
+        resultados = benchmark.Command(stdout=io.StringIO()).medir({**self.OPCIONES, 'urls': ['procesar_compra']})
+        self.assertEqual(Venta.objects.count(), ventas + 1 + 3 + 1)  # calentamiento, medición y tracemalloc
+        self.assertGreater(resultados['procesar_compra']['consultas'], 0)
+
+    def test_todos_los_escenarios(self):
+        # Un renglón que quedó de una corrida anterior no debe chocar con carrito_usuario_libro_uniq
+        usuario = User.objects.filter(is_staff=False).order_by('pk').first()
+        Carrito.objects.create(usuario=usuario, libro=Libro.objects.disponibles().order_by('libroid').first())
+
+        resultados = benchmark.Command(stdout=io.StringIO()).medir({**self.OPCIONES, 'urls': benchmark.ESCENARIOS})
+        self.assertEqual(list(resultados), benchmark.ESCENARIOS)
+        self.assertEqual(Carrito.objects.filter(usuario=usuario).count(), 0)
+
+    def test_compra_fallida_aborta(self):
+        comando = benchmark.Command()
+        with self.assertRaisesMessage(CommandError, 'no registró la venta'):
+            comando.verificar('procesar_compra', HttpResponseRedirect(reverse('ver_carrito')))
+        comando.verificar('procesar_compra', HttpResponseRedirect(reverse('detalle_venta', args=[1])))
+
+
+class ImportacionTests(TestCase):
+    CSV = (
+        'isbn,titulo,autor,editorial,aniopublicacion,genero,precioventa,stock\n'
+        '9780000000001,Pedro Páramo,Juan Rulfo,FCE,1955,Ficción,199.00,4\n'
+        '9780000000002,El llano en llamas,Juan Rulfo,FCE,1953,FIC,149.50,2\n'
+        '9780000000003,Sin precio,Juan Rulfo,FCE,1953,FIC,gratis,2\n'
+        '9780000000004,,Juan Rulfo,FCE,1953,FIC,10,2\n'
+    )
+
+    def importar(self, texto, formato='csv'):
+        return importacion.importar(importacion.leer_filas(io.BytesIO(texto.encode()), formato))
+
+    def test_crea_libros_autores_y_editoriales_y_reporta_errores(self):
+        resultado = self.importar(self.CSV)
+
+        self.assertEqual((resultado['creados'], resultado['actualizados']), (2, 0))
+        self.assertEqual([numero for numero, _ in resultado['errores']], [4, 5])
+        self.assertEqual(Autor.objects.filter(nombre='Juan', apellido='Rulfo').count(), 1)
+        self.assertEqual(Editorial.objects.filter(nombre='FCE').count(), 1)
+        self.assertEqual(busqueda.buscar_ids('paramo'), [Libro.objects.get(isbn='9780000000001').libroid])
+
+    def test_lista_de_precios_actualiza_solo_sus_columnas(self):
+        self.importar(self.CSV)
+        resultado = self.importar('isbn,precioventa,stock\n9780000000001,210.00,9\n')
+
+        self.assertEqual(resultado['actualizados'], 1)
+        libro = Libro.objects.get(isbn='9780000000001')
+        self.assertEqual((libro.titulo, libro.precioventa, libro.stock), ('Pedro Páramo', Decimal('210.00'), 9))
+
+    def test_cambio_de_genero_corrige_resumenes(self):
+        self.importar(self.CSV)
+        libro = Libro.objects.get(isbn='9780000000001')
+        cliente = User.objects.create_user('cliente')
+        servicios.registrar_venta(cliente.id, 'TARJETA', {libro.libroid: 2})
+        hoy = timezone.localdate()
+
+        self.importar('isbn,genero,editorial\n9780000000001,BIO,Anagrama\n')
+        reporte = resumenes.reporte(hoy, hoy)
+        self.assertEqual({f['genero']: f['unidades'] for f in reporte['por_genero']}, {'BIO': 2})
+        self.assertEqual([(f['editorial__nombre'], f['unidades']) for f in reporte['editoriales']], [('Anagrama', 2)])
+        self.assertFalse(ResumenDiaGenero.objects.filter(unidades__lt=0).exists())
+
+    def test_json_en_flujo(self):
+        filas = [{'isbn': f'97800000001{i:02d}', 'titulo': f'Libro {i}', 'autor': 'Ana Ruiz',
+                  'editorial': 'E', 'aniopublicacion': 2000, 'genero': 'ROM', 'precioventa': '10'}
+                 for i in range(30)]
+        texto = importacion._texto(io.BytesIO(json.dumps(filas).encode()), 'utf-8')
+        leidas = list(importacion._leer_json(texto, tamanio=50))
+        self.assertEqual([fila for _, fila in leidas], filas)
+
+    def test_vista_de_subida(self):
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        archivo = SimpleUploadedFile('precios.csv', self.CSV.encode())
+        respuesta = self.client.post(reverse('importar_libros'), {'archivo': archivo})
+        self.assertEqual(respuesta.context['resultado']['creados'], 2)
+        self.assertContains(respuesta, 'Precio inválido')
+
+
+class ExportacionTests(TestCase):
+    def setUp(self):
+        autor, editorial = crear_autor_y_editorial()
+        self.libros = crear_libros(2, autor, editorial)
+        self.cliente = User.objects.create_user('cliente')
+        self.venta = servicios.registrar_venta(
+            self.cliente.pk, 'EFECTIVO', {self.libros[0].pk: 1, self.libros[1].pk: 2},
+            pago_recibido=Decimal('1000')
+        )
+        self.sin_lineas = Venta.objects.create(clienteid=self.cliente, metodopago='TARJETA')
+
+    def test_csv_una_fila_por_linea(self):
+        filas = list(csv.reader(io.StringIO(''.join(exportacion.exportar('csv')))))
+        self.assertEqual(filas[0][:2], ['ventaid', 'fechaventa'])
+        self.assertEqual([int(fila[0]) for fila in filas[1:]],
+                         [self.venta.pk, self.venta.pk, self.sin_lineas.pk])
+
+    def test_jsonl_anida_detalles_y_filtra_por_fecha(self):
+        objetos = [json.loads(linea) for linea in ''.join(exportacion.exportar('jsonl')).splitlines()]
+        self.assertEqual([len(objeto['detalles']) for objeto in objetos], [2, 0])
+        manana = timezone.localdate() + datetime.timedelta(days=1)
+        self.assertEqual(''.join(exportacion.exportar('jsonl', desde=manana)), '')
+
+    def test_vista_transmite_zip(self):
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        respuesta = self.client.get(reverse('exportar_ventas'), {'formato': 'zip'})
+        self.assertTrue(respuesta.streaming)
+        archivo = zipfile.ZipFile(io.BytesIO(b''.join(respuesta.streaming_content)))
+        detalles = archivo.read('detalles.csv').decode().splitlines()
+        self.assertEqual(len(detalles), 1 + 2)
+
+
+@override_settings(CACHES=CACHE_EN_MEMORIA)
+class DerivadosTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.addCleanup(ajustes.disable)
+        cache.clear()
+        autor, editorial = crear_autor_y_editorial()
+        self.libro = crear_libros(1, autor, editorial)[0]
+
+    def subir_portada(self, ancho, alto):
+        contenido = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x010f] = 'Camara'
+        Image.new('RGB', (ancho, alto), (200, 30, 30)).save(contenido, 'JPEG', exif=exif)
+        self.libro.portada = SimpleUploadedFile('foto.jpeg', contenido.getvalue())
+        self.libro.save()
+        # Lo que haría el worker (manage.py procesar_tareas)
+        self.assertEqual(tareas.procesar_pendientes(), 1)
+
+    def test_original_sin_metadatos_y_derivados_al_subir(self):
+        self.subir_portada(3000, 2000)
+        with Image.open(self.libro.portada.path) as original:
+            self.assertEqual(original.size, (1600, 1067))
+            self.assertEqual(dict(original.getexif()), {})
+        hash_contenido = derivados.hash_de(self.libro.portada)
+        for _, ancho, alto in derivados.tamanios('tarjeta'):
+            for extension in derivados.FORMATOS:
+                nombre = derivados.ruta(hash_contenido, ancho, alto, extension)
+                self.assertTrue(os.path.exists(os.path.join(self.media, nombre)))
+
+    def test_catalogo_usa_picture_con_srcset(self):
+        self.subir_portada(600, 800)
+        html = self.client.get(reverse('libros')).content.decode()
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('-600x500.jpg 2x', html)
+        self.assertIn('width="300" height="250"', html)
+
+
+    def test_sin_derivados_la_plantilla_no_procesa_imagenes(self):
+        self.subir_portada(600, 800)
+        # Caché vacía (o imagen subida antes de los derivados)
+        cache.clear()
+        with mock.patch.object(derivados, 'generar', wraps=derivados.generar) as generar:
+            for _ in range(2):
+                html = self.client.get(reverse('libros')).content.decode()
+                self.assertIn(f'src="{self.libro.portada.url}"', html)
+                self.assertNotIn('<picture>', html)
+            generar.assert_not_called()
+        self.assertEqual(Tarea.objects.filter(nombre='derivados.generar', estado='PENDIENTE').count(), 1)
+
+        tareas.procesar_pendientes()
+        self.assertIn('<source type="image/webp"', self.client.get(reverse('libros')).content.decode())
+
+
+@override_settings(CACHES=CACHE_EN_MEMORIA)
+class TareasTests(TestCase):
+    def test_reintenta_con_espera_y_luego_falla(self):
+        fallar = mock.Mock(side_effect=RuntimeError('sin conexión'))
+        with mock.patch.dict(tareas.REGISTRO, {'prueba.fallar': fallar}):
+            tarea = tareas.encolar('prueba.fallar', 1, max_intentos=2)
+            with self.assertLogs('app_Libreria.tareas', 'ERROR'):
+                self.assertEqual(tareas.procesar_pendientes(), 1)
+            tarea.refresh_from_db()
+            self.assertEqual((tarea.estado, tarea.intentos), ('PENDIENTE', 1))
+            self.assertGreater(tarea.ejecutar_despues, timezone.now())
+            # Todavía no toca reintentarla
+            self.assertEqual(tareas.procesar_pendientes(), 0)
+
+            Tarea.objects.filter(pk=tarea.pk).update(ejecutar_despues=timezone.now())
+            with self.assertLogs('app_Libreria.tareas', 'ERROR'):
+                tareas.procesar_pendientes()
+            tarea.refresh_from_db()
+            self.assertEqual((tarea.estado, tarea.intentos), ('FALLIDA', 2))
+            self.assertIn('sin conexión', tarea.error)
+        fallar.assert_called_with(1)
+
+    def test_proceso_muerto_devuelve_las_tareas_en_curso(self):
+        class PoolFalso:
+            """El primer pool pierde un proceso con la primera tarea; los siguientes las ejecutan."""
+            creados = 0
+
+            def __init__(self, *args, **kwargs):
+                PoolFalso.creados += 1
+                self.primero = PoolFalso.creados == 1
+
+            def submit(self, funcion, tareaid):
+                futuro = Future()
+                if not self.primero:
+                    futuro.set_result(tareas.ejecutar(tareaid))
+                elif not hasattr(self, 'roto'):
+                    self.roto = tareaid
+                    futuro.set_exception(BrokenProcessPool('murió'))
+                return futuro  # las demás del primer pool nunca terminan
+
+            def shutdown(self, wait=True, cancel_futures=False):
+                pass
+
+        ejecutar = mock.Mock(return_value=None)
+        with mock.patch.dict(tareas.REGISTRO, {'prueba.ok': ejecutar}), \
+                mock.patch.object(procesar_tareas, 'ProcessPoolExecutor', PoolFalso):
+            creadas = [tareas.encolar('prueba.ok', i) for i in range(3)]
+            salida = io.StringIO()
+            call_command('procesar_tareas', procesos=2, una_vez=True, intervalo=0.01, stdout=salida, stderr=salida)
+
+        self.assertIn('2 tareas devueltas a la cola', salida.getvalue())
+        self.assertEqual(PoolFalso.creados, 2)
+        self.assertEqual(sorted(Tarea.objects.values_list('estado', flat=True)), ['COMPLETADA'] * 3)
+        # Las dos que estaban en el pool roto se reclamaron una segunda vez
+        intentos = Tarea.objects.filter(pk__in=[t.pk for t in creadas]).values_list('intentos', flat=True)
+        self.assertEqual(sorted(intentos), [1, 2, 2])
+        self.assertEqual(ejecutar.call_count, 3)
+
+    def test_venta_encola_una_sola_reconstruccion(self):
+        cache.clear()
+        autor, editorial = crear_autor_y_editorial()
+        libro = crear_libros(1, autor, editorial)[0]
+        cliente = User.objects.create_user('cliente')
+        estadisticas.obtener_estadisticas()
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                servicios.registrar_venta(cliente.pk, 'TARJETA', {libro.pk: 1})
+        self.assertEqual(Tarea.objects.filter(nombre='estadisticas.reconstruir').count(), 1)
+        # Sin worker, el panel no se queda con los datos viejos
+        self.assertIsNone(cache.get(estadisticas.CLAVE_CACHE))
+        self.assertEqual(estadisticas.obtener_estadisticas()['ventas_hoy'], 2)
+
+        # Con la tarea pendiente, otra venta ya no toca la tabla de tareas
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as consultas:
+            servicios.registrar_venta(cliente.pk, 'TARJETA', {libro.pk: 1})
+        self.assertFalse([q for q in consultas.captured_queries if 'app_Libreria_tarea' in q['sql']])
+
+        # El worker quita la marca: lo que se venda después vuelve a encolar
+        tareas.procesar_pendientes()
+        self.assertEqual(estadisticas.obtener_estadisticas()['ventas_hoy'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            servicios.registrar_venta(cliente.pk, 'TARJETA', {libro.pk: 1})
+        self.assertEqual(Tarea.objects.filter(nombre='estadisticas.reconstruir', estado='PENDIENTE').count(), 1)
+
+    @override_settings(LIBRERIA_EXPORTACIONES_DIR=tempfile.gettempdir())
+    def test_exportacion_en_segundo_plano(self):
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        respuesta = self.client.post(reverse('exportar_ventas'), {'formato': 'csv', 'segundo_plano': '1'})
+        self.assertRedirects(respuesta, reverse('admin_ventas'))
+        tareas.procesar_pendientes()
+        tarea = Tarea.objects.get(nombre='exportacion.ventas')
+        self.addCleanup(exportacion.almacen().delete, tarea.resultado['archivo'])
+        descarga = self.client.get(reverse('descargar_exportacion', args=[tarea.pk]))
+        self.assertTrue(b''.join(descarga.streaming_content).startswith(b'ventaid,fechaventa'))
+
+
+@override_settings(CACHES=CACHE_EN_MEMORIA)
+class CarritoResumenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        autor, editorial = crear_autor_y_editorial()
+        self.libros = crear_libros(2, autor, editorial)
+        self.cliente = User.objects.create_user('cliente')
+        self.client.force_login(self.cliente)
+        Carrito.objects.create(usuario=self.cliente, libro=self.libros[0], cantidad=3)
+
+    def test_resumen_en_una_consulta_y_cacheado(self):
+        with self.assertNumQueries(1):
+            resumen = carrito.CarritoBD(self.cliente).resumen()
+        self.assertEqual((resumen['lineas'], resumen['unidades']), (1, 3))
+        self.assertEqual(resumen['total'], Decimal('300.00'))
+        with self.assertNumQueries(0):
+            carrito.CarritoBD(self.cliente).resumen()
+
+    def test_agregar_invalida_el_contador(self):
+        self.assertContains(self.client.get(reverse('libros')), 'ms-2" data-carrito-lineas>1</span>')
+        self.client.post(reverse('agregar_al_carrito', args=[self.libros[1].pk]))
+        respuesta = self.client.get(reverse('ver_carrito'))
+        self.assertContains(respuesta, 'ms-2" data-carrito-lineas>2</span>')
+        self.assertEqual(respuesta.context['total_carrito'], Decimal('401.00'))
+
+    def test_api_cambia_cantidad_en_una_peticion(self):
+        self.client.get(reverse('libros'))  # deja la sesión y el usuario en caché de la prueba
+        url = reverse('carrito_api_linea', args=[self.libros[0].pk])
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post(url, {'cantidad': 5})
+        # sesión y usuario, libro, reserva (UPDATE o INSERT) y su verificación,
+        # UPDATE del carrito y resumen
+        sentencias = [c['sql'] for c in consultas if not c['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertLessEqual(len(sentencias), 8)
+        self.assertEqual(respuesta.json()['linea'], {'libro_id': self.libros[0].pk, 'subtotal': '500.00'})
+        self.assertEqual(respuesta.json()['resumen'], {'lineas': 1, 'unidades': 5, 'total': '500.00'})
+
+        respuesta = self.client.post(url, {'cantidad': 99})
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()['resumen']['unidades'], 5)
+
+    def test_eliminar_no_acepta_get(self):
+        url = reverse('eliminar_del_carrito', args=[self.libros[0].pk])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertTrue(Carrito.objects.filter(usuario=self.cliente).exists())
+        respuesta = self.client.post(reverse('carrito_api_eliminar', args=[self.libros[0].pk]))
+        self.assertEqual(respuesta.json(), {'resumen': {'lineas': 0, 'unidades': 0, 'total': '0.00'}, 'linea': None})
+
+    def test_visitante_usa_cookie_y_se_fusiona_al_iniciar_sesion(self):
+        self.client.logout()
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.post(reverse('agregar_al_carrito', args=[self.libros[0].pk]))
+            self.client.post(reverse('agregar_al_carrito', args=[self.libros[1].pk]))
+        self.assertFalse([c for c in consultas if not c['sql'].startswith('SELECT')])
+        respuesta = self.client.get(reverse('ver_carrito'))
+        self.assertEqual(respuesta.context['total_carrito'], Decimal('201.00'))
+
+        self.cliente.set_password('clave')
+        self.cliente.save()
+        respuesta = self.client.post(
+            reverse('login_cliente') + '?next=' + reverse('ver_carrito'),
+            {'username': 'cliente', 'password': 'clave'},
+        )
+        self.assertRedirects(respuesta, reverse('ver_carrito'))
+        self.assertEqual(respuesta.cookies[carrito.COOKIE].value, '')
+        # 3 ya en la base + 1 de la cookie; el otro libro se agrega
+        self.assertEqual(
+            dict(Carrito.objects.filter(usuario=self.cliente).values_list('libro_id', 'cantidad')),
+            {self.libros[0].pk: 4, self.libros[1].pk: 1},
+        )
+
+
+@override_settings(CACHES=CACHE_EN_MEMORIA)
+class ReservasTests(TestCase):
+    def setUp(self):
+        autor, editorial = crear_autor_y_editorial()
+        self.libro = crear_libros(1, autor, editorial, stock=3)[0]
+        self.ana = User.objects.create_user('ana')
+        self.beto = User.objects.create_user('beto')
+
+    def agregar(self, usuario, cantidad):
+        self.client.force_login(usuario)
+        return self.client.post(reverse('carrito_api_agregar', args=[self.libro.pk]), {'cantidad': cantidad})
+
+    def test_agregar_aparta_unidades_para_el_cliente(self):
+        self.assertEqual(self.agregar(self.ana, 2).status_code, 200)
+        self.assertEqual(Reserva.objects.get(usuario=self.ana).cantidad, 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(reservas.disponibles([self.libro.pk]), {self.libro.pk: 1})
+        self.assertEqual(reservas.disponibles([self.libro.pk], self.ana), {self.libro.pk: 3})
+
+        respuesta = self.agregar(self.beto, 2)
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertIn('Disponible: 1', respuesta.json()['error'])
+        self.assertEqual(self.agregar(self.beto, 1).status_code, 200)
+
+        # Los visitantes no reservan, pero tampoco toman lo reservado
+        self.client.logout()
+        self.assertEqual(self.client.post(reverse('agregar_al_carrito', args=[self.libro.pk])).status_code, 302)
+        self.assertNotIn(carrito.COOKIE, self.client.cookies)
+
+    def test_reserva_vencida_no_cuenta_y_se_barre(self):
+        self.agregar(self.ana, 3)
+        Reserva.objects.update(expira=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(self.agregar(self.beto, 3).status_code, 200)
+        self.assertEqual(reservas.barrer(), 1)
+        self.assertEqual(list(Reserva.objects.values_list('usuario__username', flat=True)), ['beto'])
+
+        # Ana se quedó sin reserva: no puede comprar lo que apartó Beto
+        with self.assertRaises(servicios.StockInsuficiente):
+            servicios.procesar_compra(self.ana, 'TARJETA')
+        venta = servicios.procesar_compra(self.beto, 'TARJETA')
+        self.assertEqual(venta.detalles.get().cantidad, 3)
+        self.assertEqual(Libro.objects.get(pk=self.libro.pk).stock, 0)
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_volver_al_carrito_recupera_las_reservas_vencidas(self):
+        self.agregar(self.ana, 2)
+        Reserva.objects.update(expira=timezone.now() - datetime.timedelta(minutes=1))
+        self.assertEqual(reservas.disponibles([self.libro.pk]), {self.libro.pk: 3})
+
+        # Ana vuelve a su carrito: lo que sigue disponible se aparta otra vez
+        self.assertEqual(self.client.get(reverse('ver_carrito')).status_code, 200)
+        reserva = Reserva.objects.get(usuario=self.ana)
+        self.assertEqual(reserva.cantidad, 2)
+        self.assertGreater(reserva.expira, timezone.now())
+        self.assertEqual(self.agregar(self.beto, 2).status_code, 409)
+
+    def test_venta_del_panel_respeta_reservas(self):
+        self.agregar(self.ana, 2)
+        with self.assertRaises(servicios.StockInsuficiente):
+            servicios.registrar_venta(self.beto.pk, 'TARJETA', {self.libro.pk: 2})
+        servicios.registrar_venta(self.beto.pk, 'TARJETA', {self.libro.pk: 1})
+        # La compra de Ana convierte su reserva en venta
+        servicios.procesar_compra(self.ana, 'TARJETA')
+        self.assertEqual(Libro.objects.get(pk=self.libro.pk).stock, 0)
+
+    def test_iniciar_sesion_reserva_el_carrito_de_la_cookie(self):
+        self.agregar(self.beto, 1)
+        self.client.logout()
+        self.client.post(reverse('carrito_api_agregar', args=[self.libro.pk]), {'cantidad': 2})
+        self.ana.set_password('clave')
+        self.ana.save()
+        self.client.post(reverse('login_cliente'), {'username': 'ana', 'password': 'clave'})
+        self.assertEqual(Reserva.objects.get(usuario=self.ana).cantidad, 2)
+
+
+class BaseDatosTests(TestCase):
+    def conectar(self, ruta):
+        conexion = SQLiteWrapper({**connection.settings_dict, 'NAME': ruta}, alias='ajustes')
+        conexion.connect()  # dispara connection_created
+        self.addCleanup(conexion.close)
+        return conexion
+
+    def pragma(self, conexion, nombre):
+        with conexion.cursor() as cursor:
+            cursor.execute(f'PRAGMA {nombre}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_al_conectar(self):
+        carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, carpeta)
+        conexion = self.conectar(os.path.join(carpeta, 'libreria.sqlite3'))
+        self.assertEqual(self.pragma(conexion, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(conexion, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(conexion, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(conexion, 'cache_size'), -64000)
+
+    @override_settings(LIBRERIA_SQLITE_PRAGMAS={'journal_mode': None, 'cache_size': -2000})
+    def test_pragmas_configurables(self):
+        carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, carpeta)
+        conexion = self.conectar(os.path.join(carpeta, 'libreria.sqlite3'))
+        self.assertEqual(self.pragma(conexion, 'journal_mode'), 'delete')
+        self.assertEqual(self.pragma(conexion, 'cache_size'), -2000)
+
+    def test_salud(self):
+        respuesta = self.client.get(reverse('salud'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.json()['ok'])
+        self.assertEqual(respuesta['Cache-Control'], 'no-store')
+        with mock.patch.object(connection, 'cursor', side_effect=OperationalError('disk I/O error')), \
+                self.assertLogs('app_Libreria.basedatos', 'ERROR'):
+            self.assertEqual(basedatos.estado()['ok'], False)
+
+
+class PlanesDeConsultaTests(TestCase):
+    """Las consultas frecuentes deben usar un índice: falla si alguna pasa a recorrer toda la tabla."""
+
+    @classmethod
+    def setUpTestData(cls):
+        autor, editorial = crear_autor_y_editorial()
+        crear_libros(30, autor, editorial)
+        cls.cliente = User.objects.create_user('cliente')
+
+    def plan(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [fila[3] for fila in cursor.fetchall()]
+
+    def assertUsaIndice(self, consulta, indice, ordenada=True):
+        pasos = self.plan(*consulta.query.sql_with_params())
+        self.assertTrue(any(indice in paso for paso in pasos), f'{indice} no aparece en {pasos}')
+        # "SCAN tabla" a secas es un recorrido completo sin índice
+        self.assertFalse([paso for paso in pasos if re.fullmatch(r'SCAN \S+', paso)], pasos)
+        if ordenada:
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', pasos)
+
+    def test_catalogo(self):
+        indices = {
+            'default': 'libro_disp_idx',
+            'precio_asc': 'libro_disp_precio_idx',
+            'precio_desc': 'libro_disp_precio_idx',
+            'titulo_asc': 'libro_disp_titulo_idx',
+            'titulo_desc': 'libro_disp_titulo_idx',
+        }
+        for orden, indice in indices.items():
+            with self.subTest(orden=orden):
+                filtros = catalogo.leer_filtros({'orden': orden})
+                self.assertUsaIndice(catalogo.ordenar_libros(catalogo.filtrar_libros(filtros), orden)[:25], indice)
+        filtros = catalogo.leer_filtros({'genero': 'FIC'})
+        self.assertUsaIndice(catalogo.ordenar_libros(catalogo.filtrar_libros(filtros), 'default')[:25],
+                             'libro_disp_genero_idx')
+
+    def test_ventas(self):
+        self.assertUsaIndice(Venta.objects.de_cliente(self.cliente), 'venta_cliente_fecha_idx')
+        self.assertUsaIndice(estadisticas.ventas_recientes(), 'venta_fecha_idx')
+        # Los rangos de fechas de los indicadores del panel
+        with CaptureQueriesContext(connection) as consultas:
+            estadisticas.calcular_estadisticas()
+        por_fecha = [c['sql'] for c in consultas if '"fechaventa" >=' in c['sql']]
+        self.assertEqual(len(por_fecha), 1)
+        pasos = self.plan(por_fecha[0])
+        self.assertTrue(any('venta_fecha_idx' in p or 'venta_estado_fecha_idx' in p for p in pasos), pasos)
+        # Las gráficas y los reportes leen los resúmenes por rango de días
+        self.assertFalse([c for c in consultas if 'detalleventa' in c['sql']])
+        # El índice de la restricción única (fecha, metodopago)
+        self.assertUsaIndice(
+            ResumenDiaMetodo.objects.filter(fecha__gte=datetime.date(2026, 1, 1)),
+            'sqlite_autoindex_app_Libreria_resumendiametodo',
+        )
+
+    def test_eventos_blog_y_carrito(self):
+        self.assertUsaIndice(Evento.objects.filter(activo=True).order_by('fecha'), 'evento_activo_fecha_idx')
+        self.assertUsaIndice(Blog.objects.filter(activo=True).order_by('-fechapublicacion'), 'blog_activo_fecha_idx')
+        self.assertUsaIndice(Carrito.objects.filter(usuario=self.cliente, libro_id=1), 'sqlite_autoindex', False)
+
+    def test_carrito_no_admite_renglones_repetidos(self):
+        libro = Libro.objects.first()
+        Carrito.objects.create(usuario=self.cliente, libro=libro)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Carrito.objects.create(usuario=self.cliente, libro=libro)
+
+
+@override_settings(CACHES=CACHE_EN_MEMORIA)
+class CompraConcurrenteTests(TransactionTestCase):
+    """Muchos clientes compran a la vez el último stock del mismo título."""
+
+    COMPRADORES = 12
+    STOCK = 5
+
+    def setUp(self):
+        autor, editorial = crear_autor_y_editorial()
+        self.libro = crear_libros(1, autor, editorial, stock=self.STOCK)[0]
+        self.clientes = [
+            User.objects.create_user(f'cliente{i}') for i in range(self.COMPRADORES)
+        ]
+        Carrito.objects.bulk_create([
+            Carrito(usuario=cliente, libro=self.libro, cantidad=1) for cliente in self.clientes
+        ])
+
+    def comprar(self, cliente, barrera, resultados):
+        barrera.wait()
+        try:
+            # SQLite puede rechazar la escritura si la base está ocupada; el
+            # cliente reintenta igual que lo haría un usuario real.
+            for _ in range(50):
+                try:
+                    servicios.procesar_compra(cliente, 'TARJETA')
+                    resultados.append('ok')
+                    return
+                except servicios.StockInsuficiente:
+                    resultados.append('sin_stock')
+                    return
+                except OperationalError:
+                    time.sleep(0.01)
+            resultados.append('bloqueada')
+        finally:
+            connection.close()
+
+    def test_no_se_vende_mas_del_stock(self):
+        barrera = threading.Barrier(self.COMPRADORES)
+        resultados = []
+        hilos = [
+            threading.Thread(target=self.comprar, args=(cliente, barrera, resultados))
+            for cliente in self.clientes
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.libro.refresh_from_db()
+        self.assertEqual(resultados.count('ok'), self.STOCK)
+        self.assertEqual(resultados.count('sin_stock'), self.COMPRADORES - self.STOCK)
+        self.assertEqual(self.libro.stock, 0)
+        self.assertEqual(Venta.objects.count(), self.STOCK)
+        self.assertEqual(DetalleVenta.objects.count(), self.STOCK)
@@ -5,6 +5,7 @@ urlpatterns = [
     # Páginas públicas
     path('', views.inicio, name='inicio'),
     path('libros/', views.libros, name='libros'),
+    path('libros/api/', views.libros_api, name='libros_api'),
     path('eventos/', views.eventos, name='eventos'),
     path('blog/', views.blog, name='blog'),
     path('contacto/', views.contacto, name='contacto'),
@@ -18,6 +19,11 @@ urlpatterns = [
     
     # Panel administrador
     path('panel-admin/', views.panel_admin, name='panel_admin'),
+    path('panel-admin/metricas/', views.metricas_panel, name='metricas_panel'),
+    path('panel-admin/analitica/<slug:metrica>/', views.analitica_ventas, name='analitica_ventas'),
+    
+    # Comprobación de salud para el balanceador
+    path('salud/', views.salud, name='salud'),
     
     # CRUD Autores (admin)
     path('panel-admin/autores/', views.admin_autores, name='admin_autores'),
@@ -36,6 +42,7 @@ urlpatterns = [
     path('panel-admin/libros/agregar/', views.agregar_libro, name='agregar_libro'),
     path('panel-admin/libros/editar/<int:id>/', views.editar_libro, name='editar_libro'),
     path('panel-admin/libros/eliminar/<int:id>/', views.eliminar_libro, name='eliminar_libro'),
+    path('panel-admin/libros/importar/', views.importar_libros, name='importar_libros'),
     
     # CRUD Ventas (admin)
     path('panel-admin/ventas/', views.admin_ventas, name='admin_ventas'),
@@ -44,6 +51,10 @@ urlpatterns = [
     path('panel-admin/ventas/eliminar/<int:id>/', views.eliminar_venta, name='eliminar_venta'),
     path('panel-admin/ventas/<int:venta_id>/', views.detalle_venta_admin, name='detalle_venta_admin'),
     path('panel-admin/ventas/cancelar/<int:venta_id>/', views.cancelar_venta, name='cancelar_venta'),
+    path('panel-admin/ventas/cancelar/', views.cancelar_ventas_lote, name='cancelar_ventas_lote'),
+    path('panel-admin/ventas/exportar/', views.exportar_ventas, name='exportar_ventas'),
+    path('panel-admin/ventas/reporte/', views.reporte_ventas, name='reporte_ventas'),
+    path('panel-admin/ventas/exportaciones/<int:id>/', views.descargar_exportacion, name='descargar_exportacion'),
     
     # CRUD Detalles Venta (admin)
     path('panel-admin/detalles-venta/', views.admin_detalles_venta, name='admin_detalles_venta'),
@@ -62,8 +73,12 @@ urlpatterns = [
     # Carrito y compras (cliente)
     path('carrito/agregar/<int:libro_id>/', views.agregar_al_carrito, name='agregar_al_carrito'),
     path('carrito/', views.ver_carrito, name='ver_carrito'),
-    path('carrito/actualizar/<int:item_id>/', views.actualizar_carrito, name='actualizar_carrito'),
-    path('carrito/eliminar/<int:item_id>/', views.eliminar_del_carrito, name='eliminar_del_carrito'),
+    path('carrito/actualizar/<int:libro_id>/', views.actualizar_carrito, name='actualizar_carrito'),
+    path('carrito/eliminar/<int:libro_id>/', views.eliminar_del_carrito, name='eliminar_del_carrito'),
+    path('carrito/api/', views.carrito_api, name='carrito_api'),
+    path('carrito/api/agregar/<int:libro_id>/', views.carrito_api_agregar, name='carrito_api_agregar'),
+    path('carrito/api/<int:libro_id>/', views.carrito_api_linea, name='carrito_api_linea'),
+    path('carrito/api/<int:libro_id>/eliminar/', views.carrito_api_eliminar, name='carrito_api_eliminar'),
     path('carrito/procesar-compra/', views.procesar_compra, name='procesar_compra'),
     path('carrito/venta/<int:venta_id>/', views.detalle_venta, name='detalle_venta'),
     path('mis-compras/', views.mis_compras, name='mis_compras'),
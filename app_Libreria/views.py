@@ -3,9 +3,25 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import HttpResponseForbidden
+from django.core.paginator import Paginator
+from django.http import FileResponse, Http404, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_GET, require_POST
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+import logging
+import re
+import uuid
 from .models import *
+from . import (
+    analitica, basedatos, carrito, catalogo, estadisticas, exportacion, importacion, inventario, metricas, resumenes,
+    servicios, tareas,
+)
+
+logger = logging.getLogger(__name__)
 
 # =============================================
 # DECORADORES PERSONALIZADOS
@@ -17,6 +33,10 @@ def es_administrador(user):
 def es_cliente(user):
     return user.is_authenticated and not user.is_staff
 
+def puede_comprar(user):
+    # Clientes y visitantes anónimos (estos con el carrito en cookie)
+    return not user.is_staff
+
 def crear_perfil_cliente(user):
     """Crear perfil de cliente automáticamente cuando un usuario se registra"""
     if not hasattr(user, 'cliente'):
@@ -24,7 +44,7 @@ def crear_perfil_cliente(user):
             user=user,
             telefono='',
             direccion='',
-            preferenciasgenero=''  # CORREGIDO: sin guión
+            preferencias_genero=''
         )
 
 # =============================================
@@ -34,27 +54,62 @@ def crear_perfil_cliente(user):
 def inicio(request):
     try:
         # Filtrar solo libros con libroid válido
-        libros = Libro.objects.filter(stock__gt=0).exclude(libroid__isnull=True)[:8]
+        libros = Libro.objects.disponibles().con_autor()[:8]
         return render(request, 'inicio.html', {'libros': libros})
     except Exception as e:
-        print(f"Error en vista inicio: {e}")
+        logger.exception("Error en vista inicio: %s", e)
         return render(request, 'inicio.html', {'libros': []})
 
 def libros(request):
+    filtros = catalogo.leer_filtros(request.GET)
     try:
-        # Filtrar solo libros con libroid válido y stock
-        libros_lista = Libro.objects.filter(stock__gt=0).exclude(libroid__isnull=True)
-        return render(request, 'libros.html', {'libros': libros_lista})
+        libros_base = Libro.objects.con_autor()
+        pagina = catalogo.obtener_pagina(filtros, request.GET.get('cursor'), libros_base)
+        total = pagina['total']
+        if total is None:
+            total = catalogo.filtrar_libros(filtros).count()
     except Exception as e:
-        print(f"Error en vista libros: {e}")
-        return render(request, 'libros.html', {'libros': []})
+        logger.exception("Error en vista libros: %s", e)
+        pagina, total = {'libros': [], 'siguiente': None}, 0
+
+    # Enlaces de paginación conservando los filtros activos
+    parametros = request.GET.copy()
+    parametros.pop('cursor', None)
+    primera_url = parametros.urlencode()
+    siguiente_url = ''
+    if pagina['siguiente']:
+        parametros['cursor'] = pagina['siguiente']
+        siguiente_url = parametros.urlencode()
+
+    contexto = {
+        'libros': pagina['libros'],
+        'total': total,
+        'filtros': filtros,
+        'generos': Libro.GENEROS,
+        'siguiente_url': siguiente_url,
+        'primera_url': primera_url,
+    }
+    # Las peticiones hechas con fetch solo necesitan el bloque de resultados
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return render(request, 'catalogo/resultados.html', contexto)
+    return render(request, 'libros.html', contexto)
+
+def libros_api(request):
+    """Catálogo en JSON con los mismos filtros y cursor que la vista libros"""
+    filtros = catalogo.leer_filtros(request.GET)
+    libros_base = Libro.objects.con_autor()
+    pagina = catalogo.obtener_pagina(filtros, request.GET.get('cursor'), libros_base)
+    return JsonResponse({
+        'resultados': [catalogo.serializar_libro(libro) for libro in pagina['libros']],
+        'siguiente': pagina['siguiente'],
+    })
 
 def eventos(request):
-    eventos_lista = Evento.objects.filter(activo=True)
+    eventos_lista = Evento.objects.filter(activo=True).order_by('fecha')
     return render(request, 'eventos.html', {'eventos': eventos_lista})
 
 def blog(request):
-    entradas = Blog.objects.filter(activo=True)
+    entradas = Blog.objects.filter(activo=True).order_by('-fechapublicacion')
     return render(request, 'blog.html', {'entradas': entradas})
 
 def contacto(request):
@@ -78,7 +133,14 @@ def login_cliente(request):
             # Crear perfil de cliente si no existe
             crear_perfil_cliente(user)
             messages.success(request, f'¡Bienvenido {user.username}!')
-            return redirect('inicio')
+            # Lo que agregó como visitante pasa a su carrito
+            anonimo = carrito.fusionar(request, user)
+            siguiente = request.GET.get('next', '')
+            if not url_has_allowed_host_and_scheme(siguiente, allowed_hosts={request.get_host()}):
+                siguiente = 'inicio'
+            respuesta = redirect(siguiente)
+            anonimo.guardar(respuesta)
+            return respuesta
         else:
             messages.error(request, 'Credenciales inválidas o no es una cuenta de cliente')
     
@@ -111,15 +173,79 @@ def logout_view(request):
 @login_required
 @user_passes_test(es_administrador)
 def panel_admin(request):
-    stats = {
-        'total_libros': Libro.objects.count(),
-        'total_ventas': Venta.objects.count(),
-        'total_usuarios': User.objects.count(),
-        'total_eventos': Evento.objects.count(),
-        'ventas_hoy': Venta.objects.filter(fechaventa__date=timezone.now().date()).count(),
-        'ingresos_hoy': sum(venta.montototal for venta in Venta.objects.filter(fechaventa__date=timezone.now().date())),
-    }
-    return render(request, 'admin/panel_admin.html', {'stats': stats})
+    return render(request, 'admin/panel_admin.html', {
+        'stats': estadisticas.obtener_estadisticas(),
+        'ventas_recientes': estadisticas.ventas_recientes(),
+    })
+
+def _rango_fechas(request):
+    """
+    desde y hasta de la petición; por omisión, los últimos DIAS_REPORTE días.
+    Un rango de más de MAX_DIAS_REPORTE días se recorta contando desde hasta.
+    """
+    hoy = timezone.localdate()
+    try:
+        hasta = parse_date(request.GET.get('hasta', '')) or hoy
+        desde = parse_date(request.GET.get('desde', '')) or hasta - timedelta(days=resumenes.DIAS_REPORTE - 1)
+        if desde > hasta:
+            desde, hasta = hasta, desde
+        # Las consultas van de la medianoche de desde a la del día siguiente
+        # a hasta: en los extremos del calendario (año 1 o 9999) no existen
+        resumenes.inicio_del_dia(desde)
+        resumenes.inicio_del_dia(hasta + timedelta(days=1))
+    except (ValueError, OverflowError):
+        hasta = hoy
+        desde = hasta - timedelta(days=resumenes.DIAS_REPORTE - 1)
+    return max(desde, hasta - timedelta(days=resumenes.MAX_DIAS_REPORTE - 1)), hasta
+
+@login_required
+@user_passes_test(es_administrador)
+def reporte_ventas(request):
+    # Lee solo los resúmenes diarios: un año son unos cientos de filas
+    desde, hasta = _rango_fechas(request)
+    return render(request, 'admin/ventas/reporte.html', {'reporte': resumenes.reporte(desde, hasta)})
+
+@login_required
+@user_passes_test(es_administrador)
+@require_GET
+def analitica_ventas(request, metrica):
+    if metrica not in analitica.METRICAS:
+        raise Http404('Métrica desconocida')
+    if not analitica.disponible():
+        return JsonResponse({'error': 'La analítica requiere NumPy, que no está instalado'}, status=503)
+    desde, hasta = _rango_fechas(request)
+    try:
+        limite = min(max(int(request.GET.get('limite', analitica.LIMITE)), 1), analitica.MAX_LIMITE)
+    except ValueError:
+        limite = analitica.LIMITE
+    respuesta = JsonResponse(analitica.calcular(metrica, desde, hasta, limite))
+    # Datos del panel: solo el navegador del administrador puede guardarlos
+    patch_cache_control(respuesta, private=True, max_age=analitica.ttl())
+    return respuesta
+
+@login_required
+@user_passes_test(es_administrador)
+def metricas_panel(request):
+    if request.method == 'POST':
+        metricas.reiniciar()
+        messages.success(request, 'Métricas reiniciadas')
+        return redirect('metricas_panel')
+    return render(request, 'admin/metricas.html', {
+        'vistas': metricas.resumen(),
+        'intervalos': metricas.etiquetas_intervalos(),
+        'muestras_por_vista': metricas.MUESTRAS_POR_VISTA,
+    })
+
+# =============================================
+# SALUD (BALANCEADOR Y MONITOREO)
+# =============================================
+
+@require_GET
+def salud(request):
+    datos = basedatos.estado()
+    respuesta = JsonResponse(datos, status=200 if datos['ok'] else 503)
+    respuesta['Cache-Control'] = 'no-store'
+    return respuesta
 
 # =============================================
 # CRUD AUTORES (ADMIN) - COMPLETO
@@ -142,11 +268,10 @@ def agregar_autor(request):
             nacionalidad = request.POST.get('nacionalidad')
             fechanacimiento = request.POST.get('fechanacimiento')
             
-            print(f"Debug - Campos recibidos:")
-            print(f"Nombre: {nombre}")
-            print(f"Apellido: {apellido}") 
-            print(f"Nacionalidad: {nacionalidad}")
-            print(f"Fecha Nacimiento: {fechanacimiento}")
+            logger.debug(
+                "agregar_autor - campos recibidos: nombre=%r apellido=%r nacionalidad=%r fechanacimiento=%r",
+                nombre, apellido, nacionalidad, fechanacimiento
+            )
             
             # Validar campos requeridos
             if not all([nombre, apellido, nacionalidad, fechanacimiento]):
@@ -279,17 +404,30 @@ def eliminar_editorial(request, id):
 @login_required
 @user_passes_test(es_administrador)
 def admin_libros(request):
-    libros = Libro.objects.all()
+    libros = inventario.filtrar_inventario(request.GET)
+    pagina = Paginator(libros, inventario.POR_PAGINA).get_page(request.GET.get('page'))
     
-    # Calcular estadísticas
-    total_stock = sum(libro.stock for libro in libros)
-    valor_total = sum(libro.precioventa * libro.stock for libro in libros)
+    # Conservar filtros y orden en los enlaces de paginación
+    parametros = request.GET.copy()
+    parametros.pop('page', None)
+    parametros_orden = request.GET.copy()
+    for clave in ('page', 'orden'):
+        parametros_orden.pop(clave, None)
     
     return render(request, 'admin/libros/listado.html', {
-        'libros': libros,
-        'total_stock': total_stock,
-        'valor_total': valor_total
+        'libros': pagina,
+        'pagina': pagina,
+        'parametros': parametros.urlencode(),
+        'parametros_orden': parametros_orden.urlencode(),
+        'orden': request.GET.get('orden', 'titulo'),
+        'generos': Libro.GENEROS,
+        'editoriales': Editorial.objects.order_by('nombre').only('editorialid', 'nombre'),
+        'valuacion': inventario.valuar_inventario(),
+        'por_editorial': inventario.valuacion_por_editorial(),
+        'por_genero': inventario.valuacion_por_genero(),
+        'umbral_stock_bajo': inventario.UMBRAL_STOCK_BAJO,
     })
+
 @login_required
 @user_passes_test(es_administrador)
 def agregar_libro(request):
@@ -304,13 +442,11 @@ def agregar_libro(request):
                 genero=request.POST.get('genero'),
                 precioventa=request.POST.get('precioventa'),
                 stock=request.POST.get('stock'),
-                descripcion=request.POST.get('descripcion', '')
+                descripcion=request.POST.get('descripcion', ''),
+                # Un solo INSERT; la imagen se procesa en segundo plano (ver signals.py)
+                portada=request.FILES.get('portada')
             )
             
-            if 'portada' in request.FILES:
-                libro.portada = request.FILES['portada']
-                libro.save()
-            
             messages.success(request, 'Libro agregado correctamente')
             return redirect('admin_libros')
         except Exception as e:
@@ -320,11 +456,6 @@ def agregar_libro(request):
     autores = Autor.objects.all()
     editoriales = Editorial.objects.all()
     
-    # DEBUG: Verificar qué editoriales hay
-    print("DEBUG - Editoriales disponibles:")
-    for editorial in editoriales:
-        print(f"  ID: {editorial.editorialid}, Nombre: {editorial.nombre}")
-    
     return render(request, 'admin/libros/agregar.html', {
         'autores': autores,
         'editoriales': editoriales
@@ -379,6 +510,38 @@ def eliminar_libro(request, id):
     
     return render(request, 'admin/libros/eliminar.html', {'libro': libro})
 
+@login_required
+@user_passes_test(es_administrador)
+def importar_libros(request):
+    resultado = None
+    if request.method == 'POST':
+        archivo = request.FILES.get('archivo')
+        if not archivo:
+            messages.error(request, 'Seleccione un archivo CSV, JSON o JSON Lines')
+        else:
+            formato = request.POST.get('formato') or importacion.formato_de(archivo.name)
+            try:
+                filas = importacion.leer_filas(
+                    archivo, formato, delimitador=request.POST.get('delimitador') or ','
+                )
+                resultado = importacion.importar(filas)
+                messages.success(
+                    request,
+                    f"Importación terminada: {resultado['creados']} libros creados, "
+                    f"{resultado['actualizados']} actualizados, {resultado['con_error']} filas con error"
+                )
+            except (ValueError, UnicodeDecodeError) as e:
+                messages.error(request, f'No se pudo leer el archivo: {e}')
+            except Exception as e:
+                logger.exception("Error en importar_libros: %s", e)
+                messages.error(request, f'Error al importar libros: {str(e)}')
+    
+    return render(request, 'admin/libros/importar.html', {
+        'resultado': resultado,
+        'formatos': importacion.FORMATOS,
+        'columnas': ('isbn',) + importacion.OBLIGATORIOS_NUEVO + ('stock', 'descripcion'),
+    })
+
 # =============================================
 # CRUD VENTAS (ADMIN) - COMPLETO
 # =============================================
@@ -386,9 +549,9 @@ def eliminar_libro(request, id):
 @login_required
 @user_passes_test(es_administrador)
 def admin_ventas(request):
-    # Filtrar solo ventas con ventaid válido
-    ventas = Venta.objects.exclude(ventaid__isnull=True).order_by('-fechaventa')
-    return render(request, 'admin/ventas/listado.html', {'ventas': ventas})
+    ventas = Venta.objects.con_cliente().order_by('-fechaventa')
+    exportaciones = Tarea.objects.filter(nombre='exportacion.ventas').order_by('-tareaid')[:5]
+    return render(request, 'admin/ventas/listado.html', {'ventas': ventas, 'exportaciones': exportaciones})
 
 @login_required
 @user_passes_test(es_administrador)
@@ -398,86 +561,43 @@ def agregar_venta(request):
             # Validar campos requeridos
             cliente_id = request.POST.get('clienteid')
             metodopago = request.POST.get('metodopago')
-            montototal_str = request.POST.get('montototal', '0')
             
-            if not all([cliente_id, metodopago, montototal_str]):
+            if not all([cliente_id, metodopago]):
                 messages.error(request, 'Todos los campos marcados con * son obligatorios')
                 return redirect('agregar_venta')
             
-            # Validar que el cliente existe y no es staff
-            if not User.objects.filter(id=cliente_id, is_staff=False).exists():
-                messages.error(request, 'Cliente no válido o no encontrado')
-                return redirect('agregar_venta')
-            
-            # Convertir valores numéricos a Decimal de forma segura
+            # Convertir valores numéricos a Decimal de forma segura; el total
+            # enviado por el formulario se ignora y se recalcula en el servidor
             try:
-                montototal = Decimal(montototal_str) if montototal_str.strip() else Decimal('0.00')
-                descuentoaplicado = Decimal(request.POST.get('descuentoaplicado', '0')) if request.POST.get('descuentoaplicado', '0').strip() else Decimal('0.00')
-                pagorecibido = Decimal(request.POST.get('pagorecibido', '0')) if request.POST.get('pagorecibido', '0').strip() else Decimal('0.00')
-            except (ValueError, InvalidOperation) as e:
+                descuentoaplicado = Decimal(request.POST.get('descuentoaplicado', '0').strip() or '0.00')
+                pagorecibido = Decimal(request.POST.get('pagorecibido', '0').strip() or '0.00')
+            except InvalidOperation:
                 messages.error(request, 'Error en los valores numéricos. Use formato correcto (ej: 100.50)')
                 return redirect('agregar_venta')
             
-            # Validar montos negativos
-            if any(val < Decimal('0.00') for val in [montototal, descuentoaplicado, pagorecibido]):
-                messages.error(request, 'Los valores no pueden ser negativos')
-                return redirect('agregar_venta')
-            
-            # Validar pago en efectivo
-            if metodopago == 'EFECTIVO' and pagorecibido < montototal:
-                messages.error(request, f'Para pago en efectivo, el pago recibido (${pagorecibido}) debe ser mayor o igual al total (${montototal})')
-                return redirect('agregar_venta')
-            
-            # Crear la venta
-            venta = Venta.objects.create(
-                clienteid_id=cliente_id,
-                metodopago=metodopago,
-                montototal=montototal,
-                descuentoaplicado=descuentoaplicado,
-                pagorecibido=pagorecibido,
-                estadoventa='COMPLETADA'
+            lineas = servicios.leer_lineas(
+                request.POST.getlist('libros[]'),
+                request.POST.getlist('cantidades[]')
+            )
+            venta = servicios.registrar_venta(
+                cliente_id, metodopago, lineas,
+                descuento=descuentoaplicado,
+                pago_recibido=pagorecibido
             )
-            
-            # Procesar libros de la venta
-            libros_ids = request.POST.getlist('libros[]')
-            cantidades = request.POST.getlist('cantidades[]')
-            precios = request.POST.getlist('precios[]')
-            
-            for i, libro_id in enumerate(libros_ids):
-                if libro_id and i < len(cantidades) and i < len(precios) and libro_id != '':
-                    try:
-                        detalle = DetalleVenta.objects.create(
-                            ventaid=venta,
-                            libroid_id=libro_id,
-                            cantidad=int(cantidades[i]),
-                            preciounitario=Decimal(precios[i]),
-                            subtotal=Decimal(precios[i]) * int(cantidades[i])
-                        )
-                        
-                        # Actualizar stock del libro
-                        libro = Libro.objects.get(libroid=libro_id)
-                        libro.stock -= int(cantidades[i])
-                        libro.save()
-                        
-                    except Libro.DoesNotExist:
-                        messages.warning(request, f'El libro con ID {libro_id} no existe')
-                    except Exception as e:
-                        messages.warning(request, f'Error al procesar libro: {str(e)}')
-            
-            # Calcular y guardar el cambio
-            venta.calcular_cambio()
-            venta.save()
             
             messages.success(request, f'Venta #{venta.ventaid} agregada correctamente')
             return redirect('admin_ventas')
-            
+        
+        except servicios.ErrorVenta as e:
+            messages.error(request, str(e))
+            return redirect('agregar_venta')
         except Exception as e:
             messages.error(request, f'Error al agregar venta: {str(e)}')
-            print(f"ERROR en agregar_venta: {e}")  # Para debugging
+            logger.exception("Error en agregar_venta: %s", e)
             
             # Recargar los libros para mostrar el formulario otra vez
             clientes = User.objects.filter(is_staff=False)
-            libros = Libro.objects.filter(stock__gt=0)
+            libros = Libro.objects.disponibles()
             return render(request, 'admin/ventas/agregar.html', {
                 'clientes': clientes,
                 'libros': libros
@@ -486,12 +606,7 @@ def agregar_venta(request):
     # GET request - mostrar formulario
     try:
         clientes = User.objects.filter(is_staff=False)
-        libros = Libro.objects.filter(stock__gt=0).select_related('autorid', 'editorialid')
-        
-        # Debug: Verificar qué libros hay
-        print("DEBUG - Libros disponibles:")
-        for libro in libros:
-            print(f"  ID: {libro.libroid}, Título: {libro.titulo}, Stock: {libro.stock}, Precio: {libro.precioventa}")
+        libros = Libro.objects.disponibles().con_relaciones()
         
         if not clientes.exists():
             messages.warning(request, 'No hay clientes registrados. Debes crear clientes primero.')
@@ -521,25 +636,26 @@ def editar_venta(request, id):
             venta.metodopago = request.POST.get('metodopago')
             
             # Convertir a Decimal para evitar errores
-            montototal_str = request.POST.get('montototal', '0')
             descuento_str = request.POST.get('descuentoaplicado', '0')
             pagorecibido_str = request.POST.get('pagorecibido', '0')
             
-            venta.montototal = Decimal(montototal_str) if montototal_str else Decimal('0.00')
             venta.descuentoaplicado = Decimal(descuento_str) if descuento_str else Decimal('0.00')
             venta.pagorecibido = Decimal(pagorecibido_str) if pagorecibido_str else Decimal('0.00')
             
             venta.estadoventa = request.POST.get('estadoventa')
             
-            # Calcular cambio correctamente
-            venta.calcular_cambio()
-            venta.save()
+            # El monto total no se captura: sale de los detalles menos el descuento
+            with resumenes.actualizando([venta.ventaid]):
+                venta.fijar_totales(*servicios.totales_de_lineas([venta.ventaid]).get(
+                    venta.ventaid, servicios.SIN_LINEAS
+                ))
+                venta.save()
             
             messages.success(request, 'Venta actualizada correctamente')
             return redirect('admin_ventas')
         except Exception as e:
             messages.error(request, f'Error al actualizar venta: {str(e)}')
-            print(f"ERROR en editar_venta: {e}")  # Para debug
+            logger.exception("Error en editar_venta: %s", e)
     
     clientes = User.objects.filter(is_staff=False)
     return render(request, 'admin/ventas/editar.html', {
@@ -554,7 +670,8 @@ def eliminar_venta(request, id):
     
     if request.method == 'POST':
         try:
-            venta.delete()
+            with resumenes.actualizando([venta.ventaid]):
+                venta.delete()
             messages.success(request, 'Venta eliminada correctamente')
         except Exception as e:
             messages.error(request, f'Error al eliminar venta: {str(e)}')
@@ -565,7 +682,7 @@ def eliminar_venta(request, id):
 @login_required
 @user_passes_test(es_administrador)
 def detalle_venta_admin(request, venta_id):
-    venta = get_object_or_404(Venta, ventaid=venta_id)
+    venta = get_object_or_404(Venta.objects.con_cliente().con_detalles(), ventaid=venta_id)
     return render(request, 'admin/ventas/detalle.html', {'venta': venta})
 
 @login_required
@@ -575,19 +692,76 @@ def cancelar_venta(request, venta_id):
     
     if request.method == 'POST':
         try:
-            # Restaurar stock
-            for detalle in venta.detalles.all():
-                detalle.libroid.stock += detalle.cantidad
-                detalle.libroid.save()
-            
-            venta.estadoventa = 'CANCELADA'
-            venta.save()
-            messages.success(request, 'Venta cancelada y stock restaurado')
+            if servicios.cancelar_ventas([venta.ventaid]):
+                messages.success(request, 'Venta cancelada y stock restaurado')
+            else:
+                messages.warning(request, 'Solo se pueden cancelar ventas completadas; el stock no se modificó')
         except Exception as e:
             messages.error(request, f'Error al cancelar venta: {str(e)}')
     
     return redirect('admin_ventas')
 
+@login_required
+@user_passes_test(es_administrador)
+def cancelar_ventas_lote(request):
+    if request.method == 'POST':
+        ids = [int(v) for v in request.POST.getlist('ventas[]') if v.isdigit()]
+        try:
+            canceladas = servicios.cancelar_ventas(ids)
+            if canceladas:
+                messages.success(request, f'{len(canceladas)} venta(s) cancelada(s) y stock restaurado')
+            omitidas = len(set(ids)) - len(canceladas)
+            if omitidas:
+                messages.warning(request, f'{omitidas} venta(s) no estaban completadas y se omitieron')
+        except Exception as e:
+            messages.error(request, f'Error al cancelar ventas: {str(e)}')
+    
+    return redirect('admin_ventas')
+
+@login_required
+@user_passes_test(es_administrador)
+def exportar_ventas(request):
+    # GET transmite el archivo; POST con "segundo_plano" lo genera en el worker
+    datos = request.POST if request.method == 'POST' else request.GET
+    formato = datos.get('formato', 'csv')
+    if formato not in exportacion.FORMATOS:
+        formato = 'csv'
+    try:
+        desde = parse_date(datos.get('desde', ''))
+        hasta = parse_date(datos.get('hasta', ''))
+    except ValueError:
+        desde = hasta = None
+    estado = datos.get('estado')
+    if estado not in dict(Venta.ESTADOS_VENTA):
+        estado = None
+    
+    if request.method == 'POST' and datos.get('segundo_plano'):
+        tareas.encolar(
+            'exportacion.ventas', formato,
+            desde.isoformat() if desde else None, hasta.isoformat() if hasta else None, estado
+        )
+        messages.success(request, 'Exportación en proceso; aparecerá abajo cuando esté lista')
+        return redirect('admin_ventas')
+    
+    respuesta = StreamingHttpResponse(
+        exportacion.exportar(formato, desde, hasta, estado),
+        content_type=exportacion.FORMATOS[formato][0]
+    )
+    respuesta['Content-Disposition'] = (
+        f'attachment; filename="{exportacion.nombre_archivo(formato, desde, hasta)}"'
+    )
+    return respuesta
+
+@login_required
+@user_passes_test(es_administrador)
+def descargar_exportacion(request, id):
+    tarea = get_object_or_404(Tarea, tareaid=id, nombre='exportacion.ventas', estado='COMPLETADA')
+    archivo = (tarea.resultado or {}).get('archivo')
+    almacen = exportacion.almacen()
+    if not archivo or not almacen.exists(archivo):
+        raise Http404('La exportación ya no está disponible')
+    return FileResponse(almacen.open(archivo, 'rb'), as_attachment=True, filename=archivo.split('_', 1)[1])
+
 # =============================================
 # CRUD DETALLES VENTA (ADMIN) - COMPLETO
 # =============================================
@@ -601,19 +775,30 @@ def admin_detalles_venta(request):
     except Exception as e:
         messages.error(request, f'Error al cargar detalles: {str(e)}')
         return render(request, 'admin/detalles_venta/listado.html', {'detalles': []})
+def _leer_detalle(request, detalle):
+    """Copia al detalle los campos del formulario, convertidos a su tipo."""
+    try:
+        detalle.ventaid_id = int(request.POST.get('ventaid'))
+        detalle.libroid_id = int(request.POST.get('libroid'))
+        detalle.cantidad = int(request.POST.get('cantidad'))
+        detalle.preciounitario = Decimal(request.POST.get('preciounitario'))
+        detalle.iva = Decimal(request.POST.get('iva') or '0.16')
+    except (TypeError, ValueError, InvalidOperation):
+        raise ValueError('Venta, libro, cantidad y precio son obligatorios y deben ser numéricos')
+    if detalle.cantidad <= 0 or detalle.preciounitario < 0:
+        raise ValueError('La cantidad debe ser mayor a cero y el precio no puede ser negativo')
+    return detalle
+
 @login_required
 @user_passes_test(es_administrador)
 def agregar_detalle_venta(request):
     if request.method == 'POST':
         try:
-            detalle = DetalleVenta.objects.create(
-                ventaid_id=request.POST.get('ventaid'),
-                libroid_id=request.POST.get('libroid'),
-                cantidad=request.POST.get('cantidad'),
-                preciounitario=request.POST.get('preciounitario'),
-                iva=request.POST.get('iva', 0.16)
-            )
-            # El subtotal se calcula automáticamente en save()
+            detalle = _leer_detalle(request, DetalleVenta())
+            with resumenes.actualizando([detalle.ventaid_id]):
+                # El subtotal se calcula automáticamente en save()
+                detalle.save()
+                servicios.recalcular_totales([detalle.ventaid_id])
             
             messages.success(request, 'Detalle de venta agregado correctamente')
             return redirect('admin_detalles_venta')
@@ -634,12 +819,13 @@ def editar_detalle_venta(request, id):
     
     if request.method == 'POST':
         try:
-            detalle.ventaid_id = request.POST.get('ventaid')
-            detalle.libroid_id = request.POST.get('libroid')
-            detalle.cantidad = request.POST.get('cantidad')
-            detalle.preciounitario = request.POST.get('preciounitario')
-            detalle.iva = request.POST.get('iva', 0.16)
-            detalle.save()  # Esto recalcula el subtotal automáticamente
+            venta_anterior = detalle.ventaid_id
+            _leer_detalle(request, detalle)
+            # Si el detalle pasó a otra venta, las dos cambian
+            ventas_afectadas = {venta_anterior, detalle.ventaid_id}
+            with resumenes.actualizando(ventas_afectadas):
+                detalle.save()  # Esto recalcula el subtotal automáticamente
+                servicios.recalcular_totales(ventas_afectadas)
             
             messages.success(request, 'Detalle de venta actualizado correctamente')
             return redirect('admin_detalles_venta')
@@ -661,7 +847,9 @@ def eliminar_detalle_venta(request, id):
     
     if request.method == 'POST':
         try:
-            detalle.delete()
+            with resumenes.actualizando([detalle.ventaid_id]):
+                detalle.delete()
+                servicios.recalcular_totales([detalle.ventaid_id])
             messages.success(request, 'Detalle de venta eliminado correctamente')
         except Exception as e:
             messages.error(request, f'Error al eliminar detalle: {str(e)}')
@@ -688,13 +876,10 @@ def agregar_evento(request):
                 titulo=request.POST.get('titulo'),
                 descripcion=request.POST.get('descripcion'),
                 fecha=request.POST.get('fecha'),
-                ubicacion=request.POST.get('ubicacion')
+                ubicacion=request.POST.get('ubicacion'),
+                imagen=request.FILES.get('imagen')
             )
             
-            if 'imagen' in request.FILES:
-                evento.imagen = request.FILES['imagen']
-                evento.save()
-            
             messages.success(request, 'Evento agregado correctamente')
             return redirect('admin_eventos')
         except Exception as e:
@@ -720,13 +905,10 @@ def agregar_entrada_blog(request):
             entrada = Blog.objects.create(
                 titulo=request.POST.get('titulo'),
                 contenido=request.POST.get('contenido'),
-                autor=request.user
+                autor=request.user,
+                imagen=request.FILES.get('imagen')
             )
             
-            if 'imagen' in request.FILES:
-                entrada.imagen = request.FILES['imagen']
-                entrada.save()
-            
             messages.success(request, 'Entrada de blog agregada correctamente')
             return redirect('admin_blog')
         except Exception as e:
@@ -738,8 +920,8 @@ def agregar_entrada_blog(request):
 # CARRITO Y COMPRAS (CLIENTE)
 # =============================================
 
-@login_required
-@user_passes_test(es_cliente)
+@require_POST
+@user_passes_test(puede_comprar)
 def agregar_al_carrito(request, libro_id):
     libro = get_object_or_404(Libro, libroid=libro_id)
     
@@ -747,156 +929,172 @@ def agregar_al_carrito(request, libro_id):
         messages.error(request, 'Este libro no está disponible en stock')
         return redirect('libros')
     
-    # Verificar si el libro ya está en el carrito
-    item_carrito, created = Carrito.objects.get_or_create(
-        usuario=request.user,
-        libro=libro,
-        defaults={'cantidad': 1}
-    )
-    
-    if not created:
-        # Verificar que no exceda el stock disponible
-        if item_carrito.cantidad + 1 <= libro.stock:
-            item_carrito.cantidad += 1
-            item_carrito.save()
-            messages.success(request, f'"{libro.titulo}" agregado al carrito')
-        else:
-            messages.error(request, f'No hay suficiente stock de "{libro.titulo}"')
-    else:
+    # Clientes: tabla Carrito; visitantes: cookie firmada (ver carrito.py)
+    cesta = carrito.de_request(request)
+    try:
+        carrito.agregar(cesta, libro)
         messages.success(request, f'"{libro.titulo}" agregado al carrito')
+    except (servicios.StockInsuficiente, carrito.CarritoLleno) as e:
+        messages.error(request, str(e))
     
-    return redirect('ver_carrito')
+    respuesta = redirect('ver_carrito')
+    cesta.guardar(respuesta)
+    return respuesta
 
-@login_required
-@user_passes_test(es_cliente)
+@user_passes_test(puede_comprar)
 def ver_carrito(request):
-    items_carrito = Carrito.objects.filter(usuario=request.user)
-    total_carrito = sum(item.subtotal() for item in items_carrito)
+    cesta = carrito.de_request(request)
+    # El cliente sigue en su carrito: sus reservas no deben vencer todavía
+    cesta.renovar()
+    items_carrito, resumen = cesta.items_y_resumen()
     
-    return render(request, 'carrito/ver_carrito.html', {
+    respuesta = render(request, 'carrito/ver_carrito.html', {
         'items_carrito': items_carrito,
-        'total_carrito': total_carrito
+        'total_carrito': resumen['total'],
+        # Una por formulario mostrado: reenviarlo devuelve la misma venta
+        'clave_idempotencia': uuid.uuid4().hex,
+        # El contador del menú usa el resumen recién calculado
+        'carrito_resumen': resumen,
     })
+    cesta.guardar(respuesta)
+    return respuesta
 
-@login_required
-@user_passes_test(es_cliente)
-def actualizar_carrito(request, item_id):
-    item = get_object_or_404(Carrito, carritoid=item_id, usuario=request.user)
+@user_passes_test(puede_comprar)
+def actualizar_carrito(request, libro_id):
+    cesta = carrito.de_request(request)
+    if not cesta.cantidad(libro_id):
+        raise Http404('El libro no está en el carrito')
+    libro = get_object_or_404(Libro, libroid=libro_id)
     
     if request.method == 'POST':
-        nueva_cantidad = int(request.POST.get('cantidad', 1))
-        
-        if nueva_cantidad > 0 and nueva_cantidad <= item.libro.stock:
-            item.cantidad = nueva_cantidad
-            item.save()
-            messages.success(request, 'Carrito actualizado')
-        elif nueva_cantidad > item.libro.stock:
-            messages.error(request, f'No hay suficiente stock. Disponible: {item.libro.stock}')
-        else:
-            item.delete()
-            messages.success(request, 'Producto eliminado del carrito')
+        try:
+            cantidad = carrito.fijar(cesta, libro, int(request.POST.get('cantidad', 1)))
+            messages.success(request, 'Carrito actualizado' if cantidad else 'Producto eliminado del carrito')
+        except ValueError:
+            messages.error(request, 'Cantidad inválida')
+        except servicios.StockInsuficiente as e:
+            messages.error(request, str(e))
     
-    return redirect('ver_carrito')
+    respuesta = redirect('ver_carrito')
+    cesta.guardar(respuesta)
+    return respuesta
 
-@login_required
-@user_passes_test(es_cliente)
-def eliminar_del_carrito(request, item_id):
-    item = get_object_or_404(Carrito, carritoid=item_id, usuario=request.user)
-    libro_titulo = item.libro.titulo
-    item.delete()
+@require_POST
+@user_passes_test(puede_comprar)
+def eliminar_del_carrito(request, libro_id):
+    cesta = carrito.de_request(request)
+    if not cesta.quitar(libro_id):
+        raise Http404('El libro no está en el carrito')
+    libro_titulo = Libro.objects.filter(libroid=libro_id).values_list('titulo', flat=True).first()
     messages.success(request, f'"{libro_titulo}" eliminado del carrito')
-    return redirect('ver_carrito')
+    respuesta = redirect('ver_carrito')
+    cesta.guardar(respuesta)
+    return respuesta
+
+# =============================================
+# API DEL CARRITO (JSON)
+# =============================================
+# Las plantillas la usan con fetch: cada cambio es una sola petición que
+# devuelve el renglón afectado y los totales, sin recargar la página.
+
+def _respuesta_carrito(cesta, libro_id=None, status=200, error=None):
+    datos = carrito.a_json(cesta.resumen(), libro_id)
+    if error:
+        datos['error'] = error
+    respuesta = JsonResponse(datos, status=status)
+    cesta.guardar(respuesta)
+    return respuesta
+
+def _cantidad_json(request):
+    try:
+        return int(request.POST.get('cantidad', 1))
+    except ValueError:
+        return None
+
+@require_GET
+@user_passes_test(puede_comprar)
+def carrito_api(request):
+    return _respuesta_carrito(carrito.de_request(request))
+
+@require_POST
+@user_passes_test(puede_comprar)
+def carrito_api_agregar(request, libro_id):
+    libro = get_object_or_404(Libro, libroid=libro_id)
+    cesta = carrito.de_request(request)
+    cantidad = _cantidad_json(request)
+    if cantidad is None or cantidad < 1:
+        return _respuesta_carrito(cesta, libro_id, 400, 'Cantidad inválida')
+    try:
+        carrito.agregar(cesta, libro, cantidad)
+    except (servicios.StockInsuficiente, carrito.CarritoLleno) as e:
+        return _respuesta_carrito(cesta, libro_id, 409, str(e))
+    return _respuesta_carrito(cesta, libro_id)
+
+@require_POST
+@user_passes_test(puede_comprar)
+def carrito_api_linea(request, libro_id):
+    libro = get_object_or_404(Libro, libroid=libro_id)
+    cesta = carrito.de_request(request)
+    cantidad = _cantidad_json(request)
+    if cantidad is None or cantidad < 0:
+        return _respuesta_carrito(cesta, libro_id, 400, 'Cantidad inválida')
+    try:
+        carrito.fijar(cesta, libro, cantidad)
+    except (servicios.StockInsuficiente, carrito.CarritoLleno) as e:
+        return _respuesta_carrito(cesta, libro_id, 409, str(e))
+    return _respuesta_carrito(cesta, libro_id)
+
+@require_POST
+@user_passes_test(puede_comprar)
+def carrito_api_eliminar(request, libro_id):
+    cesta = carrito.de_request(request)
+    cesta.quitar(libro_id)
+    return _respuesta_carrito(cesta, libro_id)
+
+def _clave_idempotencia(request):
+    # Solo se aceptan claves con el formato que genera ver_carrito
+    clave = request.POST.get('clave_idempotencia', '')
+    return clave if re.fullmatch(r'[0-9a-f]{32}', clave) else None
 
 @login_required
 @user_passes_test(es_cliente)
 def procesar_compra(request):
     if request.method == 'POST':
+        metodo_pago = request.POST.get('metodo_pago')
+        
+        # Manejar pago_recibido de forma segura
+        pago_recibido_str = request.POST.get('pago_recibido', '0').strip()
         try:
-            items_carrito = Carrito.objects.filter(usuario=request.user)
-            
-            if not items_carrito:
-                messages.error(request, 'Tu carrito está vacío')
-                return redirect('ver_carrito')
-            
-            # Verificar stock disponible
-            for item in items_carrito:
-                if item.cantidad > item.libro.stock:
-                    messages.error(request, f'No hay suficiente stock de "{item.libro.titulo}". Disponible: {item.libro.stock}')
-                    return redirect('ver_carrito')
-            
-            # Obtener datos del formulario
-            metodo_pago = request.POST.get('metodo_pago')
-            if not metodo_pago:
-                messages.error(request, 'Debes seleccionar un método de pago')
-                return redirect('ver_carrito')
-            
-            # Manejar pago_recibido de forma segura
-            pago_recibido_str = request.POST.get('pago_recibido', '0').strip()
-            try:
-                pago_recibido = Decimal(pago_recibido_str) if pago_recibido_str else Decimal('0.00')
-            except:
-                pago_recibido = Decimal('0.00')
-            
-            # Calcular total del carrito
-            total_venta = Decimal('0.00')
-            for item in items_carrito:
-                total_venta += Decimal(str(item.libro.precioventa)) * item.cantidad
-            
-            # Validar pago en efectivo
-            if metodo_pago == 'EFECTIVO':
-                if pago_recibido <= Decimal('0.00'):
-                    messages.error(request, 'Para pago en efectivo, debes ingresar la cantidad recibida')
-                    return redirect('ver_carrito')
-                if pago_recibido < total_venta:
-                    messages.error(request, f'Pago insuficiente. Total: ${total_venta:.2f}, Recibido: ${pago_recibido:.2f}')
-                    return redirect('ver_carrito')
-            
-            # Crear venta
-            venta = Venta.objects.create(
-                clienteid=request.user,
-                metodopago=metodo_pago,
-                pagorecibido=pago_recibido,
-                montototal=total_venta,
-                estadoventa='COMPLETADA'
+            pago_recibido = Decimal(pago_recibido_str) if pago_recibido_str else Decimal('0.00')
+        except InvalidOperation:
+            pago_recibido = Decimal('0.00')
+        
+        try:
+            venta = servicios.procesar_compra(
+                request.user, metodo_pago, pago_recibido, _clave_idempotencia(request)
             )
-            
-            # Crear detalles de venta y actualizar stock
-            for item in items_carrito:
-                subtotal = Decimal(str(item.libro.precioventa)) * item.cantidad
-                
-                DetalleVenta.objects.create(
-                    ventaid=venta,
-                    libroid=item.libro,
-                    cantidad=item.cantidad,
-                    preciounitario=item.libro.precioventa,
-                    subtotal=subtotal
-                )
-                
-                # Actualizar stock
-                item.libro.stock -= item.cantidad
-                item.libro.save()
-            
-            # Calcular y guardar cambio
-            venta.calcular_cambio()
-            venta.save()
-            
-            # Limpiar carrito
-            items_carrito.delete()
-            
-            messages.success(request, f'¡Compra realizada exitosamente! Total: ${total_venta:.2f}')
-            return redirect('detalle_venta', venta_id=venta.ventaid)
-            
+            carrito.invalidar(request.user)
+        except servicios.ErrorVenta as e:
+            messages.error(request, str(e))
+            return redirect('ver_carrito')
         except Exception as e:
             messages.error(request, f'Error al procesar la compra: {str(e)}')
-            print(f"ERROR en procesar_compra: {e}")  # Debug
+            logger.exception("Error en procesar_compra: %s", e)
             return redirect('ver_carrito')
+        
+        if venta.repetida:
+            # Doble clic o reintento: la compra original ya se mostró
+            messages.info(request, 'Esta compra ya se había procesado')
+        else:
+            messages.success(request, f'¡Compra realizada exitosamente! Total: ${venta.montototal:.2f}')
+        return redirect('detalle_venta', venta_id=venta.ventaid)
     
     return redirect('ver_carrito')
 
 @login_required
 @user_passes_test(es_cliente)
 def detalle_venta(request, venta_id):
-    venta = get_object_or_404(Venta, ventaid=venta_id, clienteid=request.user)
+    venta = get_object_or_404(Venta.objects.de_cliente(request.user).con_detalles(), ventaid=venta_id)
     return render(request, 'carrito/detalle_venta.html', {'venta': venta})
 
 # =============================================
@@ -939,6 +1137,6 @@ def perfil_usuario(request):
 @user_passes_test(es_cliente)
 def mis_compras(request):
     """Vista para que los clientes vean su historial de compras"""
-    ventas = Venta.objects.filter(clienteid=request.user).order_by('-fechaventa')
+    ventas = Venta.objects.de_cliente(request.user)
     return render(request, 'carrito/mis_compras.html', {'ventas': ventas})
 
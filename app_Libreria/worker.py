@@ -0,0 +1,24 @@
+# app_Libreria/worker.py
+"""
+Funciones que ejecutan los procesos del pool de procesar_tareas.
+
+Los procesos arrancan con 'spawn' y cargan este módulo antes de configurar
+Django, así que aquí no se importan modelos ni nada que los use al nivel
+del módulo.
+"""
+
+
+def inicializar():
+    import django
+    django.setup()
+
+
+def ejecutar(tareaid):
+    from django.db import connections
+
+    from . import tareas
+
+    try:
+        return tareas.ejecutar(tareaid)
+    finally:
+        connections.close_all()
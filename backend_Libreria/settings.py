@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app_Libreria.metricas.MetricasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,7 +56,8 @@ ROOT_URLCONF = 'backend_Libreria.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates que además mide el tiempo de renderizado por petición
+        'BACKEND': 'app_Libreria.metricas.DjangoTemplatesMedidos',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -62,6 +65,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'app_Libreria.context_processors.carrito_resumen',
             ],
         },
     },
@@ -77,9 +81,24 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Conexiones persistentes: los PRAGMA de app_Libreria/basedatos.py se
+        # aplican una vez por conexión y no en cada petición
+        'CONN_MAX_AGE': int(os.environ.get('LIBRERIA_DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Las transacciones toman el bloqueo de escritura al empezar: dos
+            # compras simultáneas esperan su turno (busy_timeout) en lugar de
+            # fallar con "database is locked" al pasar de leer a escribir
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 5,
+        },
     }
 }
 
+# PRAGMA de SQLite que cambian los valores de app_Libreria/basedatos.py;
+# None desactiva uno. Ej.: {'mmap_size': 0, 'cache_size': -16000}
+LIBRERIA_SQLITE_PRAGMAS = {}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -120,13 +139,66 @@ STATIC_URL = 'static/'
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
-import os
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media') 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
+
+# Caché compartida entre el servidor web y el worker de tareas (procesar_tareas):
+# con la caché en memoria por defecto cada proceso tendría la suya
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('LIBRERIA_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+    }
+}
+
+# Segundos que se guardan en caché los indicadores del panel de administración
+LIBRERIA_ESTADISTICAS_TTL = 60
+
+# Segundos que se guarda el resumen del carrito de cada cliente (ver carrito.py)
+LIBRERIA_CARRITO_TTL = 300
+
+# Minutos que se aparta el stock de lo que un cliente agrega al carrito (ver reservas.py)
+LIBRERIA_RESERVA_MINUTOS = 15
+
+# Exportaciones generadas en segundo plano; fuera de MEDIA_ROOT porque no son públicas
+LIBRERIA_EXPORTACIONES_DIR = os.path.join(BASE_DIR, 'exportaciones')
+
+# Días que se conservan las tareas completadas antes de purgarlas
+LIBRERIA_TAREAS_RETENCION_DIAS = 7
+
+# Peticiones que superen estos límites se registran como WARNING con la
+# consulta más repetida (ver app_Libreria/metricas.py)
+LIBRERIA_METRICAS_UMBRAL_CONSULTAS = 50
+LIBRERIA_METRICAS_UMBRAL_MS = 500
+
+# Nivel de log de la aplicación: LIBRERIA_LOG_LEVEL=DEBUG|INFO|WARNING|ERROR
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '{asctime} {levelname} {name}: {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'app_Libreria': {
+            'handlers': ['console'],
+            'level': os.environ.get('LIBRERIA_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
 # settings.py
 CSRF_TRUSTED_ORIGINS = [
     'http://127.0.0.1:1194',